@@ -85,6 +85,21 @@ class Settings(BaseSettings):
     REPLICATION_FACTOR: int = 3  # Nombre de copies par fichier
     MIN_NODES_REQUIRED: int = 2
 
+    # Découpage CDC (FastCDC) pour la déduplication intra/inter fichiers
+    CDC_MIN_SIZE: int = 256 * 1024
+    CDC_AVG_SIZE: int = 1024 * 1024
+    CDC_MAX_SIZE: int = 4 * 1024 * 1024
+
+    # Upload en flux : morceaux reçus en attente d'écriture (borne la mémoire par upload)
+    UPLOAD_PIPELINE_DEPTH: int = 8
+    # Upload reprenable : taille des parties (unité de reprise) et durée de vie d'une session
+    UPLOAD_PART_SIZE: int = 8 * 1024 * 1024
+    UPLOAD_SESSION_TTL: int = 24 * 3600
+
+    # Classe de stockage par défaut : "replicated" (REPLICATION_FACTOR copies)
+    # ou "ec:K+M" (Reed-Solomon, K shards de données + M de parité, ex: "ec:6+3" = 1.5x)
+    DEFAULT_STORAGE_CLASS: str = "replicated"
+
     # --- UTILISATEUR INITIAL ---
     FIRST_SUPERUSER: EmailStr
     FIRST_SUPERUSER_PASSWORD: str
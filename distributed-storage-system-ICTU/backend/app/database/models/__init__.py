@@ -3,6 +3,7 @@ from .user import User
 from .folder import Folder
 from .file import File
 from .file_version import FileVersion
+from .block import Block, BlockShard, BlockReplica, BlockOwner
 from .share import Share
 from .billing import Subscription, Transaction
 from .node_stats import NodeStats
@@ -0,0 +1,60 @@
+from sqlalchemy import Column, String, Integer, BigInteger, DateTime, ForeignKey
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from app.database.base import Base
+
+class Block(Base):
+    __tablename__ = "blocks"
+
+    # Hash SHA-256 du chunk (cf. File.chunk_manifest)
+    hash = Column(String, primary_key=True)
+    size = Column(BigInteger, nullable=False)
+
+    # Nombre de références (fichiers, copies, versions). 0 = candidat au GC
+    refcount = Column(Integer, nullable=False, default=0)
+
+    # "replicated" (copies complètes) ou "ec:K+M" (Reed-Solomon, shards dans block_shards)
+    storage_class = Column(String, nullable=False, default="replicated", server_default="replicated")
+
+    shards = relationship("BlockShard", order_by="BlockShard.shard_index", cascade="all, delete-orphan")
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+class BlockShard(Base):
+    """Shard d'un bloc erasure-codé : stocké comme un bloc ordinaire sur un node"""
+    __tablename__ = "block_shards"
+
+    block_hash = Column(String, ForeignKey("blocks.hash", ondelete="CASCADE"), primary_key=True)
+    shard_index = Column(Integer, primary_key=True)   # 0..k-1 données, k..k+m-1 parité
+    shard_hash = Column(String, nullable=False)       # SHA-256 du shard (nom du bloc sur le node)
+    node_id = Column(String, nullable=False, index=True)
+    size = Column(BigInteger, nullable=False)
+
+class BlockReplica(Base):
+    """
+    Copie complète d'un bloc "replicated" sur un node.
+    Pas de clé étrangère vers blocks : les chunks sont posés sur les nodes
+    pendant l'upload, avant que le fichier (et la ligne blocks) n'existe.
+    """
+    __tablename__ = "block_replicas"
+
+    block_hash = Column(String, primary_key=True)
+    node_id = Column(String, primary_key=True, index=True)
+    size = Column(BigInteger, nullable=True)   # Taille en clair, vérifiée à l'écriture (hash)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class BlockOwner(Base):
+    """
+    Utilisateurs qui ont fourni le contenu d'un bloc (upload) ou le possèdent
+    déjà (un de leurs fichiers le référence). La négociation de déduplication
+    ne répond que sur ces blocs : révéler qu'un hash existe chez un autre
+    utilisateur permettrait de confirmer le contenu de ses fichiers.
+    """
+    __tablename__ = "block_owners"
+
+    block_hash = Column(String, primary_key=True)
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True, index=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -16,8 +16,10 @@ class File(Base):
     
     # --- LOCALISATION PHYSIQUE ---
     content_hash = Column(String, index=True) # SHA-256 pour déduplication
+    chunk_manifest = Column(JSONB, nullable=True) # Chunks CDC ordonnés : [{"hash", "size"}]
     node_id = Column(String, index=True) # ID du container Docker/K8s
     path_on_disk = Column(String) # Chemin interne sur le node
+    storage_class = Column(String, nullable=True) # "replicated" / "ec:6+3", None = hérité du dossier
     
     # --- SÉCURITÉ ---
     is_encrypted = Column(Boolean, default=True)
@@ -1,5 +1,6 @@
 import uuid
 from sqlalchemy import Column, String, Integer, ForeignKey, BigInteger, DateTime
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database.base import Base
@@ -14,6 +15,7 @@ class FileVersion(Base):
     version_number = Column(Integer, nullable=False)
     size = Column(BigInteger, nullable=False)
     content_hash = Column(String) # Le hash de CETTE version
+    chunk_manifest = Column(JSONB, nullable=True) # Chunks CDC de cette version
     path_on_disk = Column(String) # Où est stockée l'archive de cette version
     
     # --- MÉTA ---
@@ -17,6 +17,7 @@ class Folder(Base):
     # --- ÉTAT ---
     is_trashed = Column(Boolean, default=False)
     color = Column(String, default="#A0AEC0") # Pour l'UI
+    storage_class = Column(String, nullable=True) # Classe de stockage du contenu, None = héritée du parent
     
     # --- RELATIONS ---
     owner = relationship("User", back_populates="folders")
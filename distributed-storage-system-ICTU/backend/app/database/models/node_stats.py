@@ -7,6 +7,8 @@ class NodeStats(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     node_id = Column(String, index=True, nullable=False)
+    # Dernier statut annoncé au HealthCheck : SERVING, FULL, MAINTENANCE (ou OFFLINE si injoignable)
+    status = Column(String, nullable=False, default="SERVING", server_default="SERVING")
     
     # --- RESSOURCES ---
     cpu_usage = Column(Float) # %
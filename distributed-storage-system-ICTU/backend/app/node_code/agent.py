@@ -1,12 +1,23 @@
+import time
 import asyncio
 import grpc
 import logging
 import signal
 from concurrent import futures
+from itertools import groupby
 
 # Import des définitions Protobuf (générées)
-from app.protos import node_pb2, node_pb2_grpc
-from .dedup import DedupEngine
+from app.protos import node_pb2, node_pb2_grpc, admin_control_pb2, admin_control_pb2_grpc
+from .dedup import DedupEngine, STORAGE_ROOT, TEMP_DIR, SCRUB_DIR, QUARANTINE_DIR
+from .block_index import BloomFilter
+from .garbage_collector import GarbageCollector, GC_GRACE_SECONDS
+from .worker_pools import cpu_pool, io_pool
+from .telemetry import TelemetrySampler, rpc_tracker
+from .scrubber import Scrubber, SCRUB_ENABLED, sorted_hashes
+from .replication import Replicator
+from .maintenance import MaintenanceMode
+from .tiering import TierMover
+from .io_scheduler import io_class, request_class, INTERACTIVE_READ, INTERACTIVE_WRITE, REPLICATION, MAINTENANCE
 
 # Configuration
 PORT = 50051
@@ -16,75 +27,268 @@ logging.basicConfig(
 )
 logger = logging.getLogger("NodeAgent")
 
+async def _maintenance(coro):
+    """Tâche de fond : ses I/O passent après le trafic client (classe QoS maintenance)"""
+    io_class.set(MAINTENANCE)
+    return await coro
+
 class NodeService(node_pb2_grpc.StorageNodeServicer):
     """
     Implémentation du service gRPC défini dans node.proto.
     """
     def __init__(self):
         self.engine = DedupEngine()
+        self.scrubber = Scrubber(self.engine, SCRUB_DIR, QUARANTINE_DIR)
+        self.replicator = Replicator(self.engine)
+        self.maintenance = MaintenanceMode(STORAGE_ROOT)
+        self.telemetry = TelemetrySampler(STORAGE_ROOT)
+        self._health = self._build_health(self.telemetry.snapshot)
+        self._background_tasks = []
+
+    def start_background_tasks(self):
+        """Lance les tâches de fond du node (appelé une fois l'event loop démarrée)"""
+        loop = asyncio.get_running_loop()
+        self._background_tasks.append(loop.create_task(self.telemetry.run(self._on_sample)))
+        self._background_tasks.append(loop.create_task(self._recover()))
+
+    async def _recover(self):
+        """
+        Fin du démarrage : scan de reconstruction si l'index des blocs manquait.
+        Le serveur répond déjà (statut STARTING) ; les tâches qui parcourent
+        l'index (scrubber, tiering) ne démarrent qu'une fois celui-ci complet.
+        """
+        try:
+            await self.engine.store.recover()
+        except Exception as e:
+            logger.critical(f"🚨 Block index recovery failed: {e}")
+            raise
+        self._on_sample(self.telemetry.snapshot)
+        startup = self.engine.startup_stats()
+        logger.info(f"✅ Node ready: {self.engine.stats()['blocks']} blocks, index from {startup['source']} in {startup['duration_ms']} ms")
+
+        loop = asyncio.get_running_loop()
+        if SCRUB_ENABLED:
+            self._background_tasks.append(loop.create_task(_maintenance(self.scrubber.run())))
+        if hasattr(self.engine.store, "compaction_loop"):
+            self._background_tasks.append(loop.create_task(_maintenance(self.engine.store.compaction_loop())))
+        if len(getattr(self.engine.store, "tiers", ())) > 1:
+            self._background_tasks.append(loop.create_task(_maintenance(TierMover(self.engine.store).run())))
+
+    def _build_health(self, snapshot: dict) -> node_pb2.HealthResponse:
+        # Compteurs issus de l'index en mémoire : aucun parcours du disque
+        stats = self.engine.stats()
+        return node_pb2.HealthResponse(
+            status=self.maintenance.status(snapshot["disk_free"], ready=self.engine.store.recovery.ready),
+            disk_used=stats["bytes"],
+            block_count=stats["blocks"],
+            pools=[node_pb2.PoolStats(**pool.stats()) for pool in (cpu_pool, io_pool)],
+            compression=node_pb2.CompressionStats(**self.engine.compression_stats()),
+            cache=node_pb2.BlockCacheStats(**self.engine.cache.stats()),
+            io_classes=[node_pb2.IoClassStats(**stats) for stats in io_pool.scheduler.stats()] if io_pool.scheduler else [],
+            startup=node_pb2.StartupStats(**self.engine.startup_stats()),
+            tiers=[node_pb2.TierStats(**tier) for tier in self.engine.tier_stats()],
+            corrupt_blocks=len(self.scrubber.corrupt),
+            **snapshot
+        )
+
+    def _on_sample(self, snapshot: dict):
+        self._health = self._build_health(snapshot)
+
+    def set_maintenance(self, enable: bool, reason: str = "") -> str:
+        """Active / désactive la lecture seule ; le HealthCheck reflète le changement aussitôt"""
+        self.maintenance.set(enable, reason)
+        self._on_sample(self.telemetry.snapshot)
+        return self._health.status
 
     async def HealthCheck(self, request, context):
-        """Ping simple pour le Load Balancer"""
-        return node_pb2.HealthResponse(status="SERVING", disk_free=1024*1024*1024) # TODO: Vrai check disk
+        """
+        Ping pour le Load Balancer et le HealthChecker.
+        Renvoie la réponse pré-construite au dernier échantillon : O(1).
+        """
+        return self._health
 
     async def UploadBlock(self, request_iterator, context):
         """
-        Reçoit un stream de chunks, les assemble et écrit le bloc.
-        C'est ici que la magie du streaming opère.
+        Reçoit un stream de chunks et les écrit au fil de l'eau.
+        Aucun buffer du bloc complet : hash + chiffrement + écriture par chunk.
         """
-        data_buffer = bytearray()
-        
-        # Lecture du stream entrant
-        async for chunk in request_iterator:
-            data_buffer.extend(chunk.data)
+        if self.maintenance.enabled:
+            await context.abort(grpc.StatusCode.FAILED_PRECONDITION, "Node in maintenance mode (read-only)")
 
-        # Écriture via le moteur de déduplication
-        try:
-            content_hash, is_new, size = await self.engine.write_block(bytes(data_buffer))
-            
-            return node_pb2.UploadResponse(
-                success=True,
-                hash=content_hash,
-                bytes_written=size,
-                is_duplicate=not is_new
-            )
-        except Exception as e:
-            logger.error(f"Upload failed: {e}")
-            return node_pb2.UploadResponse(success=False, error_message=str(e))
+        io_class.set(request_class(context, INTERACTIVE_WRITE))
+        writer = self.engine.open_writer()
+        expected_hash = None
+
+        with rpc_tracker.track("UploadBlock"):
+            try:
+                # Lecture du stream entrant
+                async for chunk in request_iterator:
+                    if chunk.block_hash:
+                        expected_hash = chunk.block_hash
+                    await writer.write(chunk.data)
+
+                # Finalisation (fsync + dédup + renommage atomique)
+                content_hash, is_new, size = await writer.commit(expected_hash)
+
+                return node_pb2.UploadResponse(
+                    success=True,
+                    hash=content_hash,
+                    bytes_written=size,
+                    is_duplicate=not is_new
+                )
+            except Exception as e:
+                await writer.abort()
+                logger.error(f"Upload failed: {e}")
+                return node_pb2.UploadResponse(success=False, error_message=str(e))
 
     async def DownloadBlock(self, request, context):
         """
-        Lit un bloc et le stream vers le client.
+        Lit un bloc (ou la plage offset/length) et le stream vers le client.
         """
-        try:
-            data = await self.engine.read_block(request.hash)
-            
-            # Découpage en chunks pour le réseau (Max 4MB pour gRPC)
-            CHUNK_SIZE = 1024 * 1024 * 2 # 2MB
-            for i in range(0, len(data), CHUNK_SIZE):
-                chunk = data[i : i + CHUNK_SIZE]
-                yield node_pb2.FileChunk(data=chunk)
-                
-        except FileNotFoundError:
-            await context.abort(grpc.StatusCode.NOT_FOUND, "Block not found")
-        except Exception as e:
-            logger.error(f"Download Error: {e}")
-            await context.abort(grpc.StatusCode.INTERNAL, str(e))
+        if request.offset < 0 or request.length < 0:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, "Invalid range")
+
+        length = request.length if request.length > 0 else -1
+        io_class.set(request_class(context, INTERACTIVE_READ))
+        with rpc_tracker.track("DownloadBlock"):
+            try:
+                # Déchiffrement segment par segment : le premier chunk part dès que
+                # le premier segment est authentifié (taille < 4MB max gRPC).
+                # Seuls les segments couvrant la plage sont lus sur le disque.
+                async for chunk in self.engine.stream_block(request.hash, request.offset, length):
+                    yield node_pb2.FileChunk(data=chunk)
+
+            except FileNotFoundError:
+                await context.abort(grpc.StatusCode.NOT_FOUND, "Block not found")
+            except Exception as e:
+                logger.error(f"Download Error: {e}")
+                await context.abort(grpc.StatusCode.INTERNAL, str(e))
+
+    async def HasBlocks(self, request_iterator, context):
+        """
+        Répond à chaque lot de hash par un bitmap de présence.
+        Aucun accès disque : tout est résolu par l'index (et son filtre de Bloom),
+        sauf pour les lots "touch" (rajeunissement dans le pool I/O).
+        """
+        with rpc_tracker.track("HasBlocks"):
+            async for batch in request_iterator:
+                if batch.touch:
+                    # Rajeunis AVANT la réponse : un bloc annoncé présent ne peut plus être
+                    # retiré par un GC en cours (vérif d'âge + suppression sans await)
+                    await self.engine.touch_blocks(list(batch.hashes))
+                found = self.engine.has_blocks(batch.hashes)
+                bitmap = bytearray((len(found) + 7) // 8)
+                for i, present in enumerate(found):
+                    if present:
+                        bitmap[i >> 3] |= 1 << (i & 7)
+                yield node_pb2.BlockBitmap(bitmap=bytes(bitmap), count=len(found))
+
+    async def ReplicateTo(self, request, context):
+        """
+        Copie des blocs vers un autre node (réparation, re-réplication).
+        Ce node stream lui-même vers l'UploadBlock de la cible : l'orchestrateur
+        ne fait que commander et relever les résultats.
+        """
+        if not request.target:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, "Missing target")
+
+        io_class.set(request_class(context, REPLICATION))
+        with rpc_tracker.track("ReplicateTo"):
+            async for result in self.replicator.replicate(request.target, list(request.hashes)):
+                yield result
+
+class AdminService(admin_control_pb2_grpc.AdminControlServicer):
+    """
+    Implémentation du service gRPC défini dans admin_control.proto.
+    """
+    def __init__(self, node: NodeService):
+        self.node = node
+        self.gc = GarbageCollector(node.engine.store, TEMP_DIR, on_delete=node.engine.cache.invalidate)
+
+    async def TriggerGC(self, request_iterator, context):
+        """
+        Reçoit le filtre des blocs vivants puis lance le sweep.
+        Un filtre incomplet ferait supprimer des blocs vivants : on refuse.
+        """
+        if self.gc.running:
+            await context.abort(grpc.StatusCode.ABORTED, "GC already running")
+        if not self.node.engine.store.recovery.ready:
+            await context.abort(grpc.StatusCode.UNAVAILABLE, "Block index still being rebuilt")
+        if self.node.maintenance.enabled:
+            await context.abort(grpc.StatusCode.FAILED_PRECONDITION, "Node in maintenance mode (read-only)")
+
+        params = None
+        bits = bytearray()
+        async for request in request_iterator:
+            if params is None:
+                params = request
+            bits += request.filter_chunk
+
+        if params is None or params.filter_bits == 0 or params.filter_k == 0:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, "Missing live-block filter")
+        if len(bits) * 8 != params.filter_bits:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, "Truncated live-block filter")
+
+        live = BloomFilter(0, bits=bits, k=params.filter_k, seed=params.filter_seed)
+        io_class.set(MAINTENANCE)
+        report = await self.gc.collect(
+            live,
+            grace_seconds=params.grace_seconds or GC_GRACE_SECONDS,
+            aggressive=params.aggressive
+        )
+        return admin_control_pb2.GCResponse(
+            freed_bytes=report.freed_bytes,
+            blocks_scanned=report.blocks_scanned,
+            blocks_deleted=report.blocks_deleted,
+            temp_files_removed=report.temp_files_removed
+        )
+
+    async def SetMaintenanceMode(self, request, context):
+        """Lecture seule (drain, remplacement de disque...) : les lectures restent servies"""
+        status = self.node.set_maintenance(request.enable, request.reason)
+        return admin_control_pb2.MaintenanceResponse(success=True, status=status)
+
+    async def ListBlocks(self, request, context):
+        """Tous les hash du node après `after`, par ordre croissant, un lot par shard"""
+        if not self.node.engine.store.recovery.ready:
+            await context.abort(grpc.StatusCode.UNAVAILABLE, "Block index still being rebuilt")
+        # Un seul parcours trié de l'index, hors de la boucle, puis un lot par shard
+        hashes = await asyncio.to_thread(sorted_hashes, self.node.engine.store, request.after)
+        for _, shard in groupby(hashes, key=lambda h: h[:2]):
+            yield admin_control_pb2.BlockList(hashes=list(shard))
+            await asyncio.sleep(0)
+
+    async def GetScrubReport(self, request, context):
+        """Signalements du scrubber ; acquitte d'abord ceux déjà pris en charge"""
+        scrubber = self.node.scrubber
+        await scrubber.acknowledge(request.acknowledge)
+        report = scrubber.report()
+        return admin_control_pb2.ScrubReport(
+            corrupt=[admin_control_pb2.CorruptBlock(**entry) for entry in report.pop("corrupt")],
+            **report
+        )
 
 async def serve():
     """Démarre le serveur gRPC"""
+    started = time.monotonic()
     server = grpc.aio.server(futures.ThreadPoolExecutor(max_workers=10))
-    node_pb2_grpc.add_StorageNodeServicer_to_server(NodeService(), server)
+    service = NodeService()
+    node_pb2_grpc.add_StorageNodeServicer_to_server(service, server)
+    admin_control_pb2_grpc.add_AdminControlServicer_to_server(AdminService(service), server)
     
     server.add_insecure_port(f'[::]:{PORT}')
     logger.info(f"🚀 Node Agent starting on port {PORT}...")
     
     await server.start()
+    logger.info(f"🚀 Node Agent serving after {time.monotonic() - started:.2f} s ({service.engine.startup_stats()['phase']})")
+    service.start_background_tasks()
     
     # Gestion de l'arrêt gracieux (SIGTERM pour Kubernetes)
     async def shutdown():
         logger.info("Stopping Node Agent...")
         await server.stop(5)
+        if hasattr(service.engine.store, "close"):
+            service.engine.store.close()
 
     loop = asyncio.get_running_loop()
     loop.add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(shutdown()))
@@ -0,0 +1,160 @@
+import os
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict
+
+# --- CONFIGURATION DU CACHE ---
+CACHE_MB = int(os.getenv("NODE_CACHE_MB", 256))                        # Budget mémoire (0 = désactivé)
+CACHE_MAX_BLOCK_MB = int(os.getenv("NODE_CACHE_MAX_BLOCK_MB", 8))      # Blocs plus gros : jamais mis en cache
+SKETCH_DEPTH = 4
+SKETCH_MAX_COUNT = 15                                                  # Compteurs 4 bits (comme TinyLFU)
+_HALVE = bytes(count >> 1 for count in range(256))
+
+logger = logging.getLogger("node.cache")
+
+class FrequencySketch:
+    """
+    Count-Min Sketch des accès récents (TinyLFU) : estime combien de fois un
+    hash a été lu, en mémoire constante. Tous les compteurs sont divisés par
+    deux toutes les `sample_size` lectures, pour oublier la popularité passée.
+    """
+    def __init__(self, width: int):
+        self.width = 1 << max(width - 1, 1023).bit_length()   # Puissance de 2, au moins 1024
+        self.mask = self.width - 1
+        self.rows = [bytearray(self.width) for _ in range(SKETCH_DEPTH)]
+        self.sample_size = 10 * self.width
+        self.additions = 0
+
+    def _indexes(self, content_hash: str):
+        # Le hash de contenu est déjà uniforme : 4 tranches de 32 bits servent de fonctions de hachage
+        for row in range(SKETCH_DEPTH):
+            yield row, int(content_hash[row * 8:row * 8 + 8], 16) & self.mask
+
+    def estimate(self, content_hash: str) -> int:
+        return min(self.rows[row][i] for row, i in self._indexes(content_hash))
+
+    def increment(self, content_hash: str):
+        for row, i in self._indexes(content_hash):
+            if self.rows[row][i] < SKETCH_MAX_COUNT:
+                self.rows[row][i] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self._age()
+
+    def _age(self):
+        for row in self.rows:
+            row[:] = row.translate(_HALVE)
+        self.additions //= 2
+
+class BlockCache:
+    """
+    Cache des blocs déchiffrés (clair complet), borné en octets.
+    Éviction LRU, admission TinyLFU : un nouveau bloc n'entre que s'il a été
+    demandé plus souvent que les blocs qu'il ferait sortir. Un parcours
+    séquentiel (scan, export complet) ne vide donc pas le cache des blocs
+    populaires (partages publics, miniatures).
+    Les lectures simultanées d'un même bloc absent ne déclenchent qu'un seul
+    chargement (single-flight). Tout est appelé depuis l'event loop : pas de verrou.
+    """
+    def __init__(self, capacity_bytes: int = CACHE_MB * 1024 * 1024, max_block_bytes: int = CACHE_MAX_BLOCK_MB * 1024 * 1024):
+        self.capacity = capacity_bytes
+        self.max_block = min(max_block_bytes, capacity_bytes)
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Task] = {}
+        # Largeur ~ nombre de blocs d'1MB que contient le budget, x4
+        self.sketch = FrequencySketch(4 * max(capacity_bytes // (1024 * 1024), 1))
+        self.used = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0       # Demandes servies par un chargement déjà en cours
+        self.evictions = 0
+        self.rejected = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def __contains__(self, content_hash: str) -> bool:
+        return content_hash in self._entries or content_hash in self._loading
+
+    def cacheable(self, stored_size: int) -> bool:
+        return self.enabled and stored_size <= self.max_block
+
+    async def get(self, content_hash: str, loader: Callable[[], Awaitable[bytes]]) -> bytes:
+        """Clair du bloc, depuis le cache ou via loader() (un seul appel pour des demandes simultanées)"""
+        self.sketch.increment(content_hash)
+        data = self._entries.get(content_hash)
+        if data is not None:
+            self._entries.move_to_end(content_hash)
+            self.hits += 1
+            return data
+
+        task = self._loading.get(content_hash)
+        if task is None:
+            self.misses += 1
+            # Tâche indépendante : l'annulation du premier demandeur n'interrompt pas les autres
+            task = asyncio.ensure_future(self._load(content_hash, loader))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._loading[content_hash] = task
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    async def _load(self, content_hash: str, loader: Callable[[], Awaitable[bytes]]) -> bytes:
+        try:
+            data = await loader()
+        finally:
+            owned = self._loading.get(content_hash) is asyncio.current_task()
+            if owned:
+                del self._loading[content_hash]
+        if owned:
+            self._admit(content_hash, data)
+        return data
+
+    def _admit(self, content_hash: str, data: bytes):
+        size = len(data)
+        if size > self.max_block:
+            return
+        # Victimes LRU nécessaires ; le candidat doit être plus fréquent que chacune
+        frequency = self.sketch.estimate(content_hash)
+        victims, freed = [], 0
+        for victim, value in self._entries.items():
+            if self.used - freed + size <= self.capacity:
+                break
+            if self.sketch.estimate(victim) >= frequency:
+                self.rejected += 1
+                return
+            victims.append(victim)
+            freed += len(value)
+        for victim in victims:
+            self.used -= len(self._entries.pop(victim))
+            self.evictions += 1
+        self._entries[content_hash] = data
+        self.used += size
+
+    def invalidate(self, content_hash: str):
+        """Bloc supprimé (GC, quarantaine) : ni l'entrée ni un chargement en cours ne doivent survivre"""
+        data = self._entries.pop(content_hash, None)
+        if data is not None:
+            self.used -= len(data)
+            self.invalidations += 1
+        # Le chargement en cours servira ses appelants mais ne sera pas mis en cache
+        self._loading.pop(content_hash, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "capacity_bytes": self.capacity,
+            "used_bytes": self.used,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "rejected": self.rejected,
+            "invalidations": self.invalidations,
+            # Part des lectures qui n'ont pas touché le disque
+            "hit_ratio": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,436 @@
+import os
+import math
+import shutil
+import struct
+import logging
+import time
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+logger = logging.getLogger("node.block_index")
+
+# --- CONFIGURATION ---
+BLOOM_CAPACITY = int(os.getenv("NODE_BLOOM_CAPACITY", 1_000_000))   # Blocs attendus
+BLOOM_FP_RATE = float(os.getenv("NODE_BLOOM_FP_RATE", 0.01))
+INDEX_SNAPSHOT_EVERY = int(os.getenv("NODE_INDEX_SNAPSHOT_EVERY", 100_000))  # Entrées de journal
+
+HEAT_MAX_HITS = 15                        # Compteur de lectures 4 bits, divisé par deux par TierMover
+
+SNAPSHOT_MAGIC = b"NXIX"
+_SNAP_HEADER = struct.Struct(">4sBQQI")   # magic, version, nb entrées, bits bloom, k bloom
+_ENTRY = struct.Struct(">32sQB")          # hash brut, taille sur disque, location (tier)
+_JOURNAL = struct.Struct(">B32sQB")       # op + entrée
+OP_PUT = 1
+OP_DEL = 2
+
+class BloomFilter:
+    """
+    Filtre de Bloom sur des hash SHA-256 : les octets du hash sont déjà
+    uniformes, on en tire directement les k positions (double hashing).
+    Le seed choisit les mots du hash utilisés : deux filtres de seeds
+    différents n'ont pas les mêmes faux positifs.
+    """
+    def __init__(
+        self,
+        capacity: int,
+        fp_rate: float = BLOOM_FP_RATE,
+        bits: Optional[bytearray] = None,
+        k: int = 0,
+        seed: int = 0,
+    ):
+        if bits is not None:
+            # Filtre rechargé depuis un snapshot : on retrouve la capacité d'origine
+            self.num_bits = len(bits) * 8
+            capacity = int(self.num_bits * (math.log(2) ** 2) / -math.log(fp_rate))
+        else:
+            capacity = max(capacity, 1024)
+            self.num_bits = int(-capacity * math.log(fp_rate) / (math.log(2) ** 2)) // 8 * 8 + 8
+        self.k = k or max(1, round(self.num_bits / capacity * math.log(2)))
+        self.capacity = capacity
+        self.seed = seed % 4
+        self.bits = bits if bits is not None else bytearray(self.num_bits // 8)
+
+    def _positions(self, raw_hash: bytes) -> Iterator[int]:
+        w1 = self.seed * 8
+        w2 = (w1 + 8) % 32
+        h1 = int.from_bytes(raw_hash[w1:w1 + 8], "big")
+        h2 = int.from_bytes(raw_hash[w2:w2 + 8], "big") | 1
+        for i in range(self.k):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, raw_hash: bytes):
+        for pos in self._positions(raw_hash):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, raw_hash: bytes) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(raw_hash))
+
+class BlockIndex:
+    """
+    Index en mémoire des blocs présents sur le node : hash -> (taille, location).
+    Un filtre de Bloom répond aux misses (cas majoritaire à l'upload) sans
+    toucher au dict ni au disque. Persisté sous forme snapshot + journal
+    append-only pour éviter de rescanner l'arborescence au redémarrage.
+    Les snapshots périodiques s'écrivent dans un thread de fond, à partir
+    d'une copie de l'index : l'écriture qui les déclenche ne fait que
+    basculer sur un nouveau journal (l'ancien est rejoué tant que le
+    snapshot n'est pas en place). De même, le filtre de Bloom est agrandi
+    dans un thread de fond puis basculé sous le verrou.
+
+    La location est le tier de stockage du bloc (0 = le plus rapide). La
+    chaleur des blocs (dernière lecture, nombre de lectures récentes) sert
+    au déplacement entre tiers ; elle n'est pas persistée : après un
+    redémarrage, tous les blocs repartent comme lus au chargement.
+    """
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        os.makedirs(index_dir, exist_ok=True)
+        self.snapshot_path = os.path.join(index_dir, "blocks.snapshot")
+        self.journal_path = os.path.join(index_dir, "blocks.journal")
+        # Journal couvert par le snapshot en cours d'écriture (supprimé une fois celui-ci en place)
+        self.rotated_path = self.journal_path + ".old"
+
+        # Valeur compacte : (taille << 8) | location
+        self._entries: Dict[bytes, int] = {}
+        self._bloom = BloomFilter(BLOOM_CAPACITY)
+        self.total_bytes = 0
+        self.location_bytes: Dict[int, int] = defaultdict(int)
+        self.location_blocks: Dict[int, int] = defaultdict(int)
+        # Chaleur : (dernière lecture en secondes << 4) | lectures récentes
+        self._heat: Dict[bytes, int] = {}
+        self._loaded_at = int(time.time())
+        self._journal_entries = 0
+        self._lock = threading.Lock()
+        self._journal_fd = None
+        # Un snapshot à la fois (de fond ou synchrone) : fin signalée par _snapshot_done
+        self._snapshotting = False
+        self._snapshot_done = threading.Condition(self._lock)
+        # Agrandissement du filtre de Bloom en cours (thread de fond) : hash ajoutés
+        # depuis la copie des clés, à reporter dans le nouveau filtre avant la bascule
+        self._growing: Optional[list] = None
+        self.loaded = False
+
+    # --- CHARGEMENT / PERSISTANCE ---
+
+    def load(self) -> bool:
+        """
+        Charge le snapshot puis rejoue la queue du journal (les écritures
+        postérieures au snapshot). Retourne False si aucun snapshot valide
+        n'existe : le journal seul ne décrit pas tout le disque, l'appelant
+        doit alors peupler l'index par un scan (qui se termine par un snapshot).
+        """
+        started = time.monotonic()
+        found = os.path.exists(self.snapshot_path) and self._load_snapshot()
+        replayed = 0
+        if found:
+            # Journal basculé d'un snapshot de fond interrompu, puis journal courant
+            for path in (self.rotated_path, self.journal_path):
+                if os.path.exists(path):
+                    replayed += self._replay_journal(path)
+        self._journal_fd = os.open(self.journal_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        self.loaded = True
+        if found:
+            logger.info(
+                f"📇 Block index loaded: {len(self._entries)} blocks, {self.total_bytes} bytes "
+                f"({replayed} journal entries replayed) in {(time.monotonic() - started) * 1000:.0f} ms"
+            )
+        return found
+
+    def _load_snapshot(self) -> bool:
+        # Une lecture séquentielle du fichier, puis décodage des entrées dans le dict
+        # (iter_unpack sur une vue, sans copie intermédiaire des enregistrements)
+        with open(self.snapshot_path, "rb") as f:
+            data = f.read()
+        try:
+            magic, _, count, num_bits, k = _SNAP_HEADER.unpack_from(data)
+            if magic != SNAPSHOT_MAGIC:
+                raise ValueError("bad magic")
+            pos = _SNAP_HEADER.size
+            bloom_bytes = num_bits // 8
+            bloom = BloomFilter(0, bits=bytearray(data[pos:pos + bloom_bytes]), k=k)
+            pos += bloom_bytes
+            if len(data) < pos + count * _ENTRY.size:
+                raise ValueError("truncated")
+        except (struct.error, ValueError) as e:
+            logger.error(f"❌ Corrupt block index snapshot ({e}), ignoring it")
+            return False
+
+        with memoryview(data)[pos:pos + count * _ENTRY.size] as view:
+            for raw_hash, size, location in _ENTRY.iter_unpack(view):
+                self._entries[raw_hash] = (size << 8) | location
+                self.total_bytes += size
+                self.location_bytes[location] += size
+                self.location_blocks[location] += 1
+        self._bloom = bloom
+        return True
+
+    def _replay_journal(self, path: str) -> int:
+        with open(path, "rb") as f:
+            data = f.read()
+        count = len(data) // _JOURNAL.size
+        if count * _JOURNAL.size != len(data):
+            logger.warning("⚠️  Torn tail in block index journal, truncating")
+            os.truncate(path, count * _JOURNAL.size)
+        # Sous _lock comme toute mutation : _put peut lancer l'agrandissement du filtre
+        with self._lock:
+            for op, raw_hash, size, location in _JOURNAL.iter_unpack(data[:count * _JOURNAL.size]):
+                if op == OP_PUT:
+                    self._put(raw_hash, size, location)
+                else:
+                    self._remove(raw_hash)
+        self._journal_entries += count
+        return count
+
+    def _rotate(self) -> Tuple[Dict[bytes, int], bytes, int]:
+        """
+        Sous _lock : copie de l'index (copie C du dict, sans I/O) et bascule sur
+        un journal vide. Les écritures suivantes vont au nouveau journal, que le
+        snapshot de la copie n'a pas à couvrir.
+        """
+        state = self._entries.copy(), bytes(self._bloom.bits), self._bloom.k
+        if self._journal_fd is not None:
+            # Durable avant la bascule : sync() ne couvre que le journal courant
+            os.fsync(self._journal_fd)
+            os.close(self._journal_fd)
+            if os.path.exists(self.rotated_path):
+                # Snapshot précédent en échec : son journal reste à couvrir, on y ajoute le courant
+                with open(self.journal_path, "rb") as src, open(self.rotated_path, "ab") as dst:
+                    shutil.copyfileobj(src, dst)
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                os.remove(self.journal_path)
+            else:
+                os.replace(self.journal_path, self.rotated_path)
+            self._journal_fd = os.open(self.journal_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        self._journal_entries = 0
+        return state
+
+    def _write_snapshot(self, entries: Dict[bytes, int], bits: bytes, k: int):
+        """Écrit un snapshot atomique de la copie, puis oublie le journal basculé qu'il couvre"""
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_SNAP_HEADER.pack(SNAPSHOT_MAGIC, 1, len(entries), len(bits) * 8, k))
+            f.write(bits)
+            f.write(b"".join(
+                _ENTRY.pack(raw_hash, value >> 8, value & 0xFF) for raw_hash, value in entries.items()
+            ))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        if os.path.exists(self.rotated_path):
+            os.remove(self.rotated_path)
+        logger.info(f"📸 Block index snapshot written ({len(entries)} blocks)")
+
+    def _finish_snapshot(self, state: Tuple[Dict[bytes, int], bytes, int]):
+        try:
+            self._write_snapshot(*state)
+        finally:
+            with self._lock:
+                self._snapshotting = False
+                self._snapshot_done.notify_all()
+
+    def _background_snapshot(self, state: Tuple[Dict[bytes, int], bytes, int]):
+        try:
+            self._finish_snapshot(state)
+        except Exception as e:
+            # Le journal basculé est conservé : rejoué au démarrage, fusionné au prochain essai
+            logger.error(f"❌ Block index snapshot failed: {e}")
+
+    def snapshot(self):
+        """Écrit un snapshot atomique puis vide le journal (synchrone : fin de scan, arrêt)"""
+        with self._lock:
+            self._snapshot_done.wait_for(lambda: not self._snapshotting)
+            state = self._rotate()
+            self._snapshotting = True
+        self._finish_snapshot(state)
+
+    # --- MUTATIONS ---
+
+    def _put(self, raw_hash: bytes, size: int, location: int):
+        old = self._entries.get(raw_hash)
+        if old is not None:
+            self._account(old, -1)
+        self._entries[raw_hash] = (size << 8) | location
+        self._account((size << 8) | location, 1)
+        self._bloom.add(raw_hash)
+        if self._growing is not None:
+            self._growing.append(raw_hash)
+        elif len(self._entries) > self._bloom.capacity:
+            # Appelé sous _lock : le thread copie les clés dès qu'il l'obtient
+            self._growing = []
+            capacity = max(self._bloom.capacity, len(self._entries)) * 2
+            threading.Thread(target=self._grow_bloom, args=(capacity,), name="index-bloom", daemon=True).start()
+
+    def _remove(self, raw_hash: bytes) -> bool:
+        old = self._entries.pop(raw_hash, None)
+        if old is None:
+            return False
+        self._account(old, -1)
+        self._heat.pop(raw_hash, None)
+        return True
+
+    def _account(self, value: int, sign: int):
+        size, location = value >> 8, value & 0xFF
+        self.total_bytes += sign * size
+        self.location_bytes[location] += sign * size
+        self.location_blocks[location] += sign
+
+    def _grow_bloom(self, capacity: int):
+        """
+        Thread de fond : taux de faux positifs dégradé, on double la capacité et
+        on réinsère tout hors verrou. L'ancien filtre reste en service (et continue
+        de recevoir les ajouts) jusqu'à la bascule.
+        """
+        with self._lock:
+            keys = list(self._entries)
+        bloom = BloomFilter(capacity)
+        try:
+            for raw_hash in keys:
+                bloom.add(raw_hash)
+        except Exception as e:
+            logger.error(f"❌ Bloom filter resize failed: {e}")
+            bloom = None
+        with self._lock:
+            if bloom is not None:
+                for raw_hash in self._growing:
+                    bloom.add(raw_hash)
+                self._bloom = bloom
+            self._growing = None
+
+    def _journal(self, op: int, raw_hash: bytes, size: int, location: int):
+        if self._journal_fd is None:
+            return
+        # Pas de fsync ici : un OP_PUT perdu fait seulement réécrire le bloc ou le
+        # retrouver sur le disque (_probe). Un OP_DEL ou un changement de tier perdu
+        # laisserait l'index désigner un fichier supprimé : l'appelant fait sync()
+        # avant l'unlink correspondant.
+        os.write(self._journal_fd, _JOURNAL.pack(op, raw_hash, size, location))
+        self._journal_entries += 1
+
+    def sync(self):
+        """
+        Bloquant (pool I/O) : rend durables les entrées déjà journalisées. Le fd
+        est dupliqué sous le verrou, le fsync se fait hors verrou ; une bascule
+        concurrente (_rotate) fsync elle-même le journal qu'elle referme.
+        """
+        with self._lock:
+            if self._journal_fd is None:
+                return
+            fd = os.dup(self._journal_fd)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def add(self, content_hash: str, size: int, location: int = 0):
+        raw_hash = bytes.fromhex(content_hash)
+        with self._lock:
+            self._put(raw_hash, size, location)
+            self._journal(OP_PUT, raw_hash, size, location)
+            if self._journal_entries >= INDEX_SNAPSHOT_EVERY and not self._snapshotting:
+                # Hors du chemin critique : seule la bascule du journal se fait ici
+                state = self._rotate()
+                self._snapshotting = True
+                threading.Thread(
+                    target=self._background_snapshot, args=(state,), name="index-snapshot", daemon=True
+                ).start()
+
+    def add_many(self, entries: Iterable[Tuple[str, int, int]]):
+        """
+        Peuplement en masse (scan initial) sans passer par le journal.
+        Un bloc déjà indexé (écrit pendant le scan) garde son entrée.
+        """
+        with self._lock:
+            for content_hash, size, location in entries:
+                raw_hash = bytes.fromhex(content_hash)
+                if raw_hash not in self._entries:
+                    self._put(raw_hash, size, location)
+
+    def relocate(self, content_hash: str, location: int) -> bool:
+        """Le bloc a changé de tier (taille inchangée) ; False s'il a disparu entre-temps"""
+        raw_hash = bytes.fromhex(content_hash)
+        with self._lock:
+            value = self._entries.get(raw_hash)
+            if value is None:
+                return False
+            self._put(raw_hash, value >> 8, location)
+            self._journal(OP_PUT, raw_hash, value >> 8, location)
+        return True
+
+    def remove(self, content_hash: str) -> bool:
+        raw_hash = bytes.fromhex(content_hash)
+        with self._lock:
+            removed = self._remove(raw_hash)
+            if removed:
+                self._journal(OP_DEL, raw_hash, 0, 0)
+        return removed
+
+    # --- LECTURES (sans verrou : opérations atomiques sur le dict) ---
+
+    def get(self, content_hash: str) -> Optional[Tuple[int, int]]:
+        """Retourne (taille, location) ou None"""
+        raw_hash = bytes.fromhex(content_hash)
+        if raw_hash not in self._bloom:
+            return None
+        value = self._entries.get(raw_hash)
+        if value is None:
+            return None
+        return value >> 8, value & 0xFF
+
+    def __contains__(self, content_hash: str) -> bool:
+        return self.get(content_hash) is not None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # --- CHALEUR (tiering) ---
+
+    def touch(self, content_hash: str):
+        """Une lecture du bloc : appelé à chaque stream_block, doit rester O(1)"""
+        raw_hash = bytes.fromhex(content_hash)
+        if raw_hash not in self._entries:
+            return
+        hits = self._heat.get(raw_hash, 0) & 0xF
+        self._heat[raw_hash] = (int(time.time()) << 4) | min(hits + 1, HEAT_MAX_HITS)
+
+    def decay_heat(self):
+        """
+        Divise les compteurs de lectures par deux : la popularité passée s'efface.
+        Appelé hors de l'event loop : mise à jour en place, une entrée modifiée
+        entre-temps par touch() (ou retirée) est laissée telle quelle.
+        """
+        for raw_hash, v in list(self._heat.items()):
+            if v & 0xF and self._heat.get(raw_hash) == v:
+                self._heat[raw_hash] = (v & ~0xF) | ((v & 0xF) >> 1)
+
+    def blocks_in(self, location: int) -> Iterator[Tuple[str, int, int, int]]:
+        """
+        Blocs d'un tier : (hash, taille, dernière lecture, lectures récentes).
+        Seule la copie de l'index se fait sous le verrou ; le filtrage se fait
+        au fil de l'itération (à parcourir hors de l'event loop).
+        """
+        with self._lock:
+            entries = list(self._entries.items())
+        for raw_hash, value in entries:
+            if value & 0xFF != location:
+                continue
+            size = value >> 8
+            heat = self._heat.get(raw_hash)
+            if heat is None:
+                yield raw_hash.hex(), size, self._loaded_at, 0
+            else:
+                yield raw_hash.hex(), size, heat >> 4, heat & 0xF
+
+    def hashes(self) -> Iterator[str]:
+        with self._lock:
+            keys = list(self._entries)
+        for raw_hash in keys:
+            yield raw_hash.hex()
+
+    def close(self):
+        with self._lock:
+            self._snapshot_done.wait_for(lambda: not self._snapshotting)
+        if self._journal_fd is not None:
+            os.close(self._journal_fd)
+            self._journal_fd = None
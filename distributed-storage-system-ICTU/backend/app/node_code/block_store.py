@@ -0,0 +1,578 @@
+import os
+import sys
+import time
+import uuid
+import ctypes
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .block_index import BlockIndex
+from .group_commit import GroupCommitter
+from .telemetry import fsync, fsync_latency
+from .worker_pools import io_pool
+
+# --- GROUP COMMIT (backend files) ---
+FILE_GROUP_COMMIT = os.getenv("FILE_GROUP_COMMIT", "true").lower() == "true"
+FILE_COMMIT_INTERVAL_MS = float(os.getenv("FILE_COMMIT_INTERVAL_MS", 1))          # Fenêtre de regroupement
+FILE_COMMIT_MAX_BYTES = int(os.getenv("FILE_COMMIT_MAX_BYTES", 16 * 1024 * 1024))
+# Au-delà, un seul syncfs() (Linux) coûte moins qu'un fsync par fichier du lot
+FILE_COMMIT_SYNCFS_MIN = int(os.getenv("FILE_COMMIT_SYNCFS_MIN", 8))
+# Threads du scan de reconstruction de l'index (un dossier de shard par tâche)
+SCAN_THREADS = int(os.getenv("NODE_SCAN_THREADS", 16))
+SCAN_LOG_EVERY = 32    # Shards entre deux lignes de progression
+
+logger = logging.getLogger("node.block_store")
+
+def _write_all(fd: int, data: bytes):
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+def _close_fd(fd: int, sync: bool):
+    try:
+        if sync:
+            # Force l'écriture physique sur le disque
+            fsync(fd)
+    finally:
+        os.close(fd)
+
+def _fsync_dir(path: str):
+    # Sans fsync du dossier, un rename peut être perdu au crash même si le fichier est durable
+    dir_fd = os.open(path, os.O_RDONLY)
+    try:
+        fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+def _fsync_path(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        fsync(fd)
+    finally:
+        os.close(fd)
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _copy_durable(source: str, target: str, chunk_size: int = 1024 * 1024):
+    """
+    Copie d'un fichier de bloc vers un autre disque (changement de tier) : écrite
+    à côté sous .moving, fsync, puis renommée. Un crash ne laisse jamais de
+    fichier tronqué sous le nom du hash. La date (période de grâce du GC) suit.
+    """
+    tmp_path = target + ".moving"
+    src_fd = os.open(source, os.O_RDONLY)
+    try:
+        dst_fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            while True:
+                data = os.read(src_fd, chunk_size)
+                if not data:
+                    break
+                _write_all(dst_fd, data)
+            fsync(dst_fd)
+        except BaseException:
+            _remove_quietly(tmp_path)
+            raise
+        finally:
+            os.close(dst_fd)
+        st = os.fstat(src_fd)
+    finally:
+        os.close(src_fd)
+    os.utime(tmp_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    os.rename(tmp_path, target)
+    _fsync_dir(os.path.dirname(target))
+
+def _load_syncfs():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        syncfs = ctypes.CDLL(None, use_errno=True).syncfs
+    except (OSError, AttributeError):
+        return None
+    syncfs.argtypes = [ctypes.c_int]
+    return syncfs
+
+_syncfs = _load_syncfs()
+
+def _syncfs_path(path: str):
+    """Flush de tout le système de fichiers contenant path (fichiers ET dossiers)"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        started = time.perf_counter()
+        if _syncfs(fd) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        fsync_latency.observe(time.perf_counter() - started)
+    finally:
+        os.close(fd)
+
+class FileStaging:
+    """
+    Zone de préparation d'un bloc : fichier tmp_* dans TEMP_DIR.
+    Le bloc chiffré y est écrit au fil du stream, avant d'être publié par commit().
+    Tous les appels disque passent par le pool I/O, jamais par l'event loop.
+    """
+    def __init__(self, temp_dir: str, on_done: Optional[Callable[[], None]] = None):
+        self.path = os.path.join(temp_dir, f"tmp_{uuid.uuid4().hex}")
+        self.size = 0
+        self._fd = None
+        self._on_done = on_done
+
+    def _done(self):
+        """Plus aucune écriture à venir (commit ou abandon) : appelé une seule fois"""
+        if self._on_done is not None:
+            on_done, self._on_done = self._on_done, None
+            on_done()
+
+    async def write(self, data: bytes):
+        if self._fd is None:
+            self._fd = await io_pool.run(os.open, self.path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        if data:
+            await io_pool.run(_write_all, self._fd, data, cost=len(data))
+            self.size += len(data)
+
+    async def close(self, sync: bool = True):
+        if self._fd is None:
+            return
+        fd, self._fd = self._fd, None
+        await io_pool.run(_close_fd, fd, sync)
+
+    async def discard(self):
+        """Nettoyage en cas d'erreur, de stream interrompu ou de dédup hit"""
+        self._done()
+        if self._fd is not None:
+            fd, self._fd = self._fd, None
+            await io_pool.run(os.close, fd)
+        try:
+            await io_pool.run(os.remove, self.path)
+        except FileNotFoundError:
+            pass
+
+class FileBlockReader:
+    """Accès aléatoire au contenu chiffré d'un bloc (async context manager)"""
+    def __init__(
+        self,
+        path: Optional[str],
+        size: Optional[int] = None,
+        relocate: Optional[Callable[[], str]] = None,
+        probe: Optional[Callable[[], str]] = None,
+    ):
+        self.path = path
+        self.size = size
+        self._fd = None
+        # Le bloc a pu changer de tier entre la lecture de l'index et l'open
+        self._relocate = relocate
+        # Bloc absent de l'index : chemin cherché sur le disque (dans le pool I/O)
+        self._probe = probe
+
+    async def __aenter__(self):
+        if self.path is None:
+            self.path = await io_pool.run(self._probe)
+        try:
+            self._fd = await io_pool.run(os.open, self.path, os.O_RDONLY)
+        except FileNotFoundError:
+            path = self._relocate() if self._relocate is not None else self.path
+            if path == self.path:
+                raise
+            self.path = path
+            self._fd = await io_pool.run(os.open, self.path, os.O_RDONLY)
+        if self.size is None:
+            self.size = (await io_pool.run(os.fstat, self._fd)).st_size
+        return self
+
+    async def read(self, offset: int, n: int) -> bytes:
+        return await io_pool.run(os.pread, self._fd, n, offset, cost=n)
+
+    async def __aexit__(self, *exc):
+        os.close(self._fd)
+
+class RecoveryProgress:
+    """
+    Démarrage du store, exposé dans le HealthCheck : chargement de l'index
+    persisté (quelques secondes) ou, s'il manque, scan de reconstruction.
+    Mis à jour depuis les threads du scan : simples affectations d'entiers.
+    """
+    def __init__(self):
+        self.phase = "loading"        # loading -> scanning -> ready
+        self.source = ""              # "index", "scan" ou "journal" (packs)
+        self.shards_total = 0
+        self.shards_scanned = 0
+        self.blocks_found = 0
+        self._started = time.monotonic()
+        self.duration = 0.0
+
+    @property
+    def ready(self) -> bool:
+        return self.phase == "ready"
+
+    def finish(self, source: str):
+        self.source = source
+        self.duration = time.monotonic() - self._started
+        self.phase = "ready"
+
+    def stats(self) -> dict:
+        duration = self.duration if self.ready else time.monotonic() - self._started
+        return {
+            "phase": self.phase,
+            "source": self.source,
+            "shards_total": self.shards_total,
+            "shards_scanned": self.shards_scanned,
+            "blocks_found": self.blocks_found,
+            "duration_ms": int(duration * 1000),
+        }
+
+class FileBlockStore:
+    """
+    Backend historique : un fichier par bloc sous blocks/<hash[:2]>/<hash>.
+    Chaque écriture coûte un fsync + un rename + un fsync du dossier. En group
+    commit, ces appels sont faits par lot pour toutes les écritures concurrentes
+    (un fsync de dossier par shard touché, pas par bloc). Avec un BlockIndex, les
+    questions "ce bloc existe-t-il / quelle taille" ne touchent plus le disque.
+
+    Tiers : blocks_dir est le tier rapide (NVMe), où arrivent toutes les
+    écritures ; tier_dirs sont les tiers de capacité (HDD), par ordre de
+    priorité. Le tier de chaque bloc est sa location dans le BlockIndex : une
+    lecture ouvre directement le bon fichier, sans sonder les dossiers.
+    Les déplacements entre tiers sont faits par TierMover (tiering.py).
+
+    Démarrage : l'index persisté est chargé (snapshot lu d'un bloc +
+    queue du journal). S'il manque ou est corrompu, les dossiers de shards
+    de tous les tiers sont rescannés en parallèle ; avec scan_on_init=False
+    ce scan est laissé à recover(), que l'agent lance en tâche de fond pour
+    répondre au HealthCheck pendant la reconstruction.
+    """
+    name = "files"
+
+    def __init__(
+        self,
+        blocks_dir: str,
+        temp_dir: str,
+        index: Optional[BlockIndex] = None,
+        group_commit: bool = FILE_GROUP_COMMIT,
+        tier_dirs: Sequence[str] = (),
+        scan_on_init: bool = True,
+    ):
+        if tier_dirs and index is None:
+            raise ValueError("Storage tiers require a block index")
+        self.blocks_dir = blocks_dir
+        self.temp_dir = temp_dir
+        self.index = index
+        self.tiers = [blocks_dir, *tier_dirs]
+        # Blocs en cours d'écriture (staging ouvert, pas encore soumis au commit)
+        self._writers = 0
+        # Dédup hits pas encore vus par le GC (hash -> timestamp), comme PackBlockStore
+        self._touched: Dict[str, float] = {}
+        # Unlinks en cours (hash -> future résolue à la fin de delete)
+        self._deleting: Dict[str, asyncio.Future] = {}
+        self._committer = GroupCommitter(
+            self._flush, FILE_COMMIT_INTERVAL_MS, FILE_COMMIT_MAX_BYTES,
+            name="files", siblings=lambda: self._writers,
+        ) if group_commit else None
+
+        # Les 256 dossiers de sharding sont créés une fois pour toutes
+        for tier_dir in self.tiers:
+            for i in range(256):
+                os.makedirs(os.path.join(tier_dir, f"{i:02x}"), exist_ok=True)
+
+        self.recovery = RecoveryProgress()
+        if index is None:
+            self.recovery.finish("scan")
+        elif index.load():
+            self.recovery.finish("index")
+        elif scan_on_init:
+            self.rebuild_index()
+
+    def _path(self, content_hash: str, location: int = 0) -> str:
+        # Structure de dossier "sharding" pour éviter 1M de fichiers dans un dossier
+        # ex: /data/blocks/af/af45e...
+        return os.path.join(self.tiers[location], content_hash[:2], content_hash)
+
+    def _location(self, content_hash: str) -> int:
+        entry = self.index.get(content_hash) if self.index is not None else None
+        return entry[1] if entry is not None else 0
+
+    def _current_path(self, content_hash: str) -> str:
+        return self._path(content_hash, self._location(content_hash))
+
+    def _probe(self, content_hash: str) -> Tuple[str, int]:
+        """Recherche sur le disque, tier par tier, d'un bloc absent de l'index"""
+        for location in range(len(self.tiers)):
+            path = self._path(content_hash, location)
+            if os.path.exists(path):
+                return path, location
+        raise FileNotFoundError(f"Block {content_hash} missing on this node")
+
+    def _shard_dirs(self) -> List[Tuple[int, str]]:
+        return [
+            (location, os.path.join(tier_dir, shard))
+            for location, tier_dir in enumerate(self.tiers)
+            for shard in sorted(os.listdir(tier_dir))
+            if os.path.isdir(os.path.join(tier_dir, shard))
+        ]
+
+    @staticmethod
+    def _scan_shard(location: int, shard_dir: str) -> List[Tuple[str, int, int]]:
+        found = []
+        with os.scandir(shard_dir) as entries:
+            for entry in entries:
+                # .moving : copie inachevée d'un déplacement de tier
+                if entry.is_file() and not entry.name.endswith(".moving"):
+                    found.append((entry.name, entry.stat().st_size, location))
+        return found
+
+    def _scan(self) -> Iterator[Tuple[str, int, int]]:
+        """Parcours complet de l'arborescence : (hash, taille, location)"""
+        for location, shard_dir in self._shard_dirs():
+            yield from self._scan_shard(location, shard_dir)
+
+    def rebuild_index(self):
+        """
+        Reconstruit l'index depuis le disque : les dossiers de shards sont
+        listés en parallèle (le coût est dominé par les stat(), qui relâchent
+        le GIL), puis un snapshot est écrit pour que le prochain démarrage
+        n'ait plus qu'à le charger.
+        """
+        progress = self.recovery
+        progress.phase = "scanning"
+        shard_dirs = self._shard_dirs()
+        progress.shards_total = len(shard_dirs)
+        logger.warning(f"⚠️  No usable block index, scanning {len(shard_dirs)} shard directories ({SCAN_THREADS} threads)")
+
+        with ThreadPoolExecutor(max_workers=SCAN_THREADS, thread_name_prefix="node-scan") as executor:
+            for found in executor.map(lambda item: self._scan_shard(*item), shard_dirs):
+                self.index.add_many(found)
+                progress.shards_scanned += 1
+                progress.blocks_found += len(found)
+                if progress.shards_scanned % SCAN_LOG_EVERY == 0:
+                    logger.info(
+                        f"🔍 Block scan: {progress.shards_scanned}/{progress.shards_total} shards, "
+                        f"{progress.blocks_found} blocks"
+                    )
+        self.index.snapshot()
+        progress.finish("scan")
+        logger.info(f"🔍 Block scan done: {progress.blocks_found} blocks in {progress.duration:.1f} s")
+
+    async def recover(self):
+        """Termine le démarrage (scan de reconstruction si l'index n'a pas pu être chargé)"""
+        if not self.recovery.ready:
+            await asyncio.to_thread(self.rebuild_index)
+
+    def close(self):
+        """Arrêt propre : un snapshot à jour, le prochain démarrage n'aura aucun journal à rejouer"""
+        if self.index is not None and self.recovery.ready:
+            self.index.snapshot()
+            self.index.close()
+
+    def exists(self, content_hash: str) -> bool:
+        if self.index is not None:
+            return content_hash in self.index
+        return os.path.exists(self._path(content_hash))
+
+    async def stored_size(self, content_hash: str) -> int:
+        if self.index is not None:
+            entry = self.index.get(content_hash)
+            if entry is not None:
+                return entry[0]
+        return await io_pool.run(lambda: os.path.getsize(self._probe(content_hash)[0]))
+
+    def open_staging(self) -> FileStaging:
+        self._writers += 1
+        return FileStaging(self.temp_dir, on_done=self._writer_done)
+
+    def _writer_done(self):
+        self._writers -= 1
+
+    async def commit(self, staging: FileStaging, content_hash: str) -> Tuple[bool, int]:
+        """
+        Publie le bloc préparé. Retourne (is_new_write, size_on_disk).
+        Ne rend la main qu'une fois le contenu ET le rename durables.
+        """
+        # En group commit, le fsync du fichier est fait par le lot
+        await staging.close(sync=self._committer is None)
+        staging._done()
+
+        # Suppression en cours du même hash : on attend l'unlink avant de publier
+        while content_hash in self._deleting:
+            await asyncio.shield(self._deleting[content_hash])
+
+        # Vérification d'existence (Deduplication Hit) : le temporaire est jeté
+        if self.exists(content_hash):
+            self._touch(content_hash)
+            size = await self.stored_size(content_hash)
+            await staging.discard()
+            await io_pool.run(self._utime, [content_hash])
+            return False, size
+
+        item = (staging.path, self._path(content_hash))
+        if self._committer is not None:
+            await self._committer.submit(item, staging.size)
+        else:
+            await io_pool.run(self._flush, [item])
+        if self.index is not None:
+            self.index.add(content_hash, staging.size)
+        return True, staging.size
+
+    def _flush(self, items: List[Tuple[str, str]]):
+        """
+        Exécuté dans le pool I/O : fsync des temporaires, renommages atomiques,
+        puis un fsync par dossier de destination. items: (temporaire, chemin final)
+        Pour un gros lot, un seul syncfs() après les renommages remplace tout ça.
+        """
+        if self._committer is not None and _syncfs is not None and len(items) >= FILE_COMMIT_SYNCFS_MIN:
+            # Même ordre qu'au cas par cas : contenu durable AVANT le rename, sinon un
+            # crash pourrait laisser un fichier vide sous le nom du hash
+            _syncfs_path(self.temp_dir)
+            for tmp_path, final_path in items:
+                os.rename(tmp_path, final_path)
+            _syncfs_path(self.blocks_dir)
+            return
+
+        if self._committer is not None:
+            for tmp_path, _ in items:
+                _fsync_path(tmp_path)
+        for tmp_path, final_path in items:
+            os.rename(tmp_path, final_path)
+        for directory in {os.path.dirname(final_path) for _, final_path in items}:
+            _fsync_dir(directory)
+
+    def _touch(self, content_hash: str):
+        # Un dédup hit rajeunit le bloc : le GC ne le supprimera pas pendant la période de grâce.
+        # Noté en mémoire sans await (vu par un GC en cours), puis persisté par _utime
+        self._touched[content_hash] = time.time()
+
+    def _utime(self, hashes: List[str]):
+        """Bloquant (pool I/O) : la date du fichier survit à un redémarrage"""
+        for content_hash in hashes:
+            try:
+                os.utime(self._current_path(content_hash))
+            except FileNotFoundError:
+                pass
+
+    async def touch(self, hashes: List[str]):
+        """Dédup hits distants (HasBlocks touch) : en mémoire tout de suite, utime dans le pool I/O"""
+        for content_hash in hashes:
+            self._touch(content_hash)
+        await io_pool.run(self._utime, hashes)
+
+    def touched_at(self, content_hash: str) -> float:
+        """Dernier dédup hit connu en mémoire (0 si aucun depuis le dernier GC)"""
+        return self._touched.get(content_hash, 0.0)
+
+    def prune_touched(self, before: float):
+        """Oublie les dédup hits plus anciens que before (appelé après un GC)"""
+        self._touched = {h: t for h, t in self._touched.items() if t >= before}
+
+    async def last_modified_many(self, hashes: List[str]) -> List[float]:
+        """Date de dernière écriture ou dédup hit de chaque bloc (0 si absent), stat dans le pool I/O"""
+        def stat_all() -> List[float]:
+            mtimes = []
+            for content_hash in hashes:
+                try:
+                    mtimes.append(os.stat(self._current_path(content_hash)).st_mtime)
+                except FileNotFoundError:
+                    mtimes.append(0.0)
+            return mtimes
+        return [max(m, self.touched_at(h)) for h, m in zip(hashes, await io_pool.run(stat_all))]
+
+    def open_reader(self, content_hash: str) -> FileBlockReader:
+        if self.index is not None:
+            entry = self.index.get(content_hash)
+            if entry is not None:
+                return FileBlockReader(
+                    self._path(content_hash, entry[1]), size=entry[0],
+                    relocate=lambda: self._current_path(content_hash),
+                )
+
+        # Miss : le bloc n'existe pas, le journal d'index a perdu l'entrée ou le scan n'y est pas encore
+        def probe() -> str:
+            path, location = self._probe(content_hash)
+            if self.index is not None:
+                self.index.add(content_hash, os.path.getsize(path), location)
+            return path
+        return FileBlockReader(None, probe=probe)
+
+    def record_access(self, content_hash: str):
+        """Lecture d'un bloc : alimente la chaleur utilisée par le tiering"""
+        if self.index is not None:
+            self.index.touch(content_hash)
+
+    async def move(self, content_hash: str, location: int) -> bool:
+        """
+        Déplace le bloc vers un autre tier : copie durable sous le nom définitif,
+        bascule de l'index, puis suppression de l'ancien fichier. Les lectures
+        déjà ouvertes continuent sur l'ancien fichier. False si le bloc a été
+        supprimé (GC) ou déplacé pendant la copie.
+        """
+        source_location = self._location(content_hash)
+        if source_location == location or not self.exists(content_hash):
+            return False
+        source, target = self._path(content_hash, source_location), self._path(content_hash, location)
+        await io_pool.run(_copy_durable, source, target, cost=await self.stored_size(content_hash))
+        # Pas d'await entre la vérification et la bascule : delete() ne peut pas s'intercaler
+        if self._location(content_hash) != source_location or not self.index.relocate(content_hash, location):
+            await io_pool.run(_remove_quietly, target)
+            return False
+        await io_pool.run(self._unlink_durable, source, _remove_quietly)
+        return True
+
+    def _unlink_durable(self, path: str, unlink: Callable[[str], None] = os.remove):
+        """Bloquant : le journal d'index est durable avant l'unlink (OP_DEL ou changement de tier)"""
+        if self.index is not None:
+            self.index.sync()
+        unlink(path)
+
+    async def delete(self, content_hash: str) -> bool:
+        # Retrait de l'index sans await (vu tout de suite par exists()), unlink dans
+        # le pool I/O : un commit concurrent du même hash attend sa fin avant de
+        # publier son fichier, sinon l'unlink pourrait emporter le nouveau
+        path = self._current_path(content_hash)
+        removed = self.index.remove(content_hash) if self.index is not None else False
+        self._touched.pop(content_hash, None)
+        done = asyncio.get_running_loop().create_future()
+        previous = self._deleting.get(content_hash)
+        self._deleting[content_hash] = done
+        try:
+            if previous is not None:
+                await asyncio.shield(previous)
+            await io_pool.run(self._unlink_durable, path)
+            return True
+        except FileNotFoundError:
+            return removed
+        finally:
+            if self._deleting.get(content_hash) is done:
+                del self._deleting[content_hash]
+            done.set_result(None)
+
+    def iter_hashes(self) -> Iterator[str]:
+        if self.index is not None:
+            yield from self.index.hashes()
+            return
+        for content_hash, _, _ in self._scan():
+            yield content_hash
+
+    def stats(self) -> dict:
+        if self.index is None:
+            return {"blocks": 0, "bytes": 0}
+        return {"blocks": len(self.index), "bytes": self.index.total_bytes}
+
+    def tier_stats(self) -> List[dict]:
+        """Capacité du disque et occupation de chaque tier (un statvfs par tier)"""
+        tiers = []
+        for location, tier_dir in enumerate(self.tiers):
+            vfs = os.statvfs(tier_dir)
+            tiers.append({
+                "tier": location,
+                "path": tier_dir,
+                "capacity_bytes": vfs.f_blocks * vfs.f_frsize,
+                "free_bytes": vfs.f_bavail * vfs.f_frsize,
+                "blocks": self.index.location_blocks[location] if self.index is not None else 0,
+                "block_bytes": self.index.location_bytes[location] if self.index is not None else 0,
+            })
+        return tiers
@@ -0,0 +1,199 @@
+import os
+import lzma
+import time
+import zlib
+import logging
+import threading
+from typing import Callable, Dict, NamedTuple
+
+# Codecs optionnels : utilisés seulement s'ils sont installés sur le node
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+logger = logging.getLogger("node.compression")
+
+# --- CONFIGURATION ---
+# "auto" : zstd > lz4 > zlib selon ce qui est installé. "none" désactive la compression.
+COMPRESSION = os.getenv("NODE_COMPRESSION", "auto").lower()
+COMPRESSION_LEVEL = os.getenv("NODE_COMPRESSION_LEVEL")          # Tous codecs, ramené dans leur plage (défaut du codec si absent)
+# NODE_COMPRESSION_LEVEL_ZLIB / _LZMA / _ZSTD / _LZ4 : niveau d'un seul codec, prioritaire
+SAMPLE_SIZE = 1024                                              # Octets testés avant de compresser
+# Un échantillon qui ne gagne pas au moins 10% est considéré comme déjà compressé
+MIN_SAMPLE_GAIN = float(os.getenv("NODE_COMPRESSION_MIN_GAIN", 0.10))
+
+# Identifiants stockés dans le header des blocs : ne JAMAIS les réattribuer
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_LZMA = 2
+CODEC_ZSTD = 3
+CODEC_LZ4 = 4
+
+# Flag en tête du clair de chaque segment (authentifié par GCM avec le reste)
+SEGMENT_RAW = b"\x00"
+SEGMENT_COMPRESSED = b"\x01"
+
+# Signatures de formats déjà compressés : inutile de dépenser du CPU dessus
+COMPRESSED_MAGICS = (
+    b"\xff\xd8\xff",            # JPEG
+    b"\x89PNG",                 # PNG
+    b"GIF8",                    # GIF
+    b"PK\x03\x04",              # ZIP, docx/xlsx/odt, jar, apk
+    b"\x1f\x8b",                # gzip
+    b"BZh",                     # bzip2
+    b"\xfd7zXZ\x00",            # xz
+    b"7z\xbc\xaf\x27\x1c",      # 7z
+    b"Rar!",                    # RAR
+    b"\x28\xb5\x2f\xfd",        # zstd
+    b"\x04\x22\x4d\x18",        # lz4
+    b"\x1a\x45\xdf\xa3",        # Matroska / WebM
+    b"OggS",                    # Ogg
+    b"ID3",                     # MP3
+    b"fLaC",                    # FLAC
+)
+
+class Codec(NamedTuple):
+    id: int
+    name: str
+    compress: Callable[[bytes], bytes]
+    decompress: Callable[[bytes], bytes]
+
+def _level(name: str, default: int, lowest: int, highest: int) -> int:
+    """
+    Niveau d'un codec : NODE_COMPRESSION_LEVEL_<CODEC>, sinon NODE_COMPRESSION_LEVEL.
+    Les plages diffèrent (zlib et lzma 0-9, zstd 1-22, lz4 0-16) : un niveau
+    hors plage est ramené à la borne la plus proche au lieu de faire échouer
+    chaque écriture.
+    """
+    raw = os.getenv(f"NODE_COMPRESSION_LEVEL_{name.upper()}") or COMPRESSION_LEVEL
+    if not raw:
+        return default
+    level = int(raw)
+    clamped = min(max(level, lowest), highest)
+    if clamped != level:
+        logger.warning(f"⚠️  Compression level {level} out of range for {name}, using {clamped}")
+    return clamped
+
+def _build_codecs() -> Dict[int, Codec]:
+    zlib_level = _level("zlib", 6, 0, 9)
+    lzma_preset = _level("lzma", 1, 0, 9)
+    codecs = {
+        CODEC_ZLIB: Codec(CODEC_ZLIB, "zlib", lambda d: zlib.compress(d, zlib_level), zlib.decompress),
+        CODEC_LZMA: Codec(CODEC_LZMA, "lzma", lambda d: lzma.compress(d, preset=lzma_preset), lzma.decompress),
+    }
+    if zstandard is not None:
+        zstd_level = _level("zstd", 3, 1, zstandard.MAX_COMPRESSION_LEVEL)
+        # Les (dé)compresseurs zstd ne sont pas thread-safe : un par appel (création peu coûteuse)
+        codecs[CODEC_ZSTD] = Codec(
+            CODEC_ZSTD, "zstd",
+            lambda d: zstandard.ZstdCompressor(level=zstd_level).compress(d),
+            lambda d: zstandard.ZstdDecompressor().decompress(d),
+        )
+    if lz4_frame is not None:
+        lz4_level = _level("lz4", 0, 0, lz4_frame.COMPRESSIONLEVEL_MAX)
+        codecs[CODEC_LZ4] = Codec(
+            CODEC_LZ4, "lz4",
+            lambda d: lz4_frame.compress(d, compression_level=lz4_level),
+            lz4_frame.decompress,
+        )
+    return codecs
+
+CODECS = _build_codecs()
+
+def _configured_codec() -> int:
+    if COMPRESSION == "none":
+        return CODEC_NONE
+    if COMPRESSION == "auto":
+        for codec_id in (CODEC_ZSTD, CODEC_LZ4, CODEC_ZLIB):
+            if codec_id in CODECS:
+                return codec_id
+    for codec in CODECS.values():
+        if codec.name == COMPRESSION:
+            return codec.id
+    logger.warning(f"⚠️  Compression codec '{COMPRESSION}' unavailable, falling back to zlib")
+    return CODEC_ZLIB
+
+DEFAULT_CODEC = _configured_codec()
+
+class CompressionStats:
+    """
+    Compteurs du node pour le HealthCheck. Mis à jour depuis les threads du
+    pool CPU, d'où le verrou. Le temps CPU est mesuré par thread (thread_time) :
+    l'attente d'un thread libre n'est pas comptée.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.blocks_compressed = 0
+        self.blocks_skipped = 0
+        self.bytes_in = 0             # Clair soumis au codec
+        self.bytes_out = 0            # Après compression (segments stockés bruts inclus)
+        self.compress_cpu = 0.0
+        self.decompress_cpu = 0.0
+
+    def add(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "codec": CODECS[DEFAULT_CODEC].name if DEFAULT_CODEC in CODECS else "none",
+                "blocks_compressed": self.blocks_compressed,
+                "blocks_skipped": self.blocks_skipped,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "ratio": self.bytes_in / self.bytes_out if self.bytes_out else 1.0,
+                "compress_cpu_ms": int(self.compress_cpu * 1000),
+                "decompress_cpu_ms": int(self.decompress_cpu * 1000),
+            }
+
+compression_stats = CompressionStats()
+
+def choose_codec(sample: bytes) -> int:
+    """
+    Codec d'un nouveau bloc, d'après ses premiers octets.
+    JPEG, MP4, ZIP... sont reconnus à leur signature ; pour le reste (un chunk CDC
+    commence souvent au milieu d'un fichier), on compresse l'échantillon à l'essai.
+    """
+    if DEFAULT_CODEC == CODEC_NONE or not sample:
+        return CODEC_NONE
+    sample = bytes(sample[:SAMPLE_SIZE])
+    if sample.startswith(COMPRESSED_MAGICS) or sample[4:8] == b"ftyp":  # ftyp : MP4 / MOV / HEIC
+        compression_stats.add(blocks_skipped=1)
+        return CODEC_NONE
+    if len(zlib.compress(sample, 1)) > len(sample) * (1 - MIN_SAMPLE_GAIN):
+        compression_stats.add(blocks_skipped=1)
+        return CODEC_NONE
+    compression_stats.add(blocks_compressed=1)
+    return DEFAULT_CODEC
+
+def compress_segment(codec_id: int, data: bytes) -> bytes:
+    """Clair d'un segment -> flag + charge utile. Stocké brut si la compression ne gagne rien."""
+    started = time.thread_time()
+    packed = CODECS[codec_id].compress(data)
+    elapsed = time.thread_time() - started
+    if len(packed) >= len(data):
+        compression_stats.add(bytes_in=len(data), bytes_out=len(data), compress_cpu=elapsed)
+        return SEGMENT_RAW + data
+    compression_stats.add(bytes_in=len(data), bytes_out=len(packed), compress_cpu=elapsed)
+    return SEGMENT_COMPRESSED + packed
+
+def decompress_segment(codec_id: int, payload: bytes) -> bytes:
+    flag, body = payload[:1], payload[1:]
+    if flag == SEGMENT_RAW:
+        return body
+    if flag != SEGMENT_COMPRESSED:
+        raise ValueError("Invalid segment flag")
+    codec = CODECS.get(codec_id)
+    if codec is None:
+        raise ValueError(f"Block compressed with unavailable codec {codec_id}")
+    started = time.thread_time()
+    data = codec.decompress(body)
+    compression_stats.add(decompress_cpu=time.thread_time() - started)
+    return data
@@ -1,16 +1,33 @@
 import hashlib
 import os
-import aiofiles
 import logging
 import asyncio
-from typing import Tuple
+from typing import AsyncIterator, List, Optional, Tuple
 
-from .storage_encryption import local_cipher
+from .storage_encryption import local_cipher, parse_header, HEADER_SIZE, SEGMENT_SIZE, FRAME_PREFIX
+from .compression import choose_codec, compression_stats
+from .block_store import FileBlockStore
+from .block_index import BlockIndex
+from .packfile import PackBlockStore
+from .worker_pools import run_cpu
+from .telemetry import io_counters
+from .block_cache import BlockCache
 
 # Chemins de stockage
 STORAGE_ROOT = os.getenv("STORAGE_ROOT", "/data")
 BLOCKS_DIR = os.path.join(STORAGE_ROOT, "blocks")
+PACK_DIR = os.path.join(STORAGE_ROOT, "packs")
+INDEX_DIR = os.path.join(STORAGE_ROOT, "index")
 TEMP_DIR = os.path.join(STORAGE_ROOT, "tmp")
+SCRUB_DIR = os.path.join(STORAGE_ROOT, "scrub")
+QUARANTINE_DIR = os.path.join(STORAGE_ROOT, "quarantine")
+
+# Backend de stockage des blocs : "files" (un fichier par bloc) ou "pack" (log-structured)
+BLOCK_BACKEND = os.getenv("NODE_BLOCK_BACKEND", "files")
+
+# Tiers de capacité (backend "files") : STORAGE_ROOT est le tier rapide, puis ces
+# dossiers par ordre de priorité, ex: NODE_TIER_DIRS=/mnt/hdd1,/mnt/hdd2
+TIER_DIRS = [os.path.join(d, "blocks") for d in os.getenv("NODE_TIER_DIRS", "").split(",") if d.strip()]
 
 # Création des dossiers au démarrage
 os.makedirs(BLOCKS_DIR, exist_ok=True)
@@ -18,82 +35,261 @@ os.makedirs(TEMP_DIR, exist_ok=True)
 
 logger = logging.getLogger("node.dedup")
 
+def make_block_store(backend: str = BLOCK_BACKEND):
+    """Instancie le backend configuré pour ce node"""
+    if backend == "pack":
+        return PackBlockStore(PACK_DIR, TEMP_DIR)
+    if backend == "files":
+        # Index absent : le scan est fait par l'agent en tâche de fond (store.recover)
+        return FileBlockStore(BLOCKS_DIR, TEMP_DIR, index=BlockIndex(INDEX_DIR), tier_dirs=TIER_DIRS, scan_on_init=False)
+    raise ValueError(f"Unknown block backend: {backend}")
+
+async def _read(reader, offset: int, n: int) -> bytes:
+    """Lecture dans un bloc stocké, comptée pour la télémétrie (octets/s)"""
+    data = await reader.read(offset, n)
+    io_counters.read_bytes += len(data)
+    return data
+
+class BlockWriter:
+    """
+    Écriture d'un bloc en streaming.
+    Chaque chunk reçu est haché (SHA-256 incrémental), compressé si le début
+    du bloc s'y prête, chiffré puis ajouté à la zone de staging du backend :
+    la mémoire consommée est bornée par la taille d'un chunk, pas par la
+    taille du bloc. Le hash porte toujours sur le clair (dédup inchangée).
+    """
+    def __init__(self, store):
+        self._store = store
+        self._hasher = hashlib.sha256()
+        # Le codec (inscrit dans le header) dépend des premiers octets reçus
+        self._encryptor = None
+        # Le hash n'est connu qu'à la fin du stream : staging anonyme
+        self._staging = store.open_staging()
+        self.plain_size = 0
+
+    async def _ensure_started(self, sample: bytes = b""):
+        if self._encryptor is None:
+            self._encryptor = local_cipher.stream_encryptor(choose_codec(sample))
+            await self._put(self._encryptor.header())
+
+    async def _put(self, data: bytes):
+        await self._staging.write(data)
+        io_counters.write_bytes += len(data)
+
+    def _absorb(self, data: bytes) -> bytes:
+        # Hash + chiffrement : exécuté dans le pool CPU (hashlib/AES relâchent le GIL)
+        self._hasher.update(data)
+        return self._encryptor.update(data)
+
+    async def write(self, data: bytes):
+        """Ajoute un chunk en clair au bloc"""
+        await self._ensure_started(data)
+        self.plain_size += len(data)
+        # Un segment complet (compression + AES) peut être scellé par un petit chunk
+        await self._put(await run_cpu(self._absorb, data, size=self._encryptor.pending_bytes + len(data)))
+
+    async def commit(self, expected_hash: Optional[str] = None) -> Tuple[str, bool, int]:
+        """
+        Finalise le bloc : tag GCM, vérif de déduplication puis publication
+        durable via le backend (rename atomique ou append dans un pack).
+        Retourne: (hash_id, is_new_write, size_on_disk)
+        """
+        try:
+            await self._ensure_started()
+            await self._put(await run_cpu(self._encryptor.finalize, size=self._encryptor.pending_bytes))
+
+            content_hash = self._hasher.hexdigest()
+            if expected_hash and expected_hash != content_hash:
+                raise ValueError(f"Hash mismatch (expected {expected_hash}, got {content_hash})")
+
+            is_new, size = await self._store.commit(self._staging, content_hash)
+            if is_new:
+                logger.info(f"💾 Block written: {content_hash} ({size} bytes)")
+            else:
+                logger.info(f"♻️  Dedup hit: {content_hash}")
+            return content_hash, is_new, size
+
+        except Exception as e:
+            await self.abort()
+            raise IOError(f"Write failed: {str(e)}")
+
+    async def abort(self):
+        """Nettoyage en cas d'erreur ou de stream interrompu"""
+        await self._staging.discard()
+
 class DedupEngine:
+    def __init__(self, store=None, cache: Optional[BlockCache] = None):
+        self.store = store or make_block_store()
+        self.cache = cache if cache is not None else BlockCache()
+
     @staticmethod
     def calculate_hash(data: bytes) -> str:
         """SHA-256 performant"""
         return hashlib.sha256(data).hexdigest()
+    def has_block(self, content_hash: str) -> bool:
+        """Dédup hit/miss répondu par l'index en mémoire (aucun accès disque)"""
+        return self.store.exists(content_hash)
+
+    def has_blocks(self, hashes: List[str]) -> List[bool]:
+        """Présence d'un lot de blocs (index en mémoire). Un hash invalide est absent."""
+        found = []
+        for content_hash in hashes:
+            try:
+                found.append(self.store.exists(content_hash))
+            except ValueError:
+                found.append(False)
+        return found
+
+    async def touch_blocks(self, hashes: List[str]):
+        """Rajeunit les blocs présents du lot : le GC ne les supprimera pas pendant sa période de grâce"""
+        present = [h for h, found in zip(hashes, self.has_blocks(hashes)) if found]
+        if present:
+            await self.store.touch(present)
+
+    def stats(self) -> dict:
+        """Nombre de blocs et octets stockés, pour le HealthCheck"""
+        return self.store.stats()
+
+    def startup_stats(self) -> dict:
+        """Avancement du démarrage (chargement de l'index ou scan), pour le HealthCheck"""
+        return self.store.recovery.stats()
+
+    def tier_stats(self) -> List[dict]:
+        """Capacité et occupation par tier de stockage, pour le HealthCheck"""
+        return self.store.tier_stats()
+
+    def open_writer(self) -> BlockWriter:
+        """Ouvre une écriture en streaming (utilisée par UploadBlock)"""
+        return BlockWriter(self.store)
 
     async def write_block(self, data: bytes) -> Tuple[str, bool, int]:
         """
         Écrit un bloc de données de manière dédupliquée et chiffrée.
         Retourne: (hash_id, is_new_write, size_on_disk)
         """
-        # 1. Calcul du Hash sur la donnée EN CLAIR (pour la déduplication logique)
-        content_hash = self.calculate_hash(data)
-        
-        # Structure de dossier "sharding" pour éviter 1M de fichiers dans un dossier
-        # ex: /data/blocks/a/f/af45e...
-        subdir = os.path.join(BLOCKS_DIR, content_hash[:2])
-        os.makedirs(subdir, exist_ok=True)
-        final_path = os.path.join(subdir, content_hash)
-
-        # 2. Vérification d'existence (Deduplication Hit)
-        if os.path.exists(final_path):
-            logger.info(f"♻️  Dedup hit: {content_hash}")
-            # On retourne la taille existante
-            return content_hash, False, os.path.getsize(final_path)
-
-        # 3. Chiffrement (Security at Rest)
-        encrypted_data = local_cipher.encrypt_block(data)
-
-        # 4. Écriture Atomique (Crash-safe)
-        # On écrit d'abord dans un fichier temporaire
-        temp_path = os.path.join(TEMP_DIR, f"tmp_{content_hash}")
-        
-        try:
-            async with aiofiles.open(temp_path, mode='wb') as f:
-                await f.write(encrypted_data)
-                await f.flush()
-                # Force l'écriture physique sur le disque
-                os.fsync(f.fileno()) 
-            
-            # Renommage atomique : c'est instantané et sûr
-            os.rename(temp_path, final_path)
-            
-            logger.info(f"💾 Block written: {content_hash} ({len(encrypted_data)} bytes)")
-            return content_hash, True, len(encrypted_data)
-            
-        except Exception as e:
-            # Nettoyage en cas d'erreur
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-            raise IOError(f"Write failed: {str(e)}")
+        writer = self.open_writer()
+        await writer.write(data)
+        return await writer.commit()
 
     async def read_block(self, content_hash: str) -> bytes:
         """Lit, déchiffre et renvoie les données"""
-        subdir = os.path.join(BLOCKS_DIR, content_hash[:2])
-        path = os.path.join(subdir, content_hash)
+        parts = [part async for part in self.stream_block(content_hash)]
+        return b"".join(parts)
 
-        if not os.path.exists(path):
+    async def _use_cache(self, content_hash: str) -> bool:
+        if content_hash in self.cache:
+            return True
+        if not self.cache.enabled:
+            return False
+        try:
+            return self.cache.cacheable(await self.store.stored_size(content_hash))
+        except KeyError:
             raise FileNotFoundError(f"Block {content_hash} missing on this node")
 
-        async with aiofiles.open(path, mode='rb') as f:
-            encrypted_data = await f.read()
+    async def _load_block(self, content_hash: str) -> bytes:
+        return b"".join([part async for part in self._stream_stored(content_hash, 0, -1)])
+
+    async def stream_block(self, content_hash: str, offset: int = 0, length: int = -1, cached: bool = True) -> AsyncIterator[bytes]:
+        """
+        Yield le clair du bloc (ou de [offset, offset + length)) au fil de l'eau.
+        length < 0 : jusqu'à la fin du bloc.
+        Les blocs assez petits passent par le cache des blocs chauds (déchiffrés
+        une seule fois) et comptent dans la chaleur du bloc (tiering).
+        cached=False : lecture disque qui ne touche ni au cache ni à la chaleur
+        (scrubber, réplication).
+        """
+        if cached:
+            self.store.record_access(content_hash)
+        if cached and await self._use_cache(content_hash):
+            data = await self.cache.get(content_hash, lambda: self._load_block(content_hash))
+            end = len(data) if length < 0 else min(len(data), offset + length)
+            for i in range(offset, end, SEGMENT_SIZE):
+                yield data[i:min(i + SEGMENT_SIZE, end)]
+            return
+        async for piece in self._stream_stored(content_hash, offset, length):
+            yield piece
+
+    async def _stream_stored(self, content_hash: str, offset: int, length: int) -> AsyncIterator[bytes]:
+        """
+        Déchiffre le bloc segment par segment depuis le disque.
+        Seuls les segments couvrant [offset, offset + length) sont lus.
+        """
+        async with self.store.open_reader(content_hash) as reader:
+            header = parse_header(await _read(reader, 0, HEADER_SIZE))
 
-        # Déchiffrement à la volée
-        return local_cipher.decrypt_block(encrypted_data)
+            # Blob v1 (legacy) : un seul tag pour tout le bloc, lecture complète obligatoire
+            if header is None:
+                data = await run_cpu(local_cipher.decrypt_block, await _read(reader, 0, reader.size), size=reader.size)
+                end = len(data) if length < 0 else min(len(data), offset + length)
+                for i in range(offset, end, SEGMENT_SIZE):
+                    yield data[i:min(i + SEGMENT_SIZE, end)]
+                return
+
+            if header.framed:
+                async for piece in self._stream_framed(reader, header, offset, length):
+                    yield piece
+                return
+
+            plain_size = header.plaintext_size(reader.size)
+            end = plain_size if length < 0 else min(plain_size, offset + length)
+            if offset >= end:
+                return
+
+            count = header.segment_count(reader.size)
+            first = offset // header.segment_size
+            last = (end - 1) // header.segment_size
+
+            for index in range(first, last + 1):
+                segment = await _read(reader, header.segment_offset(index), header.encrypted_segment_size)
+                plain = await run_cpu(
+                    local_cipher.decrypt_segment, header, index, segment, index == count - 1, size=len(segment)
+                )
+
+                # Découpe du premier / dernier segment pour coller au range demandé
+                seg_start = index * header.segment_size
+                lo = max(offset - seg_start, 0)
+                hi = min(end - seg_start, len(plain))
+                yield plain[lo:hi]
+
+    @staticmethod
+    async def _stream_framed(reader, header, offset: int, length: int) -> AsyncIterator[bytes]:
+        """
+        Bloc compressé : les segments chiffrés ont une taille variable, on les
+        parcourt grâce à leur préfixe. Les segments avant le range ne sont pas lus
+        (seulement leur préfixe), chaque segment couvre toujours segment_size de clair.
+        """
+        if length == 0:
+            return
+        end = None if length < 0 else offset + length
+        pos, index = header.size, 0
+        while pos < reader.size:
+            (size,) = FRAME_PREFIX.unpack(await _read(reader, pos, FRAME_PREFIX.size))
+            seg_pos, pos = pos + FRAME_PREFIX.size, pos + FRAME_PREFIX.size + size
+            seg_start = index * header.segment_size
+            index += 1
+            if seg_start + header.segment_size <= offset:
+                continue
+
+            segment = await _read(reader, seg_pos, size)
+            plain = await run_cpu(
+                local_cipher.decrypt_segment, header, index - 1, segment, pos >= reader.size, size=len(segment)
+            )
+            lo = max(offset - seg_start, 0)
+            hi = len(plain) if end is None else min(end - seg_start, len(plain))
+            if lo < hi:
+                yield plain[lo:hi]
+            if end is not None and seg_start + len(plain) >= end:
+                return
+
+    def compression_stats(self) -> dict:
+        """Ratio et temps CPU de compression, pour le HealthCheck"""
+        return compression_stats.snapshot()
 
     async def delete_block(self, content_hash: str):
         """
-        Suppression physique.
-        Note: Dans un vrai système CAS, on utilise un Reference Counting 
-        avant de supprimer vraiment. Ici, on simplifie (Hard Delete).
+        Suppression physique, sans aucune vérification de références.
+        Les compteurs de références vivent dans la base de métadonnées :
+        seul le GC (mark & sweep, voir garbage_collector.py) doit l'appeler.
         """
-        subdir = os.path.join(BLOCKS_DIR, content_hash[:2])
-        path = os.path.join(subdir, content_hash)
-        
-        if os.path.exists(path):
-            os.remove(path)
-            return True
-        return False
\ No newline at end of file
+        self.cache.invalidate(content_hash)
+        return await self.store.delete(content_hash)
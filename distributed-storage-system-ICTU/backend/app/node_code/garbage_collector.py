@@ -0,0 +1,121 @@
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from .block_index import BloomFilter
+from .worker_pools import io_pool
+
+# --- CONFIGURATION DU GC ---
+GC_BATCH_SIZE = int(os.getenv("NODE_GC_BATCH_SIZE", 1000))              # Suppressions par lot
+GC_BATCH_PAUSE_MS = float(os.getenv("NODE_GC_BATCH_PAUSE_MS", 50))      # Pause entre deux lots
+GC_GRACE_SECONDS = int(os.getenv("NODE_GC_GRACE_SECONDS", 3600))        # Âge minimum d'un bloc supprimable
+GC_YIELD_EVERY = 10_000                                                 # Hash examinés entre deux yields
+
+logger = logging.getLogger("node.gc")
+
+@dataclass
+class GCReport:
+    freed_bytes: int = 0
+    blocks_scanned: int = 0
+    blocks_deleted: int = 0
+    temp_files_removed: int = 0
+
+class GarbageCollector:
+    """
+    Mark & sweep des blocs du node.
+    Le "mark" est fait par l'orchestrateur, qui envoie un filtre de Bloom des
+    blocs référencés en base (refcount > 0) : quelques octets par bloc, quelle
+    que soit la taille du cluster. Le "sweep" parcourt les blocs locaux et
+    supprime ceux absents du filtre. Un faux positif ne fait que conserver un
+    bloc mort jusqu'au prochain passage (seed différent) : jamais de perte.
+
+    Un bloc écrit ou dédupliqué pendant la période de grâce n'est jamais
+    supprimé : son fichier peut ne pas encore être enregistré en base.
+    """
+    def __init__(self, store, temp_dir: str, on_delete: Optional[Callable[[str], None]] = None):
+        self.store = store
+        self.temp_dir = temp_dir
+        self.on_delete = on_delete    # Invalidation du cache des blocs déchiffrés
+        self._lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    async def collect(self, live: BloomFilter, grace_seconds: int = GC_GRACE_SECONDS, aggressive: bool = False) -> GCReport:
+        async with self._lock:
+            started = time.time()
+            cutoff = started - max(grace_seconds, 0)
+            pause = 0 if aggressive else GC_BATCH_PAUSE_MS / 1000
+            report = GCReport()
+            logger.info(f"🗑️  GC started (grace={grace_seconds}s, aggressive={aggressive})")
+
+            batch = []
+            for content_hash in self.store.iter_hashes():
+                report.blocks_scanned += 1
+                if bytes.fromhex(content_hash) not in live:
+                    batch.append(content_hash)
+                if len(batch) >= GC_BATCH_SIZE:
+                    await self._sweep(batch, cutoff, report)
+                    batch = []
+                    await asyncio.sleep(pause)
+                elif report.blocks_scanned % GC_YIELD_EVERY == 0:
+                    # Le test d'appartenance est du pur CPU : on rend la main aux RPC
+                    await asyncio.sleep(0)
+            if batch:
+                await self._sweep(batch, cutoff, report)
+
+            await io_pool.run(self._sweep_temp, cutoff, report)
+
+            if hasattr(self.store, "prune_touched"):
+                self.store.prune_touched(cutoff)
+            if aggressive and hasattr(self.store, "compact"):
+                # Backend pack : l'espace n'est rendu au disque qu'à la compaction
+                await self.store.compact()
+
+            logger.info(
+                f"🗑️  GC done in {time.time() - started:.1f}s: {report.blocks_deleted}/{report.blocks_scanned} "
+                f"blocks deleted, {report.temp_files_removed} temp files, {report.freed_bytes} bytes freed"
+            )
+            return report
+
+    async def _sweep(self, batch, cutoff: float, report: GCReport):
+        # Dates disque du lot lues dans le pool I/O (un stat par bloc ou par pack)
+        mtimes = await self.store.last_modified_many(batch)
+        for content_hash, mtime in zip(batch, mtimes):
+            # 0 : absent au moment du stat, un commit a pu le recréer depuis
+            if mtime == 0 or mtime > cutoff:
+                continue
+            try:
+                size = await self.store.stored_size(content_hash)
+            except (KeyError, FileNotFoundError):
+                continue
+            # Un dédup hit est noté en mémoire sans await : vérifié juste avant la
+            # suppression (retrait de l'index synchrone), il passe soit avant
+            # (bloc rajeuni, conservé) soit après (réécrit)
+            if self.store.touched_at(content_hash) > cutoff or not self.store.exists(content_hash):
+                continue
+            if self.on_delete is not None:
+                self.on_delete(content_hash)
+            if await self.store.delete(content_hash):
+                report.blocks_deleted += 1
+                report.freed_bytes += size
+
+    def _sweep_temp(self, cutoff: float, report: GCReport):
+        """Staging orphelins (upload interrompu, crash) laissés dans TEMP_DIR. Bloquant : pool I/O"""
+        with os.scandir(self.temp_dir) as entries:
+            for entry in entries:
+                if not entry.name.startswith("tmp_") or not entry.is_file():
+                    continue
+                try:
+                    stat = entry.stat()
+                    if stat.st_mtime > cutoff:
+                        continue  # Upload probablement encore en cours
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+                report.temp_files_removed += 1
+                report.freed_bytes += stat.st_size
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+from typing import Any, Callable, List, Optional
+
+from .worker_pools import io_pool
+from .io_scheduler import io_class, INTERACTIVE_WRITE
+
+logger = logging.getLogger("node.group_commit")
+
+class GroupCommitter:
+    """
+    Regroupe les fsync de plusieurs écritures concurrentes.
+    Chaque écrivain soumet un élément puis attend ; le committer vide le lot
+    toutes les `interval_ms` (ou dès que `max_bytes` sont en attente) en un seul
+    appel à `flush`, exécuté dans le pool I/O, et acquitte tout le monde.
+    Si le flush échoue, toutes les écritures du lot reçoivent l'erreur.
+
+    siblings (optionnel) : nombre d'écritures en cours qui n'ont pas encore
+    soumis. À 0, attendre ne grossirait pas le lot : il part immédiatement.
+    """
+    def __init__(
+        self,
+        flush: Callable[[List[Any]], None],
+        interval_ms: float,
+        max_bytes: int,
+        name: str = "commit",
+        siblings: Optional[Callable[[], int]] = None,
+    ):
+        self._flush = flush
+        self._siblings = siblings
+        self.interval = interval_ms / 1000.0
+        self.max_bytes = max_bytes
+        self.name = name
+        self._batch: List[Any] = []
+        self._waiters: List[asyncio.Future] = []
+        self._pending_bytes = 0
+        self._kick: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        # Stats exposées pour les benchmarks / métriques
+        self.flushes = 0
+        self.items_committed = 0
+
+    async def submit(self, item: Any, nbytes: int = 0) -> None:
+        """Ajoute un élément au lot courant et attend qu'il soit durable"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._batch.append(item)
+        self._waiters.append(future)
+        self._pending_bytes += nbytes
+
+        if self._kick is None:
+            self._kick = asyncio.Event()
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+        if self._pending_bytes >= self.max_bytes or self._alone():
+            self._kick.set()
+
+        await future
+
+    def _alone(self) -> bool:
+        return self._siblings is not None and self._siblings() <= 0
+
+    async def _run(self):
+        # Un lot mélange les écritures de toutes les classes : il ne doit pas attendre le budget d'une classe de fond
+        io_class.set(INTERACTIVE_WRITE)
+        while self._batch:
+            # Fenêtre de regroupement : on laisse arriver les écritures concurrentes
+            if self.interval > 0 and self._pending_bytes < self.max_bytes and not self._alone():
+                try:
+                    await asyncio.wait_for(self._kick.wait(), timeout=self.interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._kick.clear()
+
+            batch, waiters = self._batch, self._waiters
+            self._batch, self._waiters, self._pending_bytes = [], [], 0
+
+            try:
+                await io_pool.run(self._flush, batch)
+            except Exception as e:
+                logger.error(f"❌ Group commit '{self.name}' failed ({len(batch)} writes): {e}")
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+                continue
+
+            self.flushes += 1
+            self.items_committed += len(batch)
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
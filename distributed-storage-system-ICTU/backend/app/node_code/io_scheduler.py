@@ -0,0 +1,190 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from contextvars import ContextVar
+from typing import Deque, Dict, Optional
+
+from .telemetry import LatencyWindow
+
+# --- CLASSES DE TRAFIC ---
+INTERACTIVE_READ = "interactive_read"      # DownloadBlock client
+INTERACTIVE_WRITE = "interactive_write"    # UploadBlock client
+REPLICATION = "replication"                # ReplicateTo, réparations, re-réplication
+MAINTENANCE = "maintenance"                # Scrubber, GC, tiering, compaction
+IO_CLASSES = (INTERACTIVE_READ, INTERACTIVE_WRITE, REPLICATION, MAINTENANCE)
+
+# Indication de classe posée par l'appelant dans les métadonnées gRPC
+IO_CLASS_METADATA = "x-io-class"
+
+def _parse_weights(spec: str) -> Dict[str, float]:
+    weights = {}
+    for item in spec.split(","):
+        name, _, value = item.partition("=")
+        if name.strip() in IO_CLASSES and value:
+            weights[name.strip()] = float(value)
+    return weights
+
+# --- CONFIGURATION DE LA QOS ---
+QOS_ENABLED = os.getenv("NODE_QOS_ENABLED", "true").lower() == "true"
+QOS_WEIGHTS = {
+    INTERACTIVE_READ: 8.0, INTERACTIVE_WRITE: 4.0, REPLICATION: 2.0, MAINTENANCE: 1.0,
+    **_parse_weights(os.getenv("NODE_QOS_WEIGHTS", "")),   # ex: "replication=4,maintenance=1"
+}
+# Plafonds de débit des classes de fond (0 = pas de plafond)
+QOS_REPLICATION_MB_PER_SEC = float(os.getenv("NODE_QOS_REPLICATION_MB_PER_SEC", 100))
+QOS_MAINTENANCE_MB_PER_SEC = float(os.getenv("NODE_QOS_MAINTENANCE_MB_PER_SEC", 40))
+QOS_BURST_SECONDS = float(os.getenv("NODE_QOS_BURST_SECONDS", 0.5))   # Rafale tolérée
+MIN_COST = 4096    # Coût plancher d'un appel (open, close, rename...)
+
+# Classe des I/O de la tâche courante (hérité par les tâches qu'elle crée)
+io_class: ContextVar[str] = ContextVar("io_class", default=INTERACTIVE_READ)
+
+logger = logging.getLogger("node.qos")
+
+def request_class(context, default: str) -> str:
+    """Classe d'un RPC : l'indication x-io-class de l'appelant, sinon celle de la méthode"""
+    for key, value in context.invocation_metadata() or ():
+        if key == IO_CLASS_METADATA and value in IO_CLASSES:
+            return value
+    return default
+
+class TokenBucket:
+    """Seau à jetons en octets : débit moyen rate, rafale de burst octets"""
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(burst, MIN_COST)
+        self.tokens = self.burst
+        self._last = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def delay(self, cost: int, now: float) -> float:
+        """Secondes à attendre avant de pouvoir servir cost (0 = tout de suite)"""
+        self._refill(now)
+        # Une requête plus grosse que la rafale passe dès que le seau est plein (dette)
+        missing = min(cost, self.burst) - self.tokens
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, cost: int):
+        self.tokens -= cost
+
+class _Request:
+    __slots__ = ("io_class", "cost", "finish", "future", "enqueued")
+
+    def __init__(self, io_class: str, cost: int, finish: float, future: asyncio.Future):
+        self.io_class = io_class
+        self.cost = cost
+        self.finish = finish
+        self.future = future
+        self.enqueued = time.monotonic()
+
+class IoScheduler:
+    """
+    Ordonnanceur des I/O disque du node, devant le pool I/O.
+    Au plus `slots` appels sont confiés aux threads ; les autres attendent
+    dans une file par classe de trafic. Quand un slot se libère, la file
+    servie est choisie par Weighted Fair Queuing (plus petit temps de fin
+    virtuel, coût = octets / poids) : sous contention, chaque classe obtient
+    sa part du disque, et une rafale de réplication ne fait plus exploser la
+    latence des DownloadBlock. Les classes de fond ont en plus un seau à
+    jetons qui plafonne leur débit même quand le disque est libre.
+    Tout est appelé depuis l'event loop : pas de verrou.
+    """
+    def __init__(self, slots: int, weights: Optional[Dict[str, float]] = None):
+        self.slots = slots
+        self.free = slots
+        self.weights = weights or QOS_WEIGHTS
+        self.buckets: Dict[str, TokenBucket] = {}
+        for name, rate in ((REPLICATION, QOS_REPLICATION_MB_PER_SEC), (MAINTENANCE, QOS_MAINTENANCE_MB_PER_SEC)):
+            if rate > 0:
+                bytes_per_sec = rate * 1024 * 1024
+                self.buckets[name] = TokenBucket(bytes_per_sec, bytes_per_sec * QOS_BURST_SECONDS)
+        self._queues: Dict[str, Deque[_Request]] = {name: deque() for name in IO_CLASSES}
+        self._last_finish: Dict[str, float] = {name: 0.0 for name in IO_CLASSES}
+        self._vtime = 0.0
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+
+        self.active: Dict[str, int] = {name: 0 for name in IO_CLASSES}
+        self.completed: Dict[str, int] = {name: 0 for name in IO_CLASSES}
+        self.bytes: Dict[str, int] = {name: 0 for name in IO_CLASSES}
+        self.waits: Dict[str, LatencyWindow] = {name: LatencyWindow() for name in IO_CLASSES}
+
+    async def acquire(self, cost: int) -> str:
+        """Attend un slot pour un appel de cost octets ; retourne la classe à passer à release()"""
+        name = io_class.get()
+        cost = max(cost, MIN_COST)
+        start = max(self._vtime, self._last_finish[name])
+        self._last_finish[name] = start + cost / self.weights.get(name, 1.0)
+        request = _Request(name, cost, self._last_finish[name], asyncio.get_running_loop().create_future())
+        self._queues[name].append(request)
+        self._dispatch()
+        try:
+            await request.future
+        except asyncio.CancelledError:
+            if request.future.done() and not request.future.cancelled():
+                self.release(name)      # Slot accordé pendant l'annulation : on le rend
+            else:
+                self._queues[name].remove(request)
+            raise
+        return name
+
+    def release(self, name: str):
+        self.active[name] -= 1
+        self.completed[name] += 1
+        self.free += 1
+        self._dispatch()
+
+    def _dispatch(self):
+        now = time.monotonic()
+        while self.free > 0:
+            best, retry = None, None
+            for name, queue in self._queues.items():
+                if not queue:
+                    continue
+                request = queue[0]
+                bucket = self.buckets.get(name)
+                wait = bucket.delay(request.cost, now) if bucket is not None else 0.0
+                if wait > 0:
+                    retry = wait if retry is None else min(retry, wait)
+                elif best is None or request.finish < best.finish:
+                    best = request
+            if best is None:
+                if retry is not None and self._wakeup is None:
+                    self._wakeup = asyncio.get_running_loop().call_later(retry, self._on_wakeup)
+                return
+
+            self._queues[best.io_class].popleft()
+            if best.io_class in self.buckets:
+                self.buckets[best.io_class].take(best.cost)
+            self._vtime = max(self._vtime, best.finish - best.cost / self.weights.get(best.io_class, 1.0))
+            self.free -= 1
+            self.active[best.io_class] += 1
+            self.bytes[best.io_class] += best.cost
+            self.waits[best.io_class].observe(now - best.enqueued)
+            best.future.set_result(None)
+
+    def _on_wakeup(self):
+        self._wakeup = None
+        self._dispatch()
+
+    def stats(self) -> list:
+        """Profondeur de file et attente par classe, pour le HealthCheck"""
+        classes = []
+        for name in IO_CLASSES:
+            wait_ms = self.waits[name].percentiles(0.5, 0.99)
+            classes.append({
+                "name": name,
+                "weight": self.weights.get(name, 1.0),
+                "queued": len(self._queues[name]),
+                "active": self.active[name],
+                "completed": self.completed[name],
+                "bytes": self.bytes[name],
+                "wait_p50_ms": wait_ms[0.5],
+                "wait_p99_ms": wait_ms[0.99],
+                "rate_limit_bytes_per_sec": int(self.buckets[name].rate) if name in self.buckets else 0,
+            })
+        return classes
@@ -0,0 +1,70 @@
+import os
+import json
+import time
+import logging
+from typing import Optional
+
+# --- CONFIGURATION ---
+# En dessous de cet espace libre, le node se déclare FULL (plus de nouveaux blocs)
+FULL_FREE_BYTES = int(os.getenv("NODE_FULL_FREE_BYTES", 1024 ** 3))
+
+STATUS_SERVING = "SERVING"
+STATUS_FULL = "FULL"
+STATUS_MAINTENANCE = "MAINTENANCE"
+STATUS_STARTING = "STARTING"      # Index des blocs en reconstruction : pas de nouvelles écritures
+
+logger = logging.getLogger("node.maintenance")
+
+class MaintenanceMode:
+    """
+    Mode maintenance (lecture seule) du node : les lectures continuent, les
+    écritures (UploadBlock, GC) sont refusées. L'état est persisté pour qu'un
+    node en cours de drain ne se remette pas à accepter des blocs après un
+    redémarrage.
+    """
+    def __init__(self, state_dir: str):
+        self.path = os.path.join(state_dir, "maintenance.json")
+        self.reason: Optional[str] = None
+        self.since = 0.0
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+            self.reason, self.since = state.get("reason", ""), state.get("since", 0.0)
+            logger.warning(f"🚧 Node starting in maintenance mode ({self.reason or 'no reason'})")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.error(f"❌ Unreadable maintenance state, staying read-only: {e}")
+            self.reason, self.since = "unreadable maintenance state", time.time()
+
+    @property
+    def enabled(self) -> bool:
+        return self.reason is not None
+
+    def set(self, enable: bool, reason: str = ""):
+        if enable:
+            self.reason, self.since = reason, time.time()
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"reason": reason, "since": self.since}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            logger.warning(f"🚧 Maintenance mode enabled: {reason or 'no reason'}")
+        else:
+            self.reason, self.since = None, 0.0
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            logger.info("✅ Maintenance mode disabled")
+
+    def status(self, disk_free: int, ready: bool = True) -> str:
+        """Statut annoncé dans le HealthCheck (utilisé par le LoadBalancer)"""
+        if self.enabled:
+            return STATUS_MAINTENANCE
+        if not ready:
+            return STATUS_STARTING
+        if disk_free < FULL_FREE_BYTES:
+            return STATUS_FULL
+        return STATUS_SERVING
@@ -0,0 +1,542 @@
+import os
+import asyncio
+import logging
+import struct
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from .block_store import RecoveryProgress
+from .group_commit import GroupCommitter
+from .telemetry import fsync
+from .worker_pools import io_pool
+
+# --- CONFIGURATION DU BACKEND PACKFILE ---
+PACK_MAX_SIZE = int(os.getenv("PACK_MAX_SIZE", 1024 ** 3))                        # 1GB par segment
+PACK_SPOOL_SIZE = int(os.getenv("PACK_SPOOL_SIZE", 4 * 1024 * 1024))              # Staging en RAM
+PACK_COMMIT_INTERVAL_MS = float(os.getenv("PACK_COMMIT_INTERVAL_MS", 5))          # Fenêtre group commit
+PACK_COMMIT_MAX_BYTES = int(os.getenv("PACK_COMMIT_MAX_BYTES", 16 * 1024 * 1024))
+PACK_COMPACT_INTERVAL = int(os.getenv("PACK_COMPACT_INTERVAL", 600))              # Secondes
+PACK_COMPACT_DEAD_RATIO = float(os.getenv("PACK_COMPACT_DEAD_RATIO", 0.5))
+
+# Record dans un pack : [magic][hash brut 32B][longueur payload][payload chiffré]
+# Les records sont auto-descriptifs : l'index peut être reconstruit en rescannant les packs.
+RECORD_MAGIC = b"NXPK"
+_RECORD = struct.Struct(">4s32sQ")
+# Entrée du journal d'index : op, hash brut, pack_id, offset du payload, longueur (53 octets)
+_ENTRY = struct.Struct(">B32sIQQ")
+OP_PUT = 1
+OP_DEL = 2
+INDEX_JOURNAL = "index.journal"
+COPY_CHUNK_SIZE = 1024 * 1024
+
+logger = logging.getLogger("node.packfile")
+
+@dataclass
+class Pack:
+    pack_id: int
+    path: str
+    fd: int
+    size: int = 0   # Prochain offset libre (append-only)
+    live: int = 0   # Octets encore référencés par l'index (header + payload)
+    # Hash dont l'entrée d'index pointe dans ce pack : la compaction n'a pas à parcourir tout l'index
+    blocks: Set[str] = field(default_factory=set)
+
+    @property
+    def dead(self) -> int:
+        return self.size - self.live
+
+class PackStaging:
+    """
+    Bloc préparé avant append dans le pack.
+    Les petits blocs restent en RAM, les gros débordent dans TEMP_DIR.
+    """
+    def __init__(self, temp_dir: str):
+        self._spool = tempfile.SpooledTemporaryFile(max_size=PACK_SPOOL_SIZE, dir=temp_dir, prefix="tmp_")
+        self.size = 0
+
+    async def write(self, data: bytes):
+        if data:
+            if self.size + len(data) > PACK_SPOOL_SIZE:
+                # Le spool a débordé sur le disque : écriture bloquante, dans le pool I/O
+                await io_pool.run(self._spool.write, data, cost=len(data))
+            else:
+                self._spool.write(data)
+            self.size += len(data)
+
+    async def close(self, sync: bool = True):
+        # La durabilité est assurée par le fsync groupé du pack
+        pass
+
+    async def discard(self):
+        self._spool.close()
+
+    def chunks(self) -> Iterator[bytes]:
+        self._spool.seek(0)
+        while True:
+            chunk = self._spool.read(COPY_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+class PackBlockReader:
+    """Accès aléatoire au payload d'un bloc à l'intérieur de son pack"""
+    def __init__(self, store: "PackBlockStore", content_hash: str):
+        self._store = store
+        self._hash = content_hash
+        self._fd = None
+        self._base = 0
+        self.size = 0
+
+    async def __aenter__(self):
+        # Deux tentatives : une compaction a pu déplacer le bloc et supprimer l'ancien pack
+        for attempt in range(2):
+            loc = self._store._index.get(self._hash)
+            if loc is None:
+                raise FileNotFoundError(f"Block {self._hash} missing on this node")
+            pack_id, offset, length = loc
+            try:
+                self._fd = await io_pool.run(os.open, self._store._pack_path(pack_id), os.O_RDONLY)
+                break
+            except FileNotFoundError:
+                if attempt:
+                    raise
+        self._base, self.size = offset, length
+        return self
+
+    async def read(self, offset: int, n: int) -> bytes:
+        n = max(0, min(n, self.size - offset))
+        return await io_pool.run(os.pread, self._fd, n, self._base + offset, cost=n)
+
+    async def __aexit__(self, *exc):
+        os.close(self._fd)
+
+class PackBlockStore:
+    """
+    Backend log-structured : les blocs sont ajoutés en fin de gros fichiers
+    packs/pack-NNNNNN.dat. Un index compact hash -> (pack, offset, longueur)
+    est tenu en mémoire et persisté dans un journal append-only.
+    Les fsync sont groupés (group commit) et une compaction en tâche de fond
+    récupère l'espace des blocs supprimés.
+    """
+    name = "pack"
+
+    def __init__(self, pack_dir: str, temp_dir: str):
+        self.pack_dir = pack_dir
+        self.temp_dir = temp_dir
+        os.makedirs(pack_dir, exist_ok=True)
+
+        self._index: Dict[str, Tuple[int, int, int]] = {}
+        self._packs: Dict[int, Pack] = {}
+        self._active: Optional[Pack] = None
+        # Protège l'index et le journal (le flush groupé tourne dans un thread)
+        self._lock = threading.Lock()
+        # Une réécriture du journal à la fois (compaction de fond et GC)
+        self._rewrite_lock = threading.Lock()
+        # Écritures en cours par hash : un second upload du même bloc attend le premier
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Derniers dédup hits (les records n'ont pas de date propre) : hash -> timestamp
+        self._touched: Dict[str, float] = {}
+        # Entrées journalisées par _flush mais pas encore publiées (fsync en cours)
+        self._unpublished: Dict[str, Tuple[int, int, int]] = {}
+        self._committer = GroupCommitter(
+            self._flush, PACK_COMMIT_INTERVAL_MS, PACK_COMMIT_MAX_BYTES, name="pack"
+        )
+        self._journal_path = os.path.join(pack_dir, INDEX_JOURNAL)
+
+        self.recovery = RecoveryProgress()
+        self._load()
+        self._journal_fd = os.open(self._journal_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        self.recovery.finish("journal")
+
+    # --- CHARGEMENT ---
+
+    def _pack_path(self, pack_id: int) -> str:
+        return os.path.join(self.pack_dir, f"pack-{pack_id:06d}.dat")
+
+    def _load(self):
+        for name in sorted(os.listdir(self.pack_dir)):
+            if name.startswith("pack-") and name.endswith(".dat"):
+                pack_id = int(name[5:-4])
+                path = os.path.join(self.pack_dir, name)
+                fd = os.open(path, os.O_RDWR)
+                self._packs[pack_id] = Pack(pack_id, path, fd, size=os.fstat(fd).st_size)
+
+        if os.path.exists(self._journal_path):
+            self._replay_journal()
+        elif self._packs:
+            logger.warning("⚠️  Pack index journal missing, rebuilding from pack records")
+            self._rebuild_from_packs()
+            self._write_snapshot()
+
+        for content_hash, (pack_id, _, length) in self._index.items():
+            self._packs[pack_id].live += _RECORD.size + length
+            self._packs[pack_id].blocks.add(content_hash)
+
+        last = max(self._packs) if self._packs else None
+        if last is not None and self._packs[last].size < PACK_MAX_SIZE:
+            self._active = self._packs[last]
+        else:
+            self._active = self._new_pack()
+
+        logger.info(f"📦 Pack store loaded: {len(self._index)} blocks in {len(self._packs)} packs")
+
+    def _replay_journal(self):
+        with open(self._journal_path, "rb") as f:
+            data = f.read()
+        count = len(data) // _ENTRY.size
+        if count * _ENTRY.size != len(data):
+            # Entrée partielle (crash pendant l'écriture) : on tronque proprement
+            logger.warning("⚠️  Torn tail in pack index journal, truncating")
+            os.truncate(self._journal_path, count * _ENTRY.size)
+
+        for i in range(count):
+            op, raw_hash, pack_id, offset, length = _ENTRY.unpack_from(data, i * _ENTRY.size)
+            content_hash = raw_hash.hex()
+            if op == OP_PUT and pack_id in self._packs:
+                self._index[content_hash] = (pack_id, offset, length)
+            elif op == OP_DEL:
+                self._index.pop(content_hash, None)
+
+    def _rebuild_from_packs(self):
+        # Note: les blocs supprimés ressuscitent, le GC les récupérera
+        for pack in self._packs.values():
+            pos = 0
+            while pos + _RECORD.size <= pack.size:
+                magic, raw_hash, length = _RECORD.unpack(os.pread(pack.fd, _RECORD.size, pos))
+                if magic != RECORD_MAGIC or pos + _RECORD.size + length > pack.size:
+                    break  # Fin de pack ou record tronqué
+                self._index[raw_hash.hex()] = (pack.pack_id, pos + _RECORD.size, length)
+                pos += _RECORD.size + length
+
+    def _write_snapshot(self):
+        """Réécrit le journal avec uniquement les entrées vivantes (chargement, journal pas encore ouvert)"""
+        tmp_path = self._journal_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            self._write_entries(f, self._index)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._journal_path)
+        self._fsync_dir()
+
+    @staticmethod
+    def _write_entries(f, index: Dict[str, Tuple[int, int, int]]):
+        f.write(b"".join(
+            _ENTRY.pack(OP_PUT, bytes.fromhex(content_hash), pack_id, offset, length)
+            for content_hash, (pack_id, offset, length) in index.items()
+        ))
+
+    def _rewrite_journal(self):
+        """
+        Snapshot du journal en service (bloquant : lancé dans le pool I/O).
+        Le gros de l'écriture et du fsync se fait sur une copie de l'index,
+        verrou relâché ; seules les entrées journalisées entre-temps sont
+        recopiées sous verrou, juste avant la bascule.
+        """
+        with self._rewrite_lock:
+            with self._lock:
+                # Les entrées en cours de publication sont déjà avant `start` dans le journal
+                index = {**self._index, **self._unpublished}
+                start = os.fstat(self._journal_fd).st_size
+            tmp_path = self._journal_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                self._write_entries(f, index)
+                f.flush()
+                os.fsync(f.fileno())
+                with self._lock:
+                    with open(self._journal_path, "rb") as journal:
+                        journal.seek(start)
+                        f.write(journal.read())
+                    f.flush()
+                    os.fsync(f.fileno())
+                    os.replace(tmp_path, self._journal_path)
+                    self._reopen_journal()
+            self._fsync_dir()
+
+    def _fsync_dir(self):
+        dir_fd = os.open(self.pack_dir, os.O_RDONLY)
+        try:
+            fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    def _new_pack(self) -> Pack:
+        pack_id = max(self._packs) + 1 if self._packs else 1
+        path = self._pack_path(pack_id)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600)
+        self._fsync_dir()
+        pack = Pack(pack_id, path, fd)
+        self._packs[pack_id] = pack
+        return pack
+
+    def _reserve(self, nbytes: int) -> Tuple[Pack, int]:
+        """Réserve une zone en fin de pack actif (pas d'await : atomique pour l'event loop)"""
+        if self._active.size and self._active.size + nbytes > PACK_MAX_SIZE:
+            self._active = self._new_pack()
+        offset = self._active.size
+        self._active.size += nbytes
+        return self._active, offset
+
+    # --- INTERFACE BLOCK STORE ---
+
+    def exists(self, content_hash: str) -> bool:
+        return content_hash in self._index
+
+    async def stored_size(self, content_hash: str) -> int:
+        return self._index[content_hash][2]
+
+    def open_staging(self) -> PackStaging:
+        return PackStaging(self.temp_dir)
+
+    async def commit(self, staging: PackStaging, content_hash: str) -> Tuple[bool, int]:
+        """
+        Ajoute le bloc préparé en fin de pack et attend le fsync groupé.
+        Retourne (is_new_write, size_on_disk).
+        """
+        while True:
+            loc = self._index.get(content_hash)
+            if loc is not None:
+                self._touched[content_hash] = time.time()
+                await staging.discard()
+                return False, loc[2]
+            pending = self._inflight.get(content_hash)
+            if pending is None:
+                break
+            await asyncio.shield(pending)
+
+        done = asyncio.get_running_loop().create_future()
+        self._inflight[content_hash] = done
+        try:
+            size = staging.size
+            pack, offset = self._reserve(_RECORD.size + size)
+            await io_pool.run(self._write_record, pack, offset, content_hash, staging, cost=size)
+            await staging.discard()
+
+            await self._committer.submit(
+                (content_hash, pack, offset + _RECORD.size, size, None), _RECORD.size + size
+            )
+            return True, size
+        finally:
+            del self._inflight[content_hash]
+            done.set_result(None)
+
+    @staticmethod
+    def _write_record(pack: Pack, offset: int, content_hash: str, staging: PackStaging):
+        """Écrit header + payload dans la zone réservée (exécuté dans le pool I/O)"""
+        os.pwrite(pack.fd, _RECORD.pack(RECORD_MAGIC, bytes.fromhex(content_hash), staging.size), offset)
+        pos = offset + _RECORD.size
+        for chunk in staging.chunks():
+            os.pwrite(pack.fd, chunk, pos)
+            pos += len(chunk)
+
+    @staticmethod
+    def _copy_record(source: Pack, offset: int, target: Pack, new_offset: int, content_hash: str, length: int):
+        """Recopie un record vers un autre pack (compaction, exécuté dans le pool I/O)"""
+        os.pwrite(target.fd, _RECORD.pack(RECORD_MAGIC, bytes.fromhex(content_hash), length), new_offset)
+        for pos in range(0, length, COPY_CHUNK_SIZE):
+            chunk = os.pread(source.fd, min(COPY_CHUNK_SIZE, length - pos), offset + pos)
+            os.pwrite(target.fd, chunk, new_offset + _RECORD.size + pos)
+
+    def _flush(self, items: List[tuple]):
+        """
+        Exécuté dans un thread par le GroupCommitter :
+        fsync des packs touchés, puis journal, puis publication dans l'index.
+        items: (hash, pack, offset, length, expected_loc) ; expected_loc sert aux
+        déplacements de compaction (ignorés si le bloc a été supprimé entre-temps).
+        """
+        for fd in {pack.fd for _, pack, _, _, _ in items}:
+            fsync(fd)
+
+        with self._lock:
+            applied = []
+            for content_hash, pack, offset, length, expected in items:
+                if expected is not None and self._index.get(content_hash) != expected:
+                    continue
+                applied.append((content_hash, pack, offset, length, expected))
+
+            if applied:
+                os.write(self._journal_fd, b"".join(
+                    _ENTRY.pack(OP_PUT, bytes.fromhex(h), pack.pack_id, offset, length)
+                    for h, pack, offset, length, _ in applied
+                ))
+            for h, pack, offset, length, _ in applied:
+                self._unpublished[h] = (pack.pack_id, offset, length)
+            journal_fd = os.dup(self._journal_fd)
+
+        # Un seul fsync pour tout le lot (et pour les suppressions en attente), verrou
+        # relâché : delete() et les lectures de l'index n'attendent pas le disque
+        try:
+            fsync(journal_fd)
+        finally:
+            os.close(journal_fd)
+
+        with self._lock:
+            for content_hash, pack, offset, length, expected in applied:
+                self._unpublished.pop(content_hash, None)
+                old = self._index.get(content_hash)
+                if expected is not None and old != expected:
+                    # Supprimé pendant le fsync : l'OP_DEL suit l'OP_PUT dans le journal
+                    continue
+                if old is not None:
+                    self._packs[old[0]].live -= _RECORD.size + old[2]
+                    self._packs[old[0]].blocks.discard(content_hash)
+                self._index[content_hash] = (pack.pack_id, offset, length)
+                pack.live += _RECORD.size + length
+                pack.blocks.add(content_hash)
+
+    async def last_modified_many(self, hashes: List[str]) -> List[float]:
+        """
+        Dernière écriture ou dédup hit de chaque bloc (timestamp), 0 si absent.
+        Approximé par la date du pack : un bloc d'un pack encore actif paraît récent.
+        Un fstat par pack concerné, dans le pool I/O.
+        """
+        locs = [self._index.get(content_hash) for content_hash in hashes]
+        fds = {loc[0]: self._packs[loc[0]].fd for loc in locs if loc is not None and loc[0] in self._packs}
+
+        def stat_packs() -> Dict[int, float]:
+            mtimes = {}
+            for pack_id, fd in fds.items():
+                try:
+                    mtimes[pack_id] = os.fstat(fd).st_mtime
+                except OSError:
+                    # Pack fermé entre-temps par la compaction : ses blocs ont été recopiés
+                    mtimes[pack_id] = time.time()
+            return mtimes
+
+        mtimes = await io_pool.run(stat_packs)
+        return [
+            0.0 if loc is None else max(mtimes.get(loc[0], 0.0), self.touched_at(content_hash))
+            for content_hash, loc in zip(hashes, locs)
+        ]
+
+    def touched_at(self, content_hash: str) -> float:
+        """Dernier dédup hit connu en mémoire (0 si aucun depuis le dernier GC)"""
+        return self._touched.get(content_hash, 0.0)
+
+    async def touch(self, hashes: List[str]):
+        """Dédup hits distants (HasBlocks touch) : en mémoire, comme ceux de commit()"""
+        now = time.time()
+        for content_hash in hashes:
+            if content_hash in self._index:
+                self._touched[content_hash] = now
+
+    def prune_touched(self, before: float):
+        """Oublie les dédup hits plus anciens que before (appelé après un GC)"""
+        self._touched = {h: t for h, t in self._touched.items() if t >= before}
+
+    async def recover(self):
+        """Index chargé dès le constructeur (journal) : rien à terminer"""
+
+    def record_access(self, content_hash: str):
+        """Pas de tiering pour les packs : aucune chaleur à suivre"""
+
+    def open_reader(self, content_hash: str) -> PackBlockReader:
+        if content_hash not in self._index:
+            raise FileNotFoundError(f"Block {content_hash} missing on this node")
+        return PackBlockReader(self, content_hash)
+
+    async def delete(self, content_hash: str) -> bool:
+        with self._lock:
+            loc = self._index.pop(content_hash, None)
+            self._touched.pop(content_hash, None)
+            if loc is None:
+                return False
+            self._packs[loc[0]].live -= _RECORD.size + loc[2]
+            self._packs[loc[0]].blocks.discard(content_hash)
+            # Aucun fsync sous ce verrou (pris sur l'event loop). Persisté au prochain fsync groupé : au pire le bloc réapparaît après un crash
+            os.write(self._journal_fd, _ENTRY.pack(OP_DEL, bytes.fromhex(content_hash), *loc))
+        return True
+
+    def iter_hashes(self) -> Iterator[str]:
+        with self._lock:
+            hashes = list(self._index)
+        yield from hashes
+
+    # --- COMPACTION ---
+
+    async def compact(self, dead_ratio: float = PACK_COMPACT_DEAD_RATIO, batch_size: int = 256) -> int:
+        """
+        Recopie les blocs vivants des packs trop fragmentés vers le pack actif,
+        puis supprime les anciens packs. Retourne les octets récupérés.
+        """
+        reclaimed = 0
+        victims = [
+            pack for pack in list(self._packs.values())
+            if pack is not self._active and pack.size and pack.dead / pack.size >= dead_ratio
+        ]
+
+        for pack in victims:
+            with self._lock:
+                live = [(h, self._index[h]) for h in pack.blocks]
+
+            for i in range(0, len(live), batch_size):
+                commits = []
+                for content_hash, loc in live[i:i + batch_size]:
+                    _, offset, length = loc
+                    target, new_offset = self._reserve(_RECORD.size + length)
+                    await io_pool.run(self._copy_record, pack, offset, target, new_offset, content_hash, length, cost=length)
+                    commits.append(self._committer.submit(
+                        (content_hash, target, new_offset + _RECORD.size, length, loc), _RECORD.size + length
+                    ))
+                await asyncio.gather(*commits)
+
+            with self._lock:
+                if pack.blocks:
+                    continue
+                del self._packs[pack.pack_id]
+            # L'index ne référence plus ce pack : snapshot avant suppression du fichier
+            await io_pool.run(self._rewrite_journal)
+            await io_pool.run(self._remove_pack, pack)
+            reclaimed += pack.size
+            logger.info(f"🧹 Pack {pack.pack_id} compacted ({pack.size} bytes reclaimed)")
+
+        # Le journal grossit avec les suppressions : on le réécrit s'il devient trop bavard
+        journal_size = os.fstat(self._journal_fd).st_size
+        if journal_size > 4 * len(self._index) * _ENTRY.size + 1024 * 1024:
+            await io_pool.run(self._rewrite_journal)
+
+        return reclaimed
+
+    @staticmethod
+    def _remove_pack(pack: Pack):
+        os.close(pack.fd)
+        os.remove(pack.path)
+
+    def _reopen_journal(self):
+        os.close(self._journal_fd)
+        self._journal_fd = os.open(self._journal_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+
+    async def compaction_loop(self, interval: int = PACK_COMPACT_INTERVAL):
+        """Tâche de fond lancée par l'agent"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.compact()
+            except Exception as e:
+                logger.error(f"Pack compaction failed: {e}")
+
+    def stats(self) -> dict:
+        total = sum(p.size for p in self._packs.values())
+        live = sum(p.live for p in self._packs.values())
+        return {
+            "blocks": len(self._index),
+            "bytes": live - len(self._index) * _RECORD.size,
+            "packs": len(self._packs),
+            "bytes_total": total,
+            "bytes_live": live,
+            "bytes_dead": total - live,
+        }
+
+    def tier_stats(self) -> List[dict]:
+        """Un seul tier (le tiering n'existe que pour le backend files)"""
+        vfs = os.statvfs(self.pack_dir)
+        return [{
+            "tier": 0,
+            "path": self.pack_dir,
+            "capacity_bytes": vfs.f_blocks * vfs.f_frsize,
+            "free_bytes": vfs.f_bavail * vfs.f_frsize,
+            "blocks": len(self._index),
+            "block_bytes": self.stats()["bytes"],
+        }]
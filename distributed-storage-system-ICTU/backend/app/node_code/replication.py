@@ -0,0 +1,98 @@
+import os
+import asyncio
+import logging
+from typing import AsyncIterator, Dict, List
+
+import grpc
+
+from app.protos import node_pb2, node_pb2_grpc
+from .io_scheduler import IO_CLASS_METADATA, REPLICATION
+
+# --- CONFIGURATION DE LA RÉPLICATION ---
+REPLICATION_CONCURRENCY = int(os.getenv("NODE_REPLICATION_CONCURRENCY", 8))  # Blocs envoyés en parallèle par requête
+HAS_BLOCKS_BATCH = 1000
+
+logger = logging.getLogger("node.replication")
+
+class Replicator:
+    """
+    Copie de blocs de ce node vers un autre (ReplicateTo) : chaque bloc est
+    déchiffré segment par segment et streamé directement dans l'UploadBlock
+    de la cible, qui le rechiffre avec sa propre clé et revérifie le hash.
+    Les octets ne passent ni par l'orchestrateur ni par un worker Celery.
+    """
+    _channels: Dict[str, grpc.aio.Channel] = {}
+
+    def __init__(self, engine, concurrency: int = REPLICATION_CONCURRENCY):
+        self.engine = engine
+        self.concurrency = concurrency
+
+    def _stub(self, target: str) -> node_pb2_grpc.StorageNodeStub:
+        # Un canal par node cible, réutilisé d'une requête à l'autre
+        if target not in self._channels:
+            self._channels[target] = grpc.aio.insecure_channel(target)
+        return node_pb2_grpc.StorageNodeStub(self._channels[target])
+
+    @staticmethod
+    async def _batches(hashes: List[str]) -> AsyncIterator[node_pb2.HashBatch]:
+        for i in range(0, len(hashes), HAS_BLOCKS_BATCH):
+            yield node_pb2.HashBatch(hashes=hashes[i:i + HAS_BLOCKS_BATCH])
+
+    async def _present(self, stub, hashes: List[str]) -> List[bool]:
+        """Blocs que la cible a déjà (dédup) : un aller-retour par lot de hash"""
+        present = []
+        async for answer in stub.HasBlocks(self._batches(hashes)):
+            present.extend(bool(answer.bitmap[i >> 3] & (1 << (i & 7))) for i in range(answer.count))
+        return present
+
+    async def _copy(self, stub, content_hash: str, semaphore: asyncio.Semaphore) -> node_pb2.ReplicateResult:
+        sent = 0
+
+        async def chunks():
+            nonlocal sent
+            first = True
+            async for data in self.engine.stream_block(content_hash, cached=False):
+                sent += len(data)
+                yield node_pb2.FileChunk(data=data, block_hash=content_hash if first else "")
+                first = False
+
+        async with semaphore:
+            try:
+                if not self.engine.has_blocks([content_hash])[0]:
+                    raise FileNotFoundError("Block not found on source")
+                # Côté cible aussi, l'écriture passe après le trafic client
+                response = await stub.UploadBlock(chunks(), metadata=((IO_CLASS_METADATA, REPLICATION),))
+            except Exception as e:
+                return node_pb2.ReplicateResult(hash=content_hash, success=False, error_message=str(e) or type(e).__name__)
+        if not response.success:
+            return node_pb2.ReplicateResult(hash=content_hash, success=False, error_message=response.error_message)
+        return node_pb2.ReplicateResult(hash=content_hash, success=True, bytes=sent)
+
+    async def replicate(self, target: str, hashes: List[str]) -> AsyncIterator[node_pb2.ReplicateResult]:
+        """Un résultat par hash demandé, au fil des copies terminées"""
+        stub = self._stub(target)
+        hashes = list(dict.fromkeys(hashes))
+        try:
+            present = await self._present(stub, hashes)
+        except Exception as e:
+            for content_hash in hashes:
+                yield node_pb2.ReplicateResult(hash=content_hash, success=False, error_message=f"Target unreachable: {e}")
+            return
+
+        todo = []
+        for content_hash, skip in zip(hashes, present):
+            if skip:
+                yield node_pb2.ReplicateResult(hash=content_hash, success=True, skipped=True)
+            else:
+                todo.append(content_hash)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = [asyncio.ensure_future(self._copy(stub, content_hash, semaphore)) for content_hash in todo]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield await finished
+        finally:
+            # Appelant parti (stream annulé) : on arrête les copies restantes
+            for task in tasks:
+                task.cancel()
+        logger.info(f"📤 Replicated {len(todo)} blocks to {target} ({len(hashes) - len(todo)} already there)")
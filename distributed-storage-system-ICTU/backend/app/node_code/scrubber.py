@@ -0,0 +1,253 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from typing import Dict, Iterable, List, Optional
+
+from .telemetry import rpc_tracker
+from .worker_pools import io_pool
+
+# --- CONFIGURATION DU SCRUBBER ---
+SCRUB_ENABLED = os.getenv("NODE_SCRUB_ENABLED", "true").lower() == "true"
+SCRUB_MB_PER_SEC = float(os.getenv("NODE_SCRUB_MB_PER_SEC", 20))          # Budget I/O de la vérification
+SCRUB_PASS_INTERVAL = int(os.getenv("NODE_SCRUB_PASS_INTERVAL", 7 * 24 * 3600))  # Délai entre deux débuts de passe
+SCRUB_YIELD_WAIT = float(os.getenv("NODE_SCRUB_YIELD_WAIT", 0.5))         # Pause tant que des lectures client tournent
+SCRUB_YIELD_MAX = float(os.getenv("NODE_SCRUB_YIELD_MAX", 10))            # Attente maximale avant de reprendre malgré les lectures
+SCRUB_BUSY_SHARE = float(os.getenv("NODE_SCRUB_BUSY_SHARE", 0.25))        # Part du budget I/O sous lectures continues
+SCRUB_SAVE_INTERVAL = 30                                                  # Secondes entre deux sauvegardes du curseur
+COPY_CHUNK_SIZE = 1024 * 1024
+SHARDS = [f"{i:x}" for i in range(16)]                                    # Tranches de l'index lues d'un coup (1/16e des hash)
+
+logger = logging.getLogger("node.scrubber")
+
+def sorted_hashes(store, after: str = "", prefix: str = "") -> List[str]:
+    """
+    Hash du store strictement après `after` (et commençant par `prefix`), par
+    ordre croissant : un seul parcours de l'index et un seul tri. Bloquant
+    (O(N log N)) : à lancer hors de la boucle asyncio (asyncio.to_thread).
+    """
+    return sorted(h for h in store.iter_hashes() if h > after and h.startswith(prefix))
+
+class Scrubber:
+    """
+    Vérification de fond de tous les blocs du node (bit rot, secteurs défectueux).
+    Chaque bloc est relu et déchiffré (le tag AES-GCM de chaque segment est
+    vérifié), puis le SHA-256 du clair est comparé à son nom.
+
+    Les blocs sont parcourus par ordre de hash, shard par shard (0..f) : le
+    curseur (dernier hash vérifié) est sauvegardé régulièrement et la passe
+    reprend là où elle s'était arrêtée après un redémarrage.
+
+    Le débit est plafonné à SCRUB_MB_PER_SEC et le scrubber s'efface dès qu'un
+    DownloadBlock ou un ReplicateTo est en cours, au plus SCRUB_YIELD_MAX
+    secondes : sous une charge de lecture continue, il avance quand même, à
+    SCRUB_BUSY_SHARE de son budget (signalé dans les logs). Un bloc corrompu est
+    déplacé en quarantaine (retiré du store, donc réparable par simple
+    ré-upload) et signalé à l'orchestrateur, qui le récupère via
+    AdminControl.GetScrubReport.
+    """
+    def __init__(self, engine, state_dir: str, quarantine_dir: str, mb_per_sec: float = SCRUB_MB_PER_SEC):
+        self.engine = engine
+        self.state_path = os.path.join(state_dir, "scrub_state.json")
+        self.quarantine_dir = quarantine_dir
+        self.bytes_per_sec = mb_per_sec * 1024 * 1024
+        os.makedirs(state_dir, exist_ok=True)
+        os.makedirs(quarantine_dir, exist_ok=True)
+
+        self.cursor = ""                 # Dernier hash vérifié de la passe en cours
+        self.pass_started_at = 0.0
+        self.last_pass_completed_at = 0.0
+        self.passes = 0
+        self.blocks_verified = 0
+        self.bytes_verified = 0
+        self.corrupt: Dict[str, dict] = {}   # Signalements pas encore acquittés par l'orchestrateur
+        self._last_save = 0.0
+        # Une sauvegarde à la fois : même fichier temporaire
+        self._save_lock = asyncio.Lock()
+        self._throttled_pass = False
+        self._load()
+
+    # --- ÉTAT PERSISTANT ---
+
+    def _load(self):
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️  Unreadable scrub state, starting a new pass: {e}")
+            return
+        self.cursor = state.get("cursor", "")
+        self.pass_started_at = state.get("pass_started_at", 0.0)
+        self.last_pass_completed_at = state.get("last_pass_completed_at", 0.0)
+        self.passes = state.get("passes", 0)
+        self.blocks_verified = state.get("blocks_verified", 0)
+        self.bytes_verified = state.get("bytes_verified", 0)
+        self.corrupt = state.get("corrupt", {})
+        if self.cursor:
+            logger.info(f"🔎 Resuming scrub pass at {self.cursor[:12]}...")
+
+    async def _save(self):
+        """Photo de l'état sur la boucle, écriture + fsync dans le pool I/O"""
+        async with self._save_lock:
+            await io_pool.run(self._write_state, self._state())
+            self._last_save = time.monotonic()
+
+    def _state(self) -> dict:
+        return {
+            "cursor": self.cursor,
+            "pass_started_at": self.pass_started_at,
+            "last_pass_completed_at": self.last_pass_completed_at,
+            "passes": self.passes,
+            "blocks_verified": self.blocks_verified,
+            "bytes_verified": self.bytes_verified,
+            "corrupt": dict(self.corrupt),
+        }
+
+    def _write_state(self, state: dict):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.state_path)
+
+    async def _maybe_save(self):
+        if time.monotonic() - self._last_save >= SCRUB_SAVE_INTERVAL:
+            await self._save()
+
+    # --- SIGNALEMENTS ---
+
+    def report(self) -> dict:
+        return {
+            "corrupt": [dict(hash=h, **info) for h, info in self.corrupt.items()],
+            "cursor": self.cursor,
+            "passes": self.passes,
+            "blocks_verified": self.blocks_verified,
+            "bytes_verified": self.bytes_verified,
+            "last_pass_completed_at": int(self.last_pass_completed_at),
+        }
+
+    async def acknowledge(self, hashes: Iterable[str]):
+        """L'orchestrateur a pris en charge la réparation : plus besoin de signaler"""
+        removed = [h for h in hashes if self.corrupt.pop(h, None) is not None]
+        if removed:
+            await self._save()
+
+    # --- VÉRIFICATION ---
+
+    async def _shard_hashes(self, shard: str) -> List[str]:
+        # Un parcours de l'index par shard, hors de la boucle : 16 par passe, ~1/16e des hash en mémoire
+        return await asyncio.to_thread(sorted_hashes, self.engine.store, self.cursor, shard)
+
+    async def _yield_to_reads(self) -> bool:
+        """Attend la fin des lectures client (au plus SCRUB_YIELD_MAX) ; True si elles tournent encore"""
+        reads = ("DownloadBlock", "ReplicateTo")
+        deadline = time.monotonic() + SCRUB_YIELD_MAX
+        while any(rpc_tracker.in_flight.get(method, 0) > 0 for method in reads):
+            if time.monotonic() >= deadline:
+                if not self._throttled_pass:
+                    self._throttled_pass = True
+                    logger.warning(
+                        f"⚠️  Sustained read load: scrubbing continues at {SCRUB_BUSY_SHARE:.0%} of its I/O budget"
+                    )
+                return True
+            await asyncio.sleep(SCRUB_YIELD_WAIT)
+        return False
+
+    async def verify(self, content_hash: str) -> Optional[str]:
+        """Retourne la raison de la corruption, ou None si le bloc est sain"""
+        hasher = hashlib.sha256()
+        try:
+            async for plain in self.engine.stream_block(content_hash, cached=False):
+                hasher.update(plain)
+        except (FileNotFoundError, KeyError):
+            raise
+        except Exception as e:
+            return str(e) or type(e).__name__
+        if hasher.hexdigest() != content_hash:
+            return "SHA-256 mismatch"
+        return None
+
+    async def _quarantine(self, content_hash: str, reason: str):
+        """Copie le blob brut à l'écart (analyse) puis le retire du store"""
+        store = self.engine.store
+        target = os.path.join(self.quarantine_dir, f"{content_hash}.{int(time.time())}")
+        try:
+            async with store.open_reader(content_hash) as reader:
+                fd = await io_pool.run(os.open, target, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                try:
+                    for pos in range(0, reader.size, COPY_CHUNK_SIZE):
+                        data = await reader.read(pos, COPY_CHUNK_SIZE)
+                        await io_pool.run(os.write, fd, data, cost=len(data))
+                finally:
+                    os.close(fd)
+        except FileNotFoundError:
+            pass  # Plus rien à copier : le fichier du bloc a disparu
+        except Exception as e:
+            logger.error(f"❌ Could not copy {content_hash} to quarantine: {e}")
+        await self.engine.delete_block(content_hash)
+        self.corrupt[content_hash] = {"reason": reason, "detected_at": int(time.time())}
+        await self._save()
+        logger.error(f"☣️  Corrupt block quarantined: {content_hash} ({reason})")
+
+    async def scrub_pass(self):
+        """Termine la passe en cours (ou en commence une nouvelle)"""
+        if not self.cursor:
+            self.pass_started_at = time.time()
+        logger.info("🔎 Scrub pass started")
+        self._throttled_pass = False
+        start_shard = self.cursor[:1]
+        for shard in SHARDS:
+            if shard < start_shard:
+                continue
+            for content_hash in await self._shard_hashes(shard):
+                busy = await self._yield_to_reads()
+                started = time.monotonic()
+                try:
+                    size = await self.engine.store.stored_size(content_hash)
+                    reason = await self.verify(content_hash)
+                except (FileNotFoundError, KeyError):
+                    if not self.engine.store.exists(content_hash):
+                        # Supprimé entre-temps (GC)
+                        self.cursor = content_hash
+                        continue
+                    # Encore indexé mais illisible : le fichier a disparu du disque
+                    size, reason = 0, "Block missing on disk"
+                if reason is not None:
+                    await self._quarantine(content_hash, reason)
+
+                self.cursor = content_hash
+                self.blocks_verified += 1
+                self.bytes_verified += size
+                await self._maybe_save()
+                # Budget I/O : on dort le temps qu'aurait pris la lecture au débit cible
+                budget = self.bytes_per_sec * (SCRUB_BUSY_SHARE if busy else 1.0)
+                await asyncio.sleep(max(0.0, size / budget - (time.monotonic() - started)))
+            await asyncio.sleep(0)
+
+        self.cursor = ""
+        self.passes += 1
+        self.last_pass_completed_at = time.time()
+        await self._save()
+        logger.info(f"🔎 Scrub pass {self.passes} done ({self.blocks_verified} blocks verified so far)")
+
+    async def run(self):
+        """Boucle de fond : une passe complète tous les SCRUB_PASS_INTERVAL"""
+        while True:
+            if not self.cursor:
+                wait = self.pass_started_at + SCRUB_PASS_INTERVAL - time.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            try:
+                await self.scrub_pass()
+            except asyncio.CancelledError:
+                await self._save()
+                raise
+            except Exception as e:
+                logger.error(f"❌ Scrub pass failed: {e}")
+                await self._save()
+                await asyncio.sleep(60)
@@ -1,13 +1,110 @@
 import os
+import struct
+from dataclasses import dataclass
+from typing import Optional
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from functools import lru_cache
 import base64
 
+from .compression import CODEC_NONE, compress_segment, decompress_segment
+
 # Clé interne du Node (injectée via variable d'environnement au démarrage du pod K8s)
 # C'est la clé qui protège tout ce qui est écrit sur CE disque spécifique.
 NODE_MASTER_KEY = os.getenv("NODE_MASTER_SECRET", "change_me_in_production_please_32chars")
 
+# --- FORMAT DISQUE SEGMENTÉ (v3) ---
+# [header 26B] [seg 0 : ciphertext + tag] [seg 1] ... [seg N-1 (final)]
+# Chaque segment est authentifié indépendamment : on peut déchiffrer (et streamer)
+# dès le premier segment lu, et ne lire que les segments couvrant un range.
+#
+# Chaque blob a sa propre clé AES, dérivée (HKDF) de la clé du node et d'un sel
+# aléatoire de 128 bits stocké dans le header : le nonce (index + flag final)
+# n'a besoin d'être unique que dans le blob. La v2 (header 17B, préfixe de nonce
+# aléatoire de 56 bits sous la clé du node) n'est plus écrite : passé quelques
+# centaines de millions de blocs, deux préfixes identiques devenaient probables.
+# Les blobs v1 (nonce + ciphertext + tag en un seul passage) et v2 restent lisibles.
+#
+# Blocs compressés (codec != 0) : chaque segment de SEGMENT_SIZE octets de clair
+# est compressé séparément puis chiffré, et préfixé de sa taille chiffrée :
+# [header] [u32 len][seg 0] [u32 len][seg 1] ...
+# L'accès par range reste possible en sautant les segments d'après leur préfixe.
+BLOCK_MAGIC = b"NXBK"
+FORMAT_SEGMENTED = 2
+FORMAT_BLOB_KEY = 3
+SEGMENT_SIZE = int(os.getenv("NODE_SEGMENT_SIZE", 1024 * 1024))  # 1MB de clair par segment
+TAG_SIZE = 16
+NONCE_PREFIX_SIZE = 7
+BLOB_SALT_SIZE = 16
+_HEADERS = {
+    FORMAT_SEGMENTED: struct.Struct(">4sBBI7s"),   # magic, version, codec, segment_size, nonce_prefix
+    FORMAT_BLOB_KEY: struct.Struct(">4sBBI16s"),   # magic, version, codec, segment_size, salt
+}
+_PREAMBLE = struct.Struct(">4sB")  # magic, version
+HEADER_SIZE = max(h.size for h in _HEADERS.values())  # Octets à lire pour reconnaître un header
+FRAME_PREFIX = struct.Struct(">I")  # Taille d'un segment chiffré (blocs compressés)
+
+@dataclass(frozen=True)
+class BlockHeader:
+    version: int
+    codec: int
+    segment_size: int
+    nonce_prefix: bytes   # v2 : préfixe du nonce, v3 : sel de la clé du blob
+    raw: bytes
+
+    @property
+    def size(self) -> int:
+        """Taille du header sur le disque"""
+        return len(self.raw)
+
+    @property
+    def framed(self) -> bool:
+        """Segments de taille variable préfixés (bloc compressé)"""
+        return self.codec != CODEC_NONE
+
+    @property
+    def encrypted_segment_size(self) -> int:
+        return self.segment_size + TAG_SIZE
+
+    def segment_count(self, file_size: int) -> int:
+        """Nombre de segments d'un blob (il y a toujours au moins le segment final)"""
+        body = file_size - self.size
+        return max(1, -(-body // self.encrypted_segment_size))
+
+    def plaintext_size(self, file_size: int) -> int:
+        return file_size - self.size - self.segment_count(file_size) * TAG_SIZE
+
+    def segment_offset(self, index: int) -> int:
+        """Position du segment dans le fichier"""
+        return self.size + index * self.encrypted_segment_size
+
+def parse_header(data: bytes) -> Optional[BlockHeader]:
+    """Retourne le header v2/v3 si le blob en a un, None pour un blob v1 (legacy)"""
+    if len(data) < _PREAMBLE.size:
+        return None
+    magic, version = _PREAMBLE.unpack_from(data)
+    layout = _HEADERS.get(version)
+    if magic != BLOCK_MAGIC or layout is None or len(data) < layout.size:
+        return None
+    _, _, codec, segment_size, nonce_prefix = layout.unpack_from(data)
+    if segment_size == 0:
+        return None
+    return BlockHeader(version, codec, segment_size, nonce_prefix, bytes(data[:layout.size]))
+
+def _segment_nonce(header: BlockHeader, index: int, last: bool) -> bytes:
+    if header.version == FORMAT_SEGMENTED:
+        # v2 : préfixe aléatoire du bloc + index + flag "dernier segment"
+        return header.nonce_prefix + struct.pack(">IB", index, 1 if last else 0)
+    # v3 : clé propre au blob, la position suffit
+    return struct.pack(">7xIB", index, 1 if last else 0)
+
+def _segment_aad(header: BlockHeader, index: int, last: bool) -> bytes:
+    # Le header et la position sont authentifiés : impossible de réordonner,
+    # tronquer ou transplanter des segments d'un autre bloc sans casser le tag.
+    return header.raw + struct.pack(">QB", index, 1 if last else 0)
+
 class StorageEncryption:
     """
     Gère le chiffrement/déchiffrement des blocs de données avant l'écriture disque.
@@ -23,21 +120,75 @@ class StorageEncryption:
         self.key = kdf.derive(NODE_MASTER_KEY.encode())
         self.aesgcm = AESGCM(self.key)
 
+    @lru_cache(maxsize=256)
+    def _blob_cipher(self, salt: bytes) -> AESGCM:
+        """Clé AES propre à un blob v3 (HKDF de la clé du node, sel du header)"""
+        hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=salt, info=b"nexus-block-v3")
+        return AESGCM(hkdf.derive(self.key))
+
+    def _cipher(self, header: BlockHeader) -> AESGCM:
+        if header.version == FORMAT_SEGMENTED:
+            return self.aesgcm
+        return self._blob_cipher(header.nonce_prefix)
+
     def encrypt_block(self, data: bytes) -> bytes:
         """
-        Chiffre un bloc de données.
-        Ajoute un nonce unique (12 bytes) au début du blob.
+        Chiffre un bloc de données complet au format segmenté (v3).
         """
-        nonce = os.urandom(12)
-        # AES-GCM ajoute automatiquement un Tag d'intégrité à la fin
-        ciphertext = self.aesgcm.encrypt(nonce, data, None) 
-        return nonce + ciphertext
+        encryptor = self.stream_encryptor()
+        return encryptor.header() + encryptor.update(data) + encryptor.finalize()
 
     def decrypt_block(self, encrypted_data: bytes) -> bytes:
         """
-        Déchiffre un bloc lu depuis le disque.
+        Déchiffre un bloc lu depuis le disque (v2/v3 segmenté ou v1 legacy).
         Lève une exception si les données sont corrompues (tampering).
         """
+        header = parse_header(encrypted_data)
+        if header is not None:
+            try:
+                if header.framed:
+                    return b"".join(self._decrypt_framed(header, encrypted_data))
+                count = header.segment_count(len(encrypted_data))
+                return b"".join(
+                    self.decrypt_segment(
+                        header, i,
+                        encrypted_data[header.segment_offset(i):header.segment_offset(i + 1)],
+                        last=(i == count - 1)
+                    )
+                    for i in range(count)
+                )
+            except ValueError:
+                # Collision improbable : un blob v1 dont le nonce ressemble au magic
+                pass
+        return self._decrypt_legacy(encrypted_data)
+
+    def _decrypt_framed(self, header: BlockHeader, encrypted_data: bytes):
+        if len(encrypted_data) <= header.size:
+            # Le segment final (même vide) est toujours écrit : header seul = bloc tronqué
+            raise ValueError("Data Integrity Check Failed (Truncated Segment)")
+        pos, index = header.size, 0
+        while pos < len(encrypted_data):
+            if pos + FRAME_PREFIX.size > len(encrypted_data):
+                raise ValueError("Data Integrity Check Failed (Truncated Segment)")
+            (size,) = FRAME_PREFIX.unpack_from(encrypted_data, pos)
+            start, pos = pos + FRAME_PREFIX.size, pos + FRAME_PREFIX.size + size
+            yield self.decrypt_segment(header, index, encrypted_data[start:pos], last=pos >= len(encrypted_data))
+            index += 1
+
+    def decrypt_segment(self, header: BlockHeader, index: int, segment: bytes, last: bool) -> bytes:
+        """Déchiffre et authentifie un seul segment d'un blob v2/v3 (puis le décompresse)"""
+        try:
+            plain = self._cipher(header).decrypt(
+                _segment_nonce(header, index, last), segment, _segment_aad(header, index, last)
+            )
+        except Exception:
+            raise ValueError("Data Integrity Check Failed (Decryption Error)")
+        if header.framed:
+            return decompress_segment(header.codec, plain)
+        return plain
+
+    def _decrypt_legacy(self, encrypted_data: bytes) -> bytes:
+        """Format v1 : nonce (12 bytes) + ciphertext + tag, un seul passage"""
         try:
             # Extraction du nonce (12 premiers octets)
             nonce = encrypted_data[:12]
@@ -46,5 +197,64 @@ class StorageEncryption:
         except Exception:
             raise ValueError("Data Integrity Check Failed (Decryption Error)")
 
+    def stream_encryptor(self, codec: int = 0) -> "SegmentedEncryptor":
+        """
+        Chiffreur incrémental pour les blocs reçus en streaming (format v3).
+        """
+        salt = os.urandom(BLOB_SALT_SIZE)
+        return SegmentedEncryptor(self._blob_cipher(salt), salt, codec)
+
+class SegmentedEncryptor:
+    """
+    Découpe le flux en clair en segments de SEGMENT_SIZE et chiffre chacun
+    sous la clé du blob, avec un nonce dérivé de sa position. On garde toujours
+    le segment courant en attente : il ne peut être scellé "final" qu'une fois
+    le stream terminé.
+    """
+    def __init__(self, aesgcm: AESGCM, salt: bytes, codec: int = 0, segment_size: int = SEGMENT_SIZE):
+        raw = _HEADERS[FORMAT_BLOB_KEY].pack(BLOCK_MAGIC, FORMAT_BLOB_KEY, codec, segment_size, salt)
+        self._header = parse_header(raw)
+        self._aesgcm = aesgcm
+        self._pending = bytearray()
+        self._index = 0
+
+    def header(self) -> bytes:
+        """Octets à écrire en tête du fichier"""
+        return self._header.raw
+
+    @property
+    def pending_bytes(self) -> int:
+        """Clair en attente, scellé au prochain update() ou par finalize()"""
+        return len(self._pending)
+
+    def _seal(self, data: bytes, last: bool) -> bytes:
+        if self._header.framed:
+            data = compress_segment(self._header.codec, data)
+        sealed = self._aesgcm.encrypt(
+            _segment_nonce(self._header, self._index, last), data,
+            _segment_aad(self._header, self._index, last)
+        )
+        self._index += 1
+        if self._header.framed:
+            return FRAME_PREFIX.pack(len(sealed)) + sealed
+        return sealed
+
+    def update(self, data: bytes) -> bytes:
+        """Ajoute du clair, renvoie les segments complets déjà scellés"""
+        self._pending.extend(data)
+        size = self._header.segment_size
+        out = []
+        # Strictement supérieur : le dernier segment plein reste en attente
+        while len(self._pending) > size:
+            out.append(self._seal(bytes(self._pending[:size]), last=False))
+            del self._pending[:size]
+        return b"".join(out)
+
+    def finalize(self) -> bytes:
+        """Scelle le segment final (éventuellement vide)"""
+        sealed = self._seal(bytes(self._pending), last=True)
+        self._pending.clear()
+        return sealed
+
 # Instance globale pour le Node
 local_cipher = StorageEncryption()
\ No newline at end of file
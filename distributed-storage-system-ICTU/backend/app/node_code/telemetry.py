@@ -0,0 +1,170 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+# --- CONFIGURATION DE LA TÉLÉMÉTRIE ---
+TELEMETRY_INTERVAL = float(os.getenv("NODE_TELEMETRY_INTERVAL", 1.0))   # Secondes entre deux échantillons
+FSYNC_WINDOW = int(os.getenv("NODE_FSYNC_WINDOW", 2048))               # Derniers fsync pris en compte
+
+logger = logging.getLogger("node.telemetry")
+
+class LatencyWindow:
+    """
+    Dernières latences observées (fenêtre glissante bornée).
+    deque.append est atomique : les threads du pool I/O y écrivent sans verrou.
+    """
+    def __init__(self, size: int = FSYNC_WINDOW):
+        self._samples = deque(maxlen=size)
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+        self.count += 1
+
+    def percentiles(self, *ranks: float) -> Dict[float, float]:
+        """Percentiles en millisecondes (0 si aucune mesure)"""
+        samples = sorted(self._samples)
+        if not samples:
+            return {rank: 0.0 for rank in ranks}
+        last = len(samples) - 1
+        return {rank: samples[min(last, int(rank * len(samples)))] * 1000 for rank in ranks}
+
+fsync_latency = LatencyWindow()
+
+def fsync(fd: int):
+    """os.fsync chronométré (alimente les percentiles du HealthCheck)"""
+    started = time.perf_counter()
+    os.fsync(fd)
+    fsync_latency.observe(time.perf_counter() - started)
+
+class IOCounters:
+    """Octets lus / écrits sur le stockage des blocs (incrémentés depuis l'event loop)"""
+    def __init__(self):
+        self.read_bytes = 0
+        self.write_bytes = 0
+
+io_counters = IOCounters()
+
+class RpcTracker:
+    """RPC en cours d'exécution, par méthode"""
+    def __init__(self):
+        self.in_flight: Dict[str, int] = {}
+
+    @contextmanager
+    def track(self, method: str):
+        self.in_flight[method] = self.in_flight.get(method, 0) + 1
+        try:
+            yield
+        finally:
+            self.in_flight[method] -= 1
+
+    def total(self) -> int:
+        return sum(self.in_flight.values())
+
+rpc_tracker = RpcTracker()
+
+def _read_proc(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return None
+
+class TelemetrySampler:
+    """
+    Échantillonne les ressources du node en tâche de fond et garde le dernier
+    relevé en cache : le HealthCheck le renvoie sans aucun appel système, et
+    peut donc être interrogé chaque seconde sur des centaines de nodes.
+    Un échantillon coûte un statvfs et trois petites lectures de /proc
+    (quelques dizaines de µs) : il est fait directement dans l'event loop.
+    Hors Linux, CPU et mémoire retombent sur getloadavg / 0.
+    """
+    def __init__(self, path: str, interval: float = TELEMETRY_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+        self._cpu_times = self._read_cpu_times()
+        self._io = (time.monotonic(), io_counters.read_bytes, io_counters.write_bytes)
+        self.snapshot = self.sample()
+
+    @staticmethod
+    def _read_cpu_times():
+        """(occupé, total) en jiffies depuis le boot, d'après la ligne "cpu" de /proc/stat"""
+        stat = _read_proc("/proc/stat")
+        if not stat:
+            return None
+        values = [int(v) for v in stat.split("\n", 1)[0].split()[1:]]
+        idle = values[3] + (values[4] if len(values) > 4 else 0)  # idle + iowait
+        total = sum(values[:8])  # guest est déjà compté dans user
+        return total - idle, total
+
+    def _cpu_usage(self) -> float:
+        current = self._read_cpu_times()
+        if current is None or self._cpu_times is None:
+            load = os.getloadavg()[0] if hasattr(os, "getloadavg") else 0.0
+            return min(100.0, load / (os.cpu_count() or 1) * 100)
+        busy = current[0] - self._cpu_times[0]
+        total = current[1] - self._cpu_times[1]
+        self._cpu_times = current
+        return busy / total * 100 if total > 0 else 0.0
+
+    def _memory(self) -> Dict[str, int]:
+        memory = {"mem_total": 0, "mem_available": 0, "mem_rss": 0}
+        meminfo = _read_proc("/proc/meminfo")
+        if meminfo:
+            for line in meminfo.splitlines():
+                key, _, value = line.partition(":")
+                if key == "MemTotal":
+                    memory["mem_total"] = int(value.split()[0]) * 1024
+                elif key == "MemAvailable":
+                    memory["mem_available"] = int(value.split()[0]) * 1024
+        statm = _read_proc("/proc/self/statm")
+        if statm:
+            memory["mem_rss"] = int(statm.split()[1]) * self._page_size
+        return memory
+
+    def _io_rates(self) -> Dict[str, int]:
+        now = time.monotonic()
+        last_time, last_read, last_write = self._io
+        self._io = (now, io_counters.read_bytes, io_counters.write_bytes)
+        elapsed = max(now - last_time, 1e-6)
+        return {
+            "read_bytes_per_sec": int((io_counters.read_bytes - last_read) / elapsed),
+            "write_bytes_per_sec": int((io_counters.write_bytes - last_write) / elapsed),
+        }
+
+    def sample(self) -> dict:
+        vfs = os.statvfs(self.path)
+        fsync_ms = fsync_latency.percentiles(0.5, 0.95, 0.99)
+        snapshot = {
+            # f_bavail : espace réellement disponible pour un process non-root
+            "disk_total": vfs.f_blocks * vfs.f_frsize,
+            "disk_free": vfs.f_bavail * vfs.f_frsize,
+            "cpu_usage": self._cpu_usage(),
+            "rpcs_in_flight": rpc_tracker.total(),
+            "uploads_in_flight": rpc_tracker.in_flight.get("UploadBlock", 0),
+            "downloads_in_flight": rpc_tracker.in_flight.get("DownloadBlock", 0),
+            "fsync_p50_ms": fsync_ms[0.5],
+            "fsync_p95_ms": fsync_ms[0.95],
+            "fsync_p99_ms": fsync_ms[0.99],
+            "sampled_at_ms": int(time.time() * 1000),
+        }
+        snapshot.update(self._memory())
+        snapshot.update(self._io_rates())
+        return snapshot
+
+    async def run(self, on_sample: Optional[Callable[[dict], None]] = None):
+        """Boucle de fond : un échantillon toutes les `interval` secondes"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.snapshot = self.sample()
+                if on_sample is not None:
+                    on_sample(self.snapshot)
+            except Exception as e:
+                # Le dernier relevé reste servi : mieux vaut des stats un peu vieilles que pas de node
+                logger.error(f"❌ Telemetry sample failed: {e}")
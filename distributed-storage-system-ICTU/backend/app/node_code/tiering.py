@@ -0,0 +1,121 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+from typing import List, Tuple
+
+# --- CONFIGURATION DU TIERING ---
+TIER_MOVE_INTERVAL = int(os.getenv("NODE_TIER_MOVE_INTERVAL", 300))            # Secondes entre deux passes
+TIER_DEMOTE_AFTER = int(os.getenv("NODE_TIER_DEMOTE_AFTER", 3 * 24 * 3600))    # Bloc non lu depuis : descend d'un tier
+TIER_PROMOTE_HITS = int(os.getenv("NODE_TIER_PROMOTE_HITS", 4))                # Lectures récentes pour remonter d'un tier
+TIER_HIGH_WATERMARK = float(os.getenv("NODE_TIER_HIGH_WATERMARK", 0.85))       # Remplissage qui force des descentes
+TIER_LOW_WATERMARK = float(os.getenv("NODE_TIER_LOW_WATERMARK", 0.70))         # Cible des descentes, plafond des promotions
+TIER_MB_PER_SEC = float(os.getenv("NODE_TIER_MB_PER_SEC", 50))                 # Budget I/O des déplacements
+TIER_PASS_MAX_BLOCKS = int(os.getenv("NODE_TIER_PASS_MAX_BLOCKS", 10_000))     # Candidats par tier et par passe
+
+logger = logging.getLogger("node.tiering")
+
+class TierMover:
+    """
+    Déplacement de fond des blocs entre tiers (FileBlockStore avec tier_dirs).
+    Les écritures arrivent toujours sur le tier rapide ; à chaque passe :
+      - descente d'un tier des blocs non lus depuis TIER_DEMOTE_AFTER, et des
+        plus froids (moins de lectures récentes, puis plus ancienne lecture)
+        tant qu'un tier dépasse TIER_HIGH_WATERMARK, jusqu'à TIER_LOW_WATERMARK ;
+      - remontée d'un tier des blocs lus au moins TIER_PROMOTE_HITS fois
+        récemment, sans faire passer le tier du dessus au-delà de TIER_LOW_WATERMARK.
+    Les compteurs de lectures sont divisés par deux après chaque passe.
+    Le débit des copies est plafonné à TIER_MB_PER_SEC.
+    Le choix des candidats (parcours de tout l'index) se fait dans un thread,
+    borné à TIER_PASS_MAX_BLOCKS par tier : le reste attend la passe suivante.
+    """
+    def __init__(self, store, mb_per_sec: float = TIER_MB_PER_SEC):
+        self.store = store
+        self.index = store.index
+        self.bytes_per_sec = mb_per_sec * 1024 * 1024
+        self.promoted = 0
+        self.demoted = 0
+
+    def _fill(self, location: int) -> Tuple[int, int]:
+        """(octets occupés, capacité) du disque portant le tier"""
+        vfs = os.statvfs(self.store.tiers[location])
+        capacity = vfs.f_blocks * vfs.f_frsize
+        return capacity - vfs.f_bavail * vfs.f_frsize, capacity
+
+    async def _move(self, content_hash: str, size: int, location: int) -> bool:
+        started = time.monotonic()
+        try:
+            moved = await self.store.move(content_hash, location)
+        except Exception as e:
+            logger.error(f"❌ Could not move {content_hash} to tier {location}: {e}")
+            moved = False
+        # Budget I/O : on dort le temps qu'aurait pris la copie au débit cible
+        await asyncio.sleep(max(0.0, size / self.bytes_per_sec - (time.monotonic() - started)))
+        return moved
+
+    def _coldest(self, location: int, idle_before: float, overflow: bool) -> List[Tuple[str, int, int, int]]:
+        """Bloquant (thread) : plus froids d'abord, moins de lectures récentes puis lecture la plus ancienne"""
+        blocks = self.index.blocks_in(location)
+        if not overflow:
+            blocks = (b for b in blocks if b[2] <= idle_before)
+        return heapq.nsmallest(TIER_PASS_MAX_BLOCKS, blocks, key=lambda b: (b[3], b[2]))
+
+    def _hottest(self, location: int) -> List[Tuple[str, int, int, int]]:
+        """Bloquant (thread) : plus lus d'abord, puis lecture la plus récente"""
+        hot = (b for b in self.index.blocks_in(location) if b[3] >= TIER_PROMOTE_HITS)
+        return heapq.nlargest(TIER_PASS_MAX_BLOCKS, hot, key=lambda b: (b[3], b[2]))
+
+    async def demote(self, location: int) -> int:
+        """Descend les blocs froids du tier `location` vers le suivant"""
+        used, capacity = self._fill(location)
+        overflow = used - TIER_LOW_WATERMARK * capacity if used > TIER_HIGH_WATERMARK * capacity else 0
+        target_used, target_capacity = self._fill(location + 1)
+        idle_before = time.time() - TIER_DEMOTE_AFTER
+        moved = 0
+        candidates = await asyncio.to_thread(self._coldest, location, idle_before, overflow > 0)
+        for content_hash, size, last_access, hits in candidates:
+            if overflow <= 0 and last_access > idle_before:
+                continue
+            if target_used + size > TIER_HIGH_WATERMARK * target_capacity:
+                logger.warning(f"⚠️  Tier {location + 1} is full, cannot demote from tier {location}")
+                break
+            if await self._move(content_hash, size, location + 1):
+                moved += 1
+                overflow -= size
+                target_used += size
+        self.demoted += moved
+        return moved
+
+    async def promote(self, location: int) -> int:
+        """Remonte les blocs redevenus chauds du tier `location` vers le précédent"""
+        used, capacity = self._fill(location - 1)
+        room = TIER_LOW_WATERMARK * capacity - used
+        moved = 0
+        for content_hash, size, _, _ in await asyncio.to_thread(self._hottest, location):
+            if size > room:
+                break
+            if await self._move(content_hash, size, location - 1):
+                moved += 1
+                room -= size
+        self.promoted += moved
+        return moved
+
+    async def run_pass(self):
+        demoted = promoted = 0
+        for location in range(len(self.store.tiers) - 1):
+            demoted += await self.demote(location)
+        for location in range(1, len(self.store.tiers)):
+            promoted += await self.promote(location)
+        await asyncio.to_thread(self.index.decay_heat)
+        if demoted or promoted:
+            logger.info(f"🗄️  Tiering pass: {demoted} blocks demoted, {promoted} promoted")
+
+    async def run(self, interval: int = TIER_MOVE_INTERVAL):
+        """Tâche de fond lancée par l'agent"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.run_pass()
+            except Exception as e:
+                logger.error(f"❌ Tiering pass failed: {e}")
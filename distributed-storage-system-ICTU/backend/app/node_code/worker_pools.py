@@ -0,0 +1,84 @@
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from .io_scheduler import IoScheduler, QOS_ENABLED
+
+# --- CONFIGURATION DES POOLS ---
+# Des threads suffisent : hashlib et cryptography relâchent le GIL sur les gros buffers
+CPU_WORKERS = int(os.getenv("NODE_CPU_WORKERS", os.cpu_count() or 4))
+IO_WORKERS = int(os.getenv("NODE_IO_WORKERS", 16))
+# En dessous, le coût du passage par un thread dépasse celui du calcul
+CPU_OFFLOAD_MIN = int(os.getenv("NODE_CPU_OFFLOAD_MIN", 64 * 1024))
+
+logger = logging.getLogger("node.pools")
+
+class WorkerPool:
+    """
+    Pool de threads dédié à une famille d'appels bloquants (CPU ou disque),
+    pour que l'event loop gRPC reste disponible (HealthCheck, petits RPC).
+    Tient des compteurs lisibles en O(1) pour les métriques.
+    Avec un scheduler (pool I/O), l'ordre de passage des appels en attente
+    suit la QoS par classe de trafic au lieu de la file FIFO de l'executor.
+    """
+    def __init__(self, name: str, workers: int, scheduler: Optional[IoScheduler] = None):
+        self.name = name
+        self.workers = workers
+        self.scheduler = scheduler
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"node-{name}")
+        self._lock = threading.Lock()
+        self.active = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.completed = 0
+
+    def _call(self, fn: Callable, args: tuple) -> Any:
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+
+    async def run(self, fn: Callable, *args, cost: int = 0) -> Any:
+        """Exécute fn(*args) dans le pool et attend le résultat (cost : octets lus / écrits)"""
+        with self._lock:
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+        if self.scheduler is None:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, self._call, fn, args)
+        try:
+            io_class = await self.scheduler.acquire(cost)
+        except BaseException:
+            with self._lock:
+                self.queued -= 1
+            raise
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, self._call, fn, args)
+        finally:
+            self.scheduler.release(io_class)
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "workers": self.workers,
+            "active": self.active,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "completed": self.completed,
+        }
+
+cpu_pool = WorkerPool("cpu", CPU_WORKERS)
+io_pool = WorkerPool("io", IO_WORKERS, scheduler=IoScheduler(IO_WORKERS) if QOS_ENABLED else None)
+
+async def run_cpu(fn: Callable, *args, size: int = CPU_OFFLOAD_MIN) -> Any:
+    """Calcul sur size octets : dans le pool CPU, ou inline si c'est trop petit pour valoir un thread"""
+    if size < CPU_OFFLOAD_MIN:
+        return fn(*args)
+    return await cpu_pool.run(fn, *args)
@@ -0,0 +1,187 @@
+import time
+import random
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.database import models
+from app.orchestrator.load_balancer import LoadBalancer
+from app.orchestrator.node_manager import NodeManager
+from app.orchestrator.scrub_coordinator import ScrubCoordinator
+from app.protos import admin_control_pb2, node_pb2
+
+logger = logging.getLogger("orchestrator.drain")
+
+DRAIN_PARALLELISM = 4     # Appels ReplicateTo simultanés depuis le node drainé
+DRAIN_BATCH = 1000        # Hash par appel ReplicateTo
+MAX_REPORTED_ERRORS = 100 # Échantillon d'erreurs gardé dans le rapport
+
+class DrainCoordinator:
+    """
+    Vidage d'un node avant décommission, sans interruption de service :
+    le node passe en maintenance (lecture seule, plus choisi pour les
+    écritures, lu en dernier recours), puis chacun de ses blocs est copié
+    de node à node (ReplicateTo) vers un node en service qui ne l'a pas déjà,
+    pour que le nombre de copies reste inchangé une fois le node retiré.
+    block_replicas suit les copies : la cible y est ajoutée dès que le bloc
+    y est arrivé, et les lignes du node drainé disparaissent quand le
+    drain s'est terminé sans échec.
+    Le parallélisme est borné (DRAIN_PARALLELISM appels, chacun limité côté
+    node) pour ne pas dégrader la latence des lectures clientes.
+    """
+    def __init__(self, db: Session, parallelism: int = DRAIN_PARALLELISM):
+        self.db = db
+        self.node_manager = NodeManager(db)
+        self.lb = LoadBalancer(db)
+        self.scrub = ScrubCoordinator(db)
+        self.parallelism = parallelism
+
+    @staticmethod
+    def _pick(candidates: List[models.NodeStats], exclude) -> Optional[str]:
+        """Cible pondérée par l'espace libre, parmi les nodes qui n'ont pas le bloc"""
+        eligible = [node for node in candidates if node.node_id not in exclude]
+        if not eligible:
+            return None
+        return random.choices(eligible, weights=[node.disk_free for node in eligible])[0].node_id
+
+    @staticmethod
+    def _fail(progress: dict, content_hash: str, error: str):
+        progress["failed"] += 1
+        if len(progress["errors"]) < MAX_REPORTED_ERRORS:
+            progress["errors"][content_hash] = error
+
+    async def _replicate(self, client, target: str, hashes: List[str], semaphore: asyncio.Semaphore, progress: dict) -> List[str]:
+        """Copie node à node ; renvoie les blocs présents sur la cible (copiés ou déjà là)"""
+        request = node_pb2.ReplicateRequest(target=self.node_manager.node_address(target), hashes=hashes)
+        landed = []
+        async with semaphore:
+            try:
+                async for result in client.ReplicateTo(request):
+                    if not result.success:
+                        self._fail(progress, result.hash, result.error_message)
+                        continue
+                    if result.skipped:
+                        progress["skipped"] += 1
+                    else:
+                        progress["copied"] += 1
+                        progress["bytes"] += result.bytes
+                    landed.append(result.hash)
+            except Exception as e:
+                logger.error(f"❌ ReplicateTo {target} failed: {e}")
+                for content_hash in hashes:
+                    self._fail(progress, content_hash, str(e))
+                return []
+        return landed
+
+    def _record_replicas(self, node_id: str, landed: Dict[str, List[str]]):
+        """Ajoute les nouvelles copies à block_replicas, avec la taille connue pour le node drainé"""
+        hashes = [h for target_hashes in landed.values() for h in target_hashes]
+        if not hashes:
+            return
+        sizes = dict(self.db.query(models.BlockReplica.block_hash, models.BlockReplica.size).filter(
+            models.BlockReplica.node_id == node_id, models.BlockReplica.block_hash.in_(hashes)
+        ))
+        rows = [
+            {"block_hash": h, "node_id": target, "size": sizes.get(h)}
+            for target, target_hashes in landed.items() for h in target_hashes
+        ]
+        self.db.execute(insert(models.BlockReplica).values(rows).on_conflict_do_nothing())
+        self.db.commit()
+
+    async def _move_shard(self, shard: models.BlockShard, target: str, client, semaphore, progress: dict):
+        if await self._replicate(client, target, [shard.shard_hash], semaphore, progress):
+            shard.node_id = target
+
+    async def _move_shards(self, node_id: str, client, candidates, semaphore, progress: dict) -> set:
+        """
+        Shards erasure-codés du node : la cible ne doit porter aucun autre shard
+        du même bloc, et la ligne block_shards suit la copie.
+        """
+        rows = self.db.query(models.BlockShard).filter(models.BlockShard.node_id == node_id).all()
+        for i in range(0, len(rows), DRAIN_BATCH):
+            moves = []
+            for shard in rows[i:i + DRAIN_BATCH]:
+                holders = {s.node_id for s in self.db.query(models.BlockShard).filter_by(block_hash=shard.block_hash)}
+                # Deux shards du même bloc déplacés dans ce lot ne doivent pas atterrir ensemble
+                holders.update(target for other, target in moves if other.block_hash == shard.block_hash)
+                target = self._pick(candidates, holders)
+                if target is None:
+                    self._fail(progress, shard.shard_hash, "No eligible target for shard")
+                else:
+                    moves.append((shard, target))
+            await asyncio.gather(*(
+                self._move_shard(shard, target, client, semaphore, progress) for shard, target in moves
+            ))
+            self.db.commit()
+            progress["done"] += len(rows[i:i + DRAIN_BATCH])
+        return {shard.shard_hash for shard in rows}
+
+    async def drain(self, node_id: str, on_progress: Optional[Callable[[dict], None]] = None) -> dict:
+        """
+        Met le node en maintenance puis recopie tous ses blocs ailleurs.
+        on_progress(progress) est appelé après chaque lot. Le node reste en
+        maintenance à la fin : il peut être arrêté si "failed" vaut 0.
+        """
+        admin = self.node_manager.get_admin_client(node_id)
+        client = self.node_manager.get_node_client(node_id)
+        if admin is None or client is None:
+            raise ValueError(f"Unknown node {node_id}")
+
+        await admin.SetMaintenanceMode(admin_control_pb2.MaintenanceRequest(enable=True, reason="drain"))
+        self.node_manager.set_status(node_id, "MAINTENANCE")
+        health = await client.HealthCheck(node_pb2.Empty())
+
+        progress = {
+            "node_id": node_id,
+            "blocks_total": health.block_count,
+            "done": 0, "copied": 0, "skipped": 0, "failed": 0, "bytes": 0,
+            "cursor": "",
+            "started_at": int(time.time()),
+            "errors": {},
+        }
+        semaphore = asyncio.Semaphore(self.parallelism)
+        candidates = self.lb.writable_nodes(0, exclude=[node_id])
+        if not candidates:
+            raise Exception("No serving node available to receive the drained blocks")
+
+        shard_hashes = await self._move_shards(node_id, client, candidates, semaphore, progress)
+
+        async for listing in admin.ListBlocks(admin_control_pb2.ListBlocksRequest()):
+            hashes = [h for h in listing.hashes if h not in shard_hashes]
+            for i in range(0, len(hashes), DRAIN_BATCH):
+                batch = hashes[i:i + DRAIN_BATCH]
+                # Les nodes qui ont déjà le bloc ne comptent pas comme nouvelle copie
+                holders = await self.scrub.find_replicas(batch, exclude=node_id)
+                by_target: Dict[str, List[str]] = defaultdict(list)
+                for content_hash in batch:
+                    target = self._pick(candidates, set(holders.get(content_hash, ())))
+                    if target is None:
+                        # Déjà présent partout ailleurs : rien à copier
+                        progress["skipped"] += 1
+                    else:
+                        by_target[target].append(content_hash)
+
+                results = await asyncio.gather(*(
+                    self._replicate(client, target, target_hashes, semaphore, progress)
+                    for target, target_hashes in by_target.items()
+                ))
+                self._record_replicas(node_id, dict(zip(by_target, results)))
+                progress["done"] += len(batch)
+                progress["cursor"] = batch[-1]
+                if on_progress is not None:
+                    on_progress(progress)
+
+        if progress["failed"] == 0:
+            # Toutes les copies sont ailleurs : le node drainé ne doit plus être choisi en lecture
+            self.db.query(models.BlockReplica).filter_by(node_id=node_id).delete(synchronize_session=False)
+            self.db.commit()
+        progress["finished_at"] = int(time.time())
+        logger.info(
+            f"🚚 Drain of {node_id} done: {progress['copied']} copied, "
+            f"{progress['skipped']} skipped, {progress['failed']} failed"
+        )
+        return progress
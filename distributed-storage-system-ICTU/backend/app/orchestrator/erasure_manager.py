@@ -0,0 +1,206 @@
+import asyncio
+import hashlib
+import logging
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.database import models
+from app.orchestrator.load_balancer import LoadBalancer
+from app.orchestrator.node_manager import NodeManager
+from app.protos import node_pb2
+from app.services.erasure_coding import ReedSolomon
+from app.services.storage_policy import parse_storage_class
+
+logger = logging.getLogger("orchestrator.erasure")
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024   # Bien sous la limite de 4MB par message gRPC
+# Indication de QoS pour les nodes : ces I/O passent après le trafic client
+BACKGROUND_IO_METADATA = (("x-io-class", "replication"),)
+
+class ErasureManager:
+    """
+    Stockage des blocs en classe "ec:K+M" : le bloc est découpé en K shards de
+    données + M shards de parité (Reed-Solomon), chacun posé sur un node
+    distinct comme un bloc ordinaire (nommé par son propre SHA-256).
+    Surcoût disque (K+M)/K au lieu de 3x, et le bloc survit à la perte de
+    n'importe quels M nodes.
+    background=True (réparation, ré-encodage) : les transferts sont annoncés
+    aux nodes comme trafic de fond.
+    """
+    def __init__(self, db: Session, background: bool = False):
+        self.db = db
+        self.node_manager = NodeManager(db)
+        self.lb = LoadBalancer(db)
+        self.metadata = BACKGROUND_IO_METADATA if background else None
+
+    # --- TRANSFERTS ---
+
+    @staticmethod
+    async def _chunks(shard_hash: str, data: bytes) -> AsyncIterator[node_pb2.FileChunk]:
+        for i in range(0, max(len(data), 1), UPLOAD_CHUNK_SIZE):
+            yield node_pb2.FileChunk(data=data[i:i + UPLOAD_CHUNK_SIZE], block_hash=shard_hash if i == 0 else "")
+
+    async def _upload(self, node_id: str, shard_hash: str, data: bytes):
+        client = self.node_manager.get_node_client(node_id)
+        if client is None:
+            raise Exception(f"No client for {node_id}")
+        response = await client.UploadBlock(self._chunks(shard_hash, data), metadata=self.metadata)
+        if not response.success:
+            raise Exception(f"{node_id} rejected shard {shard_hash}: {response.error_message}")
+
+    async def _download(self, shard: models.BlockShard) -> Optional[bytes]:
+        """Contenu du shard, ou None s'il est injoignable / absent / altéré"""
+        client = self.node_manager.get_node_client(shard.node_id)
+        if client is None:
+            return None
+        try:
+            request = node_pb2.DownloadRequest(hash=shard.shard_hash)
+            parts = [chunk.data async for chunk in client.DownloadBlock(request, metadata=self.metadata)]
+        except Exception as e:
+            logger.warning(f"⚠️ Shard {shard.block_hash}#{shard.shard_index} unreadable on {shard.node_id}: {e}")
+            return None
+        data = b"".join(parts)
+        if hashlib.sha256(data).hexdigest() != shard.shard_hash:
+            logger.warning(f"⚠️ Shard {shard.block_hash}#{shard.shard_index} corrupt on {shard.node_id}")
+            return None
+        return data
+
+    async def _fetch(self, shards: List[models.BlockShard], needed: int) -> Dict[int, bytes]:
+        """
+        Lit au moins `needed` shards, données d'abord (aucun décodage s'ils
+        répondent tous), en passant aux parités à mesure que des lectures échouent.
+        """
+        pending = sorted(shards, key=lambda s: s.shard_index)
+        found: Dict[int, bytes] = {}
+        while len(found) < needed and pending:
+            batch, pending = pending[:needed - len(found)], pending[needed - len(found):]
+            results = await asyncio.gather(*(self._download(shard) for shard in batch))
+            for shard, data in zip(batch, results):
+                if data is not None:
+                    found[shard.shard_index] = data
+        return found
+
+    # --- ÉCRITURE / LECTURE ---
+
+    def _block(self, content_hash: str) -> models.Block:
+        block = self.db.query(models.Block).filter_by(hash=content_hash).first()
+        if block is None:
+            raise KeyError(f"Unknown block {content_hash}")
+        return block
+
+    async def store_block(self, content_hash: str, data: bytes, storage_class: str):
+        """Encode le bloc et pose ses K+M shards sur autant de nodes distincts"""
+        k, m = parse_storage_class(storage_class)
+        block = self._block(content_hash)
+        codec = ReedSolomon(k, m)
+
+        shards = await asyncio.to_thread(codec.encode, data)
+        hashes = [hashlib.sha256(shard).hexdigest() for shard in shards]
+        targets = self.lb.select_write_nodes(len(shards[0]), replicas=codec.total_shards)
+        if len(set(targets)) < codec.total_shards:
+            raise Exception(f"{storage_class} needs {codec.total_shards} distinct nodes")
+
+        await asyncio.gather(*(
+            self._upload(node_id, shard_hash, shard)
+            for node_id, shard_hash, shard in zip(targets, hashes, shards)
+        ))
+
+        # Les anciens shards (autre schéma) deviennent orphelins : le GC les ramassera
+        block.shards = [
+            models.BlockShard(shard_index=i, shard_hash=hashes[i], node_id=targets[i], size=len(shards[i]))
+            for i in range(codec.total_shards)
+        ]
+        block.storage_class = storage_class
+        self.db.commit()
+        logger.info(f"🧩 {content_hash} stored as {storage_class} on {len(targets)} nodes")
+
+    async def read_block(self, content_hash: str, block: Optional[models.Block] = None) -> bytes:
+        """
+        Lecture normale (shards de données) ou dégradée (n'importe quels K shards).
+        block : ligne déjà chargée avec ses shards (lecture sans accès DB)
+        """
+        block = block if block is not None else self._block(content_hash)
+        k, m = parse_storage_class(block.storage_class)
+        found = await self._fetch(block.shards, k)
+        if len(found) < k:
+            raise Exception(f"Block {content_hash} unrecoverable: {len(found)}/{k} shards readable")
+        if any(index >= k for index in found):
+            logger.warning(f"⚠️ Degraded read of {content_hash} ({sorted(found)})")
+        return await asyncio.to_thread(ReedSolomon(k, m).decode, found, block.size)
+
+    # --- RÉPARATION ---
+
+    async def _missing(self, shards: List[models.BlockShard]) -> List[int]:
+        """Index des shards absents de leur node (HasBlocks, un appel par node)"""
+        missing = []
+        for shard in shards:
+            client = self.node_manager.get_node_client(shard.node_id)
+            try:
+                answer = None
+                if client is not None:
+                    async for answer in client.HasBlocks(self._batch([shard.shard_hash])):
+                        break
+                if answer is None or not (answer.bitmap and answer.bitmap[0] & 1):
+                    missing.append(shard.shard_index)
+            except Exception:
+                missing.append(shard.shard_index)
+        return missing
+
+    @staticmethod
+    async def _batch(hashes: List[str]) -> AsyncIterator[node_pb2.HashBatch]:
+        yield node_pb2.HashBatch(hashes=hashes)
+
+    async def repair_block(self, content_hash: str, lost: Optional[Iterable[int]] = None) -> int:
+        """
+        Recalcule uniquement les shards perdus (à partir de K survivants) et les
+        repose sur des nodes qui ne portent pas déjà un shard du bloc.
+        lost : index à reconstruire, détectés via HasBlocks si absent.
+        Retourne le nombre de shards reconstruits.
+        """
+        block = self._block(content_hash)
+        k, m = parse_storage_class(block.storage_class)
+        lost = sorted(set(lost)) if lost is not None else await self._missing(block.shards)
+        if not lost:
+            return 0
+
+        survivors = [shard for shard in block.shards if shard.shard_index not in lost]
+        found = await self._fetch(survivors, k)
+        if len(found) < k:
+            logger.critical(f"🚨 Block {content_hash} unrecoverable: {len(found)}/{k} shards readable")
+            return 0
+
+        rebuilt = await asyncio.to_thread(ReedSolomon(k, m).reconstruct, found, lost)
+        # Ni un node qui a déjà un shard du bloc, ni celui qui vient de perdre le sien
+        holders = [shard.node_id for shard in block.shards]
+        size = max(len(data) for data in rebuilt.values())
+        targets = self.lb.select_write_nodes(size, replicas=len(lost), exclude=holders)
+
+        by_index = {shard.shard_index: shard for shard in block.shards}
+        await asyncio.gather(*(
+            self._upload(node_id, by_index[index].shard_hash, rebuilt[index])
+            for node_id, index in zip(targets, lost)
+        ))
+        for node_id, index in zip(targets, lost):
+            by_index[index].node_id = node_id
+        self.db.commit()
+        logger.info(f"🩹 {content_hash}: shards {lost} rebuilt on {targets}")
+        return len(lost)
+
+    async def repair_node(self, node_id: str) -> int:
+        """Reconstruit ailleurs tous les shards portés par un node perdu"""
+        rows = self.db.query(models.BlockShard.block_hash, models.BlockShard.shard_index).filter(
+            models.BlockShard.node_id == node_id
+        ).all()
+        lost: Dict[str, List[int]] = {}
+        for block_hash, shard_index in rows:
+            lost.setdefault(block_hash, []).append(shard_index)
+
+        repaired = 0
+        for block_hash, indices in lost.items():
+            try:
+                repaired += await self.repair_block(block_hash, indices)
+            except Exception as e:
+                logger.error(f"❌ Shard repair failed for {block_hash}: {e}")
+        logger.info(f"🩹 {node_id}: {repaired} erasure-coded shards rebuilt")
+        return repaired
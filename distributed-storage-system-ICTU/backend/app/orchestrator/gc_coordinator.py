@@ -0,0 +1,84 @@
+import random
+import logging
+from typing import AsyncIterator, Dict
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.node_code.block_index import BloomFilter
+from app.orchestrator.node_manager import NodeManager
+from app.protos import admin_control_pb2
+from app.services.block_ref_service import BlockRefService
+
+logger = logging.getLogger("orchestrator.gc")
+
+# Faux positifs = blocs morts conservés jusqu'au prochain passage, jamais de perte
+GC_FILTER_FP_RATE = 0.01
+FILTER_CHUNK_SIZE = 1024 * 1024   # Bien sous la limite de 4MB par message gRPC
+
+class GCCoordinator:
+    """
+    Phase "mark" du garbage collector : construit un filtre de Bloom des blocs
+    référencés (refcount > 0) en streamant la table blocks, puis l'envoie à
+    chaque node qui fait le "sweep" localement (AdminControl.TriggerGC).
+    Mémoire : ~10 bits par bloc vivant, indépendamment du nombre de nodes.
+    """
+    def __init__(self, db: Session):
+        self.db = db
+        self.refs = BlockRefService(db)
+        self.node_manager = NodeManager(db)
+
+    def build_live_filter(self) -> BloomFilter:
+        # Seed tiré au hasard : un bloc mort protégé par un faux positif ne l'est plus au passage suivant
+        live = BloomFilter(self.refs.count_live(), GC_FILTER_FP_RATE, seed=random.randrange(4))
+        for content_hash in self.refs.iter_live_hashes():
+            live.add(bytes.fromhex(content_hash))
+        return live
+
+    @staticmethod
+    async def _requests(live: BloomFilter, aggressive: bool, grace_seconds: int) -> AsyncIterator[admin_control_pb2.GCRequest]:
+        yield admin_control_pb2.GCRequest(
+            aggressive=aggressive,
+            filter_bits=live.num_bits,
+            filter_k=live.k,
+            filter_seed=live.seed,
+            grace_seconds=grace_seconds
+        )
+        bits = bytes(live.bits)
+        for i in range(0, len(bits), FILTER_CHUNK_SIZE):
+            yield admin_control_pb2.GCRequest(filter_chunk=bits[i:i + FILTER_CHUNK_SIZE])
+
+    async def run(self, aggressive: bool = False, grace_seconds: int = 0) -> Dict[str, int]:
+        """
+        Lance un GC sur tous les nodes, l'un après l'autre pour ne pas saturer
+        le cluster. Retourne les octets libérés par node.
+        """
+        # Chunks d'un upload reprenable en cours : sans référence jusqu'à la finalisation
+        grace_seconds = max(grace_seconds, settings.UPLOAD_SESSION_TTL)
+        live = self.build_live_filter()
+        logger.info(f"🗑️  Live-block filter built ({live.num_bits // 8} bytes, seed {live.seed})")
+
+        freed: Dict[str, int] = {}
+        complete = True
+        for node_id in self.node_manager.list_node_ids():
+            client = self.node_manager.get_admin_client(node_id)
+            if client is None:
+                complete = False
+                continue
+            try:
+                response = await client.TriggerGC(self._requests(live, aggressive, grace_seconds))
+            except Exception as e:
+                logger.error(f"GC failed on {node_id}: {e}")
+                complete = False
+                continue
+            freed[node_id] = response.freed_bytes
+            logger.info(
+                f"🗑️  {node_id}: {response.blocks_deleted}/{response.blocks_scanned} blocks deleted, "
+                f"{response.freed_bytes} bytes freed"
+            )
+
+        # Les lignes à 0 référence ne servent plus qu'une fois tous les nodes balayés
+        if complete:
+            purged = self.refs.purge_unreferenced()
+            logger.info(f"🗑️  {purged} unreferenced block rows purged")
+        return freed
@@ -6,10 +6,15 @@ from datetime import datetime, timedelta
 from app.database import models
 from app.database.db import SessionLocal
 from app.orchestrator.node_manager import NodeManager
+from app.orchestrator.scrub_coordinator import ScrubCoordinator
+from app.protos import node_pb2
 from app.core.events import event_bus
 
 logger = logging.getLogger("orchestrator.health")
 
+# Statuts d'un node vivant : FULL, MAINTENANCE et STARTING servent encore les lectures
+LIVE_STATUSES = ("SERVING", "FULL", "MAINTENANCE", "STARTING")
+
 class HealthChecker:
     def __init__(self):
         self.running = False
@@ -45,20 +50,40 @@ class HealthChecker:
         try:
             # Appel gRPC avec Timeout court (Fast Fail)
             # On suppose une méthode 'HealthCheck' dans le proto
-            response = await asyncio.wait_for(client.HealthCheck(xml_pb2.Empty()), timeout=2.0)
+            response = await asyncio.wait_for(client.HealthCheck(node_pb2.Empty()), timeout=2.0)
             
-            if response.status != "SERVING":
-                await self._mark_node_offline(node.node_id)
+            if response.status not in LIVE_STATUSES:
+                await self._mark_node_offline(node.node_id, manager)
             else:
-                # Mise à jour de la date de dernière vue
+                # Télémétrie réelle du node : c'est elle qui pondère le placement (LoadBalancer)
                 # (Idéalement fait dans Redis pour la perf, ici simplifié SQL)
-                pass 
+                manager.update_stats(
+                    node.node_id,
+                    used=response.disk_used,
+                    free=response.disk_free,
+                    cpu=response.cpu_usage,
+                    total=response.disk_total,
+                    ram_usage=(1 - response.mem_available / response.mem_total) * 100 if response.mem_total else None,
+                    ram_available=response.mem_available,
+                    connections=response.rpcs_in_flight,
+                    status=response.status
+                )
+                if response.corrupt_blocks:
+                    await self._repair_corrupt_blocks(node.node_id, manager)
 
         except (asyncio.TimeoutError, Exception) as e:
             logger.warning(f"⚠️ Node {node.node_id} is unreachable: {e}")
-            await self._mark_node_offline(node.node_id)
+            await self._mark_node_offline(node.node_id, manager)
+
+    async def _repair_corrupt_blocks(self, node_id: str, manager: NodeManager):
+        """Le scrubber du node a mis des blocs en quarantaine : on les fait réécrire"""
+        try:
+            await ScrubCoordinator(manager.db).repair_node(node_id)
+        except Exception as e:
+            logger.error(f"Scrub repair failed for {node_id}: {e}")
 
-    async def _mark_node_offline(self, node_id: str):
+    async def _mark_node_offline(self, node_id: str, manager: NodeManager):
         """Déclare un node mort et déclenche les réparations"""
+        manager.set_status(node_id, "OFFLINE")
         # Publie l'événement pour que le ReplicationManager réagisse
         await event_bus.publish("node_offline", {"node_id": node_id})
\ No newline at end of file
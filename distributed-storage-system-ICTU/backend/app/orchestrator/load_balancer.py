@@ -1,24 +1,40 @@
 import random
-from typing import List
+from typing import Iterable, List
 from sqlalchemy.orm import Session
 from app.database import models
 import logging
 
 logger = logging.getLogger("orchestrator.load_balancer")
 
+# Seuls les nodes SERVING reçoivent de nouveaux blocs (FULL / MAINTENANCE / STARTING / OFFLINE exclus)
+WRITABLE_STATUS = "SERVING"
+# Ordre de préférence en lecture : un node en maintenance (souvent en cours de drain)
+# ou qui reconstruit son index (lectures plus lentes) passe après
+READ_PREFERENCE = {"SERVING": 0, "FULL": 0, "MAINTENANCE": 1, "STARTING": 1}
+
 class LoadBalancer:
     def __init__(self, db: Session):
         self.db = db
 
-    def select_write_nodes(self, file_size: int, replicas: int = 3) -> List[str]:
+    def writable_nodes(self, file_size: int, exclude: Iterable[str] = ()) -> List[models.NodeStats]:
+        """Nodes en service avec assez d'espace + Buffer de sécurité (1GB)"""
+        query = self.db.query(models.NodeStats).filter(
+            models.NodeStats.status == WRITABLE_STATUS,
+            models.NodeStats.disk_free > (file_size + 1024**3)
+        )
+        exclude = list(exclude)
+        if exclude:
+            query = query.filter(models.NodeStats.node_id.notin_(exclude))
+        return query.all()
+
+    def select_write_nodes(self, file_size: int, replicas: int = 3, exclude: Iterable[str] = ()) -> List[str]:
         """
         Sélectionne N nodes capables d'accueillir le fichier.
         Algorithme : Weighted Random (Pondéré par l'espace libre).
+        exclude : nodes à écarter (ex: ceux qui portent déjà un shard du bloc)
         """
-        # 1. Filtrer les nodes qui ont assez d'espace + Buffer de sécurité (1GB)
-        candidates = self.db.query(models.NodeStats).filter(
-            models.NodeStats.disk_free > (file_size + 1024**3)
-        ).all()
+        # 1. Filtrer les nodes en service qui ont assez d'espace
+        candidates = self.writable_nodes(file_size, exclude)
 
         if len(candidates) < replicas:
             logger.critical("Not enough storage nodes available!")
@@ -51,6 +67,12 @@ class LoadBalancer:
         Pour la lecture, on choisit le node avec le moins de latence réseau
         ou le moins de charge CPU active.
         (Ici simplifié par un choix aléatoire parmi les répliques vivantes)
+        Les nodes en maintenance ne sont lus qu'en dernier recours.
         """
         # TODO: Ping rapide ou check Redis pour latence
-        return random.choice(replica_ids)
\ No newline at end of file
+        rows = self.db.query(models.NodeStats.node_id, models.NodeStats.status).filter(
+            models.NodeStats.node_id.in_(replica_ids)
+        ).all()
+        ranks = {node_id: READ_PREFERENCE.get(status, 2) for node_id, status in rows}
+        best = min((ranks.get(node_id, 0) for node_id in replica_ids), default=0)
+        return random.choice([node_id for node_id in replica_ids if ranks.get(node_id, 0) == best])
\ No newline at end of file
@@ -1,11 +1,13 @@
 import grpc
-from typing import List, Optional, Dict
+import asyncio
+from typing import Any, Awaitable, List, Optional, Dict
 from sqlalchemy.orm import Session
 from datetime import datetime
 
 from app.database import models
 from app.core.config import settings
 from app.protos import node_pb2, node_pb2_grpc  # Code généré par gRPC
+from app.protos import admin_control_pb2_grpc
 import logging
 
 logger = logging.getLogger("orchestrator.node_manager")
@@ -14,8 +16,10 @@ class NodeManager:
     """
     Singleton gérant les connexions actives aux Nodes de stockage.
     Maintient un pool de connexions gRPC pour éviter de les recréer à chaque requête.
+    Un canal grpc.aio est lié à la boucle asyncio qui l'a créé : le cache est
+    tenu par boucle (l'API n'en a qu'une, chaque tâche Celery crée la sienne).
     """
-    _channels: Dict[str, grpc.Channel] = {}
+    _channels: Dict[asyncio.AbstractEventLoop, Dict[str, grpc.aio.Channel]] = {}
 
     def __init__(self, db: Session):
         self.db = db
@@ -42,32 +46,100 @@ class NodeManager:
         logger.info(f"✅ Node Registered: {node_id} in {region}")
         return new_node
 
-    def get_node_client(self, node_id: str) -> Optional[node_pb2_grpc.StorageNodeStub]:
-        """
-        Retourne un client gRPC (Stub) pour parler au Node.
-        Utilise un cache de channels.
-        """
+    @staticmethod
+    def node_address(node_id: str) -> Optional[str]:
+        """Adresse gRPC "ip:port" d'un node d'après son ID"""
         # Parsing simple de l'ID (ex: node_192.168.1.5_50051)
         try:
             _, ip, port = node_id.split('_')
-            target = f"{ip}:{port}"
+            return f"{ip}:{port}"
         except ValueError:
             logger.error(f"Invalid Node ID format: {node_id}")
             return None
 
-        if node_id not in self._channels:
+    def _get_channel(self, node_id: str) -> Optional[grpc.aio.Channel]:
+        """Canal gRPC du node, partagé par tous les services (cache de channels)"""
+        target = self.node_address(node_id)
+        if target is None:
+            return None
+
+        channels = self._channels.setdefault(asyncio.get_running_loop(), {})
+        if node_id not in channels:
             # Création du canal sécurisé ou insecure selon la config
-            channel = grpc.aio.insecure_channel(target)
-            self._channels[node_id] = channel
-        
-        return node_pb2_grpc.StorageNodeStub(self._channels[node_id])
+            channels[node_id] = grpc.aio.insecure_channel(target)
+
+        return channels[node_id]
+
+    @classmethod
+    async def close_channels(cls):
+        """Ferme les canaux de la boucle courante (avant qu'elle ne se termine)"""
+        channels = cls._channels.pop(asyncio.get_running_loop(), {})
+        await asyncio.gather(*(channel.close() for channel in channels.values()), return_exceptions=True)
+
+    @classmethod
+    def run(cls, coro: Awaitable[Any]) -> Any:
+        """
+        asyncio.run pour le code synchrone (tâches Celery) : les canaux ouverts
+        pendant la tâche sont fermés avec sa boucle, la tâche suivante du même
+        worker ouvre les siens.
+        """
+        async def _main():
+            try:
+                return await coro
+            finally:
+                await cls.close_channels()
+        return asyncio.run(_main())
+
+    def get_node_client(self, node_id: str) -> Optional[node_pb2_grpc.StorageNodeStub]:
+        """
+        Retourne un client gRPC (Stub) pour parler au Node.
+        Utilise un cache de channels.
+        """
+        channel = self._get_channel(node_id)
+        return node_pb2_grpc.StorageNodeStub(channel) if channel else None
+
+    def get_admin_client(self, node_id: str) -> Optional[admin_control_pb2_grpc.AdminControlStub]:
+        """Client du service d'administration (GC, maintenance) du Node"""
+        channel = self._get_channel(node_id)
+        return admin_control_pb2_grpc.AdminControlStub(channel) if channel else None
+
+    def set_status(self, node_id: str, status: str):
+        """Statut vu par le LoadBalancer (sans attendre le prochain HealthCheck)"""
+        self.db.query(models.NodeStats).filter_by(node_id=node_id).update({"status": status})
+        self.db.commit()
+
+    def list_node_ids(self) -> List[str]:
+        """Nodes connus du cluster (une ligne de stats par heartbeat)"""
+        rows = self.db.query(models.NodeStats.node_id).distinct().all()
+        return [node_id for (node_id,) in rows]
 
-    def update_stats(self, node_id: str, used: int, free: int, cpu: float):
+    def update_stats(
+        self,
+        node_id: str,
+        used: int,
+        free: int,
+        cpu: float,
+        total: Optional[int] = None,
+        ram_usage: Optional[float] = None,
+        ram_available: Optional[int] = None,
+        connections: Optional[int] = None,
+        status: Optional[str] = None
+    ):
         """Met à jour les métriques reçues via Heartbeat"""
         node = self.db.query(models.NodeStats).filter_by(node_id=node_id).first()
         if node:
             node.disk_used = used
             node.disk_free = free
             node.cpu_usage = cpu
+            if total is not None:
+                node.disk_total = total
+            if ram_usage is not None:
+                node.ram_usage = ram_usage
+            if ram_available is not None:
+                node.ram_available = ram_available
+            if connections is not None:
+                node.active_connections = connections
+            if status is not None:
+                node.status = status
             node.recorded_at = datetime.utcnow()
             self.db.commit()
\ No newline at end of file
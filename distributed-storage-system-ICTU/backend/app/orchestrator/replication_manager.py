@@ -55,12 +55,15 @@ class ReplicationManager:
         for file in affected_files:
             self.ensure_redundancy(file.id)
 
+        # Blocs erasure-codés : seuls les shards du node mort sont recalculés
+        celery_app.send_task("app.workers.tasks_replication.repair_erasure_shards", args=[dead_node_id])
+
     def _get_active_replicas(self, file: models.File) -> List[str]:
         # Logique pour vérifier qui est vivant via Redis
         return [file.node_id] # Stub
 
     def _trigger_replication_task(self, file_id: str, source_node: str, target_node: str):
         celery_app.send_task(
-            "worker.replicate_block",
+            "app.workers.tasks_replication.replicate_block",
             args=[file_id, source_node, target_node]
         )
\ No newline at end of file
@@ -0,0 +1,125 @@
+import random
+import logging
+from typing import AsyncIterator, Dict, List, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.database import models
+from app.orchestrator.node_manager import NodeManager
+from app.protos import admin_control_pb2, node_pb2
+from app.workers.celery_app import celery_app
+
+logger = logging.getLogger("orchestrator.scrub")
+
+HAS_BLOCKS_BATCH = 1000
+
+class ScrubCoordinator:
+    """
+    Réparation des blocs trouvés corrompus par le scrubber d'un node.
+    Le node les a déjà mis en quarantaine (retirés de son store) : il suffit
+    de lui renvoyer une copie saine, prise sur un autre node qui a le bloc.
+    Un shard erasure-codé n'a pas de copie : il est recalculé à partir des
+    autres shards du bloc (ErasureManager.repair_block).
+    """
+    def __init__(self, db: Session):
+        self.db = db
+        self.node_manager = NodeManager(db)
+
+    @staticmethod
+    async def _batches(hashes: List[str], touch: bool = False) -> AsyncIterator[node_pb2.HashBatch]:
+        for i in range(0, len(hashes), HAS_BLOCKS_BATCH):
+            yield node_pb2.HashBatch(hashes=hashes[i:i + HAS_BLOCKS_BATCH], touch=touch)
+
+    async def has_blocks(self, node_id: str, hashes: List[str], touch: bool = False) -> List[str]:
+        """
+        Hash présents sur le node (HasBlocks, index en mémoire). touch : le node
+        les rajeunit avant de répondre (protégés de son GC pendant la période de grâce).
+        """
+        client = self.node_manager.get_node_client(node_id)
+        if client is None:
+            return []
+        found = []
+        try:
+            position = 0
+            async for answer in client.HasBlocks(self._batches(hashes, touch)):
+                for i in range(answer.count):
+                    if answer.bitmap[i >> 3] & (1 << (i & 7)):
+                        found.append(hashes[position + i])
+                position += answer.count
+        except Exception as e:
+            logger.warning(f"⚠️ HasBlocks failed on {node_id}: {e}")
+        return found
+
+    async def find_replicas(self, hashes: List[str], exclude: str) -> Dict[str, List[str]]:
+        """Pour chaque hash, les autres nodes qui l'ont"""
+        holders: Dict[str, List[str]] = {}
+        for node_id in self.node_manager.list_node_ids():
+            if node_id == exclude:
+                continue
+            for content_hash in await self.has_blocks(node_id, hashes):
+                holders.setdefault(content_hash, []).append(node_id)
+        return holders
+
+    def _shards(self, node_id: str, hashes: List[str]) -> Dict[str, List[Tuple[int, str]]]:
+        """Hash qui sont des shards erasure-codés du node : bloc -> [(index, hash du shard)]"""
+        shards: Dict[str, List[Tuple[int, str]]] = {}
+        for i in range(0, len(hashes), HAS_BLOCKS_BATCH):
+            rows = self.db.query(
+                models.BlockShard.block_hash, models.BlockShard.shard_index, models.BlockShard.shard_hash
+            ).filter(
+                models.BlockShard.node_id == node_id,
+                models.BlockShard.shard_hash.in_(hashes[i:i + HAS_BLOCKS_BATCH])
+            ).all()
+            for block_hash, shard_index, shard_hash in rows:
+                shards.setdefault(block_hash, []).append((shard_index, shard_hash))
+        return shards
+
+    async def repair_node(self, node_id: str) -> int:
+        """
+        Récupère les signalements du node, planifie une réparation par bloc,
+        puis acquitte ceux qui ont été pris en charge : les autres restent
+        signalés et seront retentés au prochain passage. Retourne le nombre
+        de réparations planifiées.
+        """
+        admin = self.node_manager.get_admin_client(node_id)
+        target = self.node_manager.node_address(node_id)
+        if admin is None or target is None:
+            return 0
+
+        report = await admin.GetScrubReport(admin_control_pb2.ScrubReportRequest())
+        hashes = [block.hash for block in report.corrupt]
+        if not hashes:
+            return 0
+
+        scheduled: List[str] = []
+        shards = self._shards(node_id, hashes)
+        for block_hash, indices in shards.items():
+            celery_app.send_task(
+                "app.workers.tasks_replication.repair_erasure_block",
+                args=[block_hash, sorted(i for i, _ in indices)]
+            )
+            scheduled.extend(shard_hash for _, shard_hash in indices)
+        shard_hashes = set(scheduled)
+
+        replicated = [h for h in hashes if h not in shard_hashes]
+        holders = await self.find_replicas(replicated, exclude=node_id) if replicated else {}
+        for block in report.corrupt:
+            if block.hash in shard_hashes:
+                continue
+            sources = holders.get(block.hash)
+            if not sources:
+                # Copie en quarantaine conservée sur le node pour analyse manuelle ;
+                # non acquitté : nouvelle tentative si une réplique réapparaît
+                logger.critical(f"🚨 No healthy replica for corrupt block {block.hash} on {node_id} ({block.reason})")
+                continue
+            source = self.node_manager.node_address(random.choice(sources))
+            celery_app.send_task(
+                "app.workers.tasks_replication.repair_block",
+                args=[block.hash, source, target]
+            )
+            scheduled.append(block.hash)
+
+        if scheduled:
+            await admin.GetScrubReport(admin_control_pb2.ScrubReportRequest(acknowledge=scheduled))
+        logger.info(f"🩹 {node_id}: {len(scheduled)}/{len(hashes)} corrupt blocks scheduled for repair")
+        return len(scheduled)
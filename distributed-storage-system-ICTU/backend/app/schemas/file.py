@@ -1,6 +1,6 @@
-from typing import Optional
+from typing import Annotated, List, Optional
 from datetime import datetime
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import BaseModel, ConfigDict, Field, model_validator
 
 # --- 1. CLASSE DE BASE (DOIT ÊTRE EN PREMIER) ---
 class FileBase(BaseModel):
@@ -26,7 +26,75 @@ class FileResponse(FileBase):
     extension: Optional[str] = Field(default="") 
     owner_id: int
     is_trashed: bool = False
+    storage_class: Optional[str] = None
     created_at: datetime
     updated_at: Optional[datetime] = None 
 
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+# --- 5. NÉGOCIATION D'UPLOAD (DÉDUPLICATION) ---
+ChunkHash = Annotated[str, Field(pattern=r"^[0-9a-f]{64}$")]
+
+class ChunkQuery(BaseModel):
+    # 100k chunks de 1MB en moyenne : ~100GB de fichier par requête
+    hashes: List[ChunkHash] = Field(..., max_length=100_000)
+
+class MissingChunks(BaseModel):
+    missing: List[str]
+
+# --- 6. CLASSE DE STOCKAGE ---
+class StorageClassUpdate(BaseModel):
+    # "replicated", "ec:6+3"... None = hérite du dossier parent
+    storage_class: Optional[str] = Field(default=None, pattern=r"^(replicated|ec:\d{1,3}\+\d{1,3})$")
+
+# --- 7. UPLOAD REPRENABLE ---
+class ResumableUploadCreate(FileBase):
+    size: int = Field(..., gt=0)
+    mime_type: Optional[str] = None
+
+class ResumableUploadStatus(BaseModel):
+    id: str
+    size: int
+    part_size: int
+    received: List[List[int]]     # Plages d'octets reçues [début, fin)
+    offset: int                   # Fin de la première plage contiguë depuis 0 (Upload-Offset tus)
+    expires_at: int               # Timestamp UNIX
+    file: Optional[FileResponse] = None   # Renseigné une fois le fichier finalisé
+
+# --- 8. UPLOAD INSTANTANÉ (DÉDUPLICATION AVANT ENVOI) ---
+class ManifestEntry(BaseModel):
+    hash: ChunkHash
+    size: int = Field(..., gt=0)
+
+class InstantUploadRequest(FileBase):
+    size: int = Field(..., ge=0)
+    mime_type: Optional[str] = None
+    # SHA-256 du fichier complet et/ou son découpage CDC (mêmes paramètres que le serveur)
+    sha256: Optional[ChunkHash] = None
+    chunks: Optional[List[ManifestEntry]] = Field(default=None, max_length=100_000)
+    # Réponse à un défi de possession : SHA-256 des plages demandées, concaténées
+    challenge_id: Optional[str] = None
+    proof: Optional[ChunkHash] = None
+
+    @model_validator(mode="after")
+    def check_content_id(self):
+        if self.sha256 is None and self.chunks is None:
+            raise ValueError("sha256 ou chunks requis")
+        if self.challenge_id is not None and (self.sha256 is None or self.proof is None):
+            raise ValueError("challenge_id requiert sha256 et proof")
+        return self
+
+class PossessionChallenge(BaseModel):
+    id: str
+    ranges: List[List[int]]   # [offset, longueur] dans le fichier
+    expires_at: int
+
+class InstantUploadResult(BaseModel):
+    # "created" : fichier créé sans transfert
+    # "challenge" : prouver la possession du fichier (plages de `challenge`) puis rappeler
+    # "missing_chunks" : envoyer `missing` (PUT /chunks/{hash}) puis rappeler
+    # "unknown" : contenu inconnu, envoyer le manifest ou faire un upload classique
+    status: str
+    file: Optional[FileResponse] = None
+    challenge: Optional[PossessionChallenge] = None
+    missing: List[str] = []
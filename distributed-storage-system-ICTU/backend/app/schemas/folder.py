@@ -16,6 +16,7 @@ class FolderUpdate(FolderBase):
 class FolderResponse(FolderBase):
     id: str
     parent_id: Optional[str]
+    storage_class: Optional[str] = None
     created_at: datetime
     
     model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
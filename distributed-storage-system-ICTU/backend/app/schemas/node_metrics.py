@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import Any, Dict, Optional
 from pydantic import BaseModel, Field
 
 class DiskUsage(BaseModel):
@@ -20,4 +21,16 @@ class NodeHealth(BaseModel):
     ip_address: str
     latency_ms: float
     last_seen: datetime
-    metrics: SystemResources
\ No newline at end of file
+    metrics: SystemResources
+class MaintenanceUpdate(BaseModel):
+    enable: bool
+    reason: str = ""
+
+class NodeStatusResponse(BaseModel):
+    node_id: str
+    status: str
+
+class DrainStatus(BaseModel):
+    task_id: str
+    state: str # PENDING, PROGRESS, SUCCESS, FAILURE
+    progress: Optional[Dict[str, Any]] = None
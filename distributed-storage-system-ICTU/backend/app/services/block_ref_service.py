@@ -0,0 +1,143 @@
+import logging
+from collections import Counter, defaultdict
+from datetime import timedelta
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy import func, update, delete, exists
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.database import models
+
+logger = logging.getLogger(__name__)
+
+# Paramètres liés par requête : bien en dessous de la limite PostgreSQL (65535)
+BATCH_SIZE = 1000
+
+Manifest = List[Dict]
+
+def _batches(items: list, size: int = BATCH_SIZE) -> Iterator[list]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+class BlockRefService:
+    """
+    Compteurs de références des blocs (chunks CDC) dans la base de métadonnées.
+    Toutes les mises à jour sont groupées (une requête par lot de hash) et
+    s'exécutent dans la transaction de l'appelant : le commit reste à sa charge,
+    pour que le fichier et ses références soient écrits ensemble.
+    """
+    def __init__(self, db: Session):
+        self.db = db
+
+    @staticmethod
+    def _count(manifests: Iterable[Optional[Manifest]]):
+        counts: Counter = Counter()
+        sizes: Dict[str, int] = {}
+        for manifest in manifests:
+            for entry in manifest or []:
+                counts[entry["hash"]] += 1
+                sizes[entry["hash"]] = entry["size"]
+        return counts, sizes
+
+    def add_refs(self, manifests: Iterable[Optional[Manifest]]):
+        """+1 par occurrence de chunk (upload, copie, nouvelle version)"""
+        counts, sizes = self._count(manifests)
+        # Ordre stable des hash : deux transactions concurrentes verrouillent
+        # les lignes dans le même ordre (pas de deadlock)
+        rows = [{"hash": h, "size": sizes[h], "refcount": counts[h]} for h in sorted(counts)]
+        for batch in _batches(rows):
+            stmt = insert(models.Block).values(batch)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[models.Block.hash],
+                set_={"refcount": models.Block.refcount + stmt.excluded.refcount, "updated_at": func.now()},
+            )
+            self.db.execute(stmt)
+
+    def release_refs(self, manifests: Iterable[Optional[Manifest]]):
+        """-1 par occurrence de chunk (suppression définitive)"""
+        counts, _ = self._count(manifests)
+        # Les décréments sont regroupés par valeur : en pratique presque tous valent 1
+        by_delta: Dict[int, List[str]] = defaultdict(list)
+        for content_hash in sorted(counts):
+            by_delta[counts[content_hash]].append(content_hash)
+
+        for delta, hashes in by_delta.items():
+            for batch in _batches(hashes):
+                self.db.execute(
+                    update(models.Block)
+                    .where(models.Block.hash.in_(batch))
+                    .values(refcount=func.greatest(models.Block.refcount - delta, 0), updated_at=func.now())
+                    .execution_options(synchronize_session=False)
+                )
+
+    def add_owner(self, owner_id: int, hashes: Iterable[str]):
+        """L'utilisateur a fourni (ou possède déjà) ces chunks : la négociation pourra les lui annoncer"""
+        rows = [{"block_hash": h, "owner_id": owner_id} for h in sorted(set(hashes))]
+        for batch in _batches(rows):
+            self.db.execute(insert(models.BlockOwner).values(batch).on_conflict_do_nothing())
+
+    def owned(self, owner_id: int, hashes: Iterable[str]) -> set:
+        """Sous-ensemble des chunks que l'utilisateur a fournis ou possède"""
+        found = set()
+        for batch in _batches(list(set(hashes))):
+            rows = self.db.query(models.BlockOwner.block_hash).filter(
+                models.BlockOwner.owner_id == owner_id, models.BlockOwner.block_hash.in_(batch)
+            ).all()
+            found.update(h for (h,) in rows)
+        return found
+
+    def _live_shards(self):
+        """Shards des blocs erasure-codés encore référencés (stockés sur les nodes sous leur propre hash)"""
+        return self.db.query(models.BlockShard.shard_hash).join(
+            models.Block, models.Block.hash == models.BlockShard.block_hash
+        ).filter(models.Block.refcount > 0)
+
+    def _live_blocks(self):
+        """
+        Blocs répliqués encore référencés. Un bloc passé en "ec:K+M" ne vit
+        plus que par ses shards : ses copies complètes sont laissées au GC.
+        """
+        return self.db.query(models.Block.hash).filter(
+            models.Block.refcount > 0, models.Block.storage_class == "replicated"
+        )
+
+    def count_live(self) -> int:
+        blocks = self._live_blocks().with_entities(func.count()).scalar() or 0
+        return blocks + (self._live_shards().with_entities(func.count()).scalar() or 0)
+
+    def iter_live_hashes(self, batch_size: int = 10_000) -> Iterator[str]:
+        """Phase "mark" du GC : curseur serveur, mémoire bornée par batch_size"""
+        query = self._live_blocks()
+        for (content_hash,) in query.yield_per(batch_size):
+            yield content_hash
+        for (shard_hash,) in self._live_shards().yield_per(batch_size):
+            yield shard_hash
+
+    def purge_unreferenced(self) -> int:
+        """Supprime les lignes à 0 référence (après un GC complet du cluster)"""
+        result = self.db.execute(
+            delete(models.Block)
+            .where(models.Block.refcount <= 0)
+            .execution_options(synchronize_session=False)
+        )
+        # Emplacements de blocs que plus rien ne référence (supprimés des nodes par ce GC).
+        # Les plus récents peuvent appartenir à un upload en cours : on les garde un jour.
+        self.db.execute(
+            delete(models.BlockReplica)
+            .where(
+                ~exists().where(models.Block.hash == models.BlockReplica.block_hash),
+                models.BlockReplica.created_at < func.now() - timedelta(days=1),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        self.db.execute(
+            delete(models.BlockOwner)
+            .where(
+                ~exists().where(models.Block.hash == models.BlockOwner.block_hash),
+                models.BlockOwner.created_at < func.now() - timedelta(days=1),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        self.db.commit()
+        return result.rowcount
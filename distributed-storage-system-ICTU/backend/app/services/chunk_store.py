@@ -0,0 +1,130 @@
+import os
+import uuid
+import bisect
+import asyncio
+import hashlib
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import aiofiles
+
+from app.services.chunking_service import FastCDC
+from app.services.range_service import RangeReader, READ_CHUNK_SIZE
+
+# Manifest d'un fichier : liste ordonnée de {"hash": sha256, "size": octets}
+Manifest = List[Dict]
+
+# Racine des chunks côté API (relative au dossier de travail, comme uploads/)
+CHUNK_DIR = os.path.join("uploads", "chunks")
+
+class LocalChunkStore:
+    """
+    Stockage adressé par contenu des chunks CDC : <root>/<hash[:2]>/<hash>.
+    Un chunk déjà présent n'est jamais réécrit (déduplication).
+    """
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, content_hash: str) -> str:
+        return os.path.join(self.root, content_hash[:2], content_hash)
+
+    async def has(self, content_hash: str) -> bool:
+        return os.path.exists(self._path(content_hash))
+
+    async def has_many(self, hashes: List[str]) -> List[bool]:
+        """Présence de chaque chunk, dans l'ordre de la requête"""
+        return [os.path.exists(self._path(h)) for h in hashes]
+
+    async def put(self, content_hash: str, data: bytes) -> bool:
+        """Écrit le chunk s'il est absent. Retourne True si c'est une nouvelle écriture."""
+        path = self._path(content_hash)
+        if os.path.exists(path):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp_{uuid.uuid4().hex}"
+        async with aiofiles.open(tmp_path, mode="wb") as f:
+            await f.write(data)
+        # Rename atomique : un lecteur ne voit jamais un chunk partiel
+        os.replace(tmp_path, path)
+        return True
+
+    async def stream(self, content_hash: str, offset: int = 0, length: int = -1) -> AsyncIterator[bytes]:
+        path = self._path(content_hash)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Chunk {content_hash} introuvable")
+        async with aiofiles.open(path, mode="rb") as f:
+            await f.seek(offset)
+            remaining = length if length >= 0 else os.path.getsize(path) - offset
+            while remaining > 0:
+                data = await f.read(min(READ_CHUNK_SIZE, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+
+    async def delete(self, content_hash: str) -> bool:
+        try:
+            os.remove(self._path(content_hash))
+            return True
+        except FileNotFoundError:
+            return False
+
+class ChunkedWriter:
+    """
+    Découpe un flux en chunks CDC au fil de l'eau, les envoie au store et
+    construit le manifest. Le hash global (File.content_hash) est calculé
+    en parallèle, sans relire le contenu. Découpage et hachage (pur CPU)
+    tournent dans un thread : un gros upload ne bloque pas l'event loop.
+    """
+    def __init__(self, store: LocalChunkStore, chunker: Optional[FastCDC] = None):
+        self.store = store
+        self.chunker = chunker or FastCDC()
+        self.manifest: Manifest = []
+        self.size = 0
+        self.new_bytes = 0
+        self._hasher = hashlib.sha256()
+
+    @staticmethod
+    def _hash_chunks(chunks: List[bytes]) -> List[Tuple[str, bytes]]:
+        return [(hashlib.sha256(chunk).hexdigest(), chunk) for chunk in chunks]
+
+    def _absorb(self, data: bytes) -> List[Tuple[str, bytes]]:
+        # Exécuté dans un thread (hashlib et numpy relâchent le GIL) ; writes séquentiels
+        self._hasher.update(data)
+        return self._hash_chunks(self.chunker.feed(data))
+
+    async def _store_chunks(self, chunks: List[Tuple[str, bytes]]):
+        for chunk_hash, chunk in chunks:
+            if await self.store.put(chunk_hash, chunk):
+                self.new_bytes += len(chunk)
+            self.manifest.append({"hash": chunk_hash, "size": len(chunk)})
+
+    async def write(self, data: bytes):
+        self.size += len(data)
+        await self._store_chunks(await asyncio.to_thread(self._absorb, data))
+
+    async def finish(self) -> str:
+        """Vide le chunker et retourne le hash SHA-256 du fichier complet"""
+        await self._store_chunks(await asyncio.to_thread(lambda: self._hash_chunks(self.chunker.finish())))
+        return self._hasher.hexdigest()
+
+def manifest_reader(store: LocalChunkStore, manifest: Manifest) -> RangeReader:
+    """
+    Réassemble les chunks dans l'ordre. Pour un range, seuls les chunks qui
+    le chevauchent sont lus (recherche dichotomique sur les offsets cumulés).
+    """
+    offsets = [0]
+    for entry in manifest:
+        offsets.append(offsets[-1] + entry["size"])
+
+    async def reader(offset: int, length: int) -> AsyncIterator[bytes]:
+        end = min(offset + length, offsets[-1])
+        index = bisect.bisect_right(offsets, offset) - 1
+        while offset < end and index < len(manifest):
+            chunk_start = offsets[index]
+            lo = offset - chunk_start
+            hi = min(end, offsets[index + 1]) - chunk_start
+            async for data in store.stream(manifest[index]["hash"], lo, hi - lo):
+                yield data
+            offset = chunk_start + hi
+            index += 1
+    return reader
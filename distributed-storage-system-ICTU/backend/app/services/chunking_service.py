@@ -0,0 +1,150 @@
+import hashlib
+from typing import List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+
+def _gear_table() -> np.ndarray:
+    """
+    Table Gear : 256 entiers 64 bits pseudo-aléatoires.
+    Dérivée de SHA-256 plutôt que d'un RNG : elle ne doit JAMAIS changer,
+    sinon les frontières de chunks (et donc la déduplication) changent aussi.
+    """
+    values = [
+        int.from_bytes(hashlib.sha256(b"nexus-gear" + bytes([i])).digest()[:8], "big")
+        for i in range(256)
+    ]
+    return np.array(values, dtype=np.uint64)
+
+GEAR = _gear_table()
+
+def _top_mask(bits: int) -> int:
+    # Bits de poids fort : les bits faibles du Gear hash ne dépendent que des derniers octets
+    return ((1 << bits) - 1) << (64 - bits)
+
+# Taille des blocs de calcul : le tableau de travail (8 o/position) tient en cache L2
+_GEAR_BLOCK = 256 * 1024
+
+def gear_hashes(data: bytes, context: bytes = b"") -> np.ndarray:
+    """
+    Gear hash roulant à chaque position de data : h[i] = sum(G[x[i-j]] << j, j < 64).
+    Au lieu de la boucle octet par octet, on double la fenêtre à chaque passe
+    (H_2k[i] = H_k[i] + H_k[i-k] << k) : 6 passes vectorisées pour 64 octets.
+    context : octets précédant data (les 63 derniers suffisent).
+    """
+    context = context[-63:]
+    src = np.frombuffer(context + data, dtype=np.uint8)
+    out = np.empty(len(data), dtype=np.uint64)
+    for start in range(len(context), len(src), _GEAR_BLOCK):
+        lo = max(start - 63, 0)
+        h = GEAR[src[lo:start + _GEAR_BLOCK]]
+        tmp = np.empty_like(h)
+        window = 1
+        while window < 64:
+            np.left_shift(h[:-window], np.uint64(window), out=tmp[window:])
+            np.add(h[window:], tmp[window:], out=h[window:])
+            window *= 2
+        valid = h[start - lo:]
+        pos = start - len(context)
+        out[pos:pos + len(valid)] = valid
+    return out
+
+class FastCDC:
+    """
+    Découpage à frontières définies par le contenu (FastCDC, "normalized chunking").
+    Une insertion au milieu d'un fichier ne décale que les chunks voisins :
+    le reste du fichier garde les mêmes hash et n'est pas ré-uploadé.
+
+    Usage en streaming : feed() au fil des lectures, puis finish().
+    La mémoire est bornée par ~2 x max_size.
+    """
+    def __init__(
+        self,
+        min_size: int = settings.CDC_MIN_SIZE,
+        avg_size: int = settings.CDC_AVG_SIZE,
+        max_size: int = settings.CDC_MAX_SIZE,
+    ):
+        if not (64 <= min_size <= avg_size <= max_size):
+            raise ValueError("Tailles de chunk invalides (64 <= min <= avg <= max)")
+        self.min_size = min_size
+        self.avg_size = avg_size
+        self.max_size = max_size
+
+        # Normalisation niveau 2 : masque strict avant avg, lâche après
+        bits = max(avg_size.bit_length() - 1, 1)
+        self.mask_s = np.uint64(_top_mask(bits + 2))
+        self.mask_l = np.uint64(_top_mask(max(bits - 2, 1)))
+        self._buffer = bytearray()
+        # Hash déjà calculés pour chaque octet du buffer : jamais recalculés.
+        # Un tableau par feed(), concaténés une seule fois par _drain()
+        self._hashes: List[np.ndarray] = []
+
+    def _cut_points(self, h: np.ndarray, n: int, final: bool) -> List[int]:
+        """
+        Positions de coupe dans le buffer (qui commence sur une frontière).
+        Le hash est réinitialisé à chaque chunk dans FastCDC, mais comme on ne
+        teste jamais avant min_size >= 64 octets, la fenêtre glissante donne
+        exactement les mêmes valeurs.
+        """
+        strict = np.flatnonzero((h & self.mask_s) == 0)
+        loose = np.flatnonzero((h & self.mask_l) == 0)
+
+        cuts = []
+        start = 0
+        while start < n:
+            # Sans la fin du flux, une coupe n'est définitive qu'avec max_size octets devant soi
+            if not final and n - start < self.max_size:
+                break
+            if n - start <= self.min_size:
+                cuts.append(n)
+                break
+
+            end = min(start + self.max_size, n)
+            cut = self._first(strict, start + self.min_size - 1, min(start + self.avg_size, end) - 1)
+            if cut is None:
+                cut = self._first(loose, start + self.avg_size - 1, end - 1)
+            cut = end if cut is None else cut + 1
+            cuts.append(cut)
+            start = cut
+        return cuts
+
+    @staticmethod
+    def _first(candidates: np.ndarray, lo: int, hi: int) -> Optional[int]:
+        """Premier candidat dans [lo, hi) (recherche dichotomique)"""
+        if lo >= hi:
+            return None
+        i = int(np.searchsorted(candidates, lo))
+        if i < len(candidates) and candidates[i] < hi:
+            return int(candidates[i])
+        return None
+
+    def _drain(self, final: bool) -> List[bytes]:
+        hashes = np.concatenate(self._hashes) if len(self._hashes) > 1 else self._hashes[0]
+        chunks = []
+        start = 0
+        for cut in self._cut_points(hashes, len(self._buffer), final):
+            chunks.append(bytes(self._buffer[start:cut]))
+            start = cut
+        del self._buffer[:start]
+        self._hashes = [hashes[start:]]
+        return chunks
+
+    def feed(self, data: bytes) -> List[bytes]:
+        """Ajoute des octets, retourne les chunks dont la frontière est définitive"""
+        if not data:
+            return []
+        self._hashes.append(gear_hashes(data, bytes(self._buffer[-63:])))
+        self._buffer += data
+        if len(self._buffer) < 2 * self.max_size:
+            return []
+        return self._drain(final=False)
+
+    def finish(self) -> List[bytes]:
+        """Fin du flux : retourne les derniers chunks"""
+        return self._drain(final=True) if self._buffer else []
+
+def chunk_bytes(data: bytes, **sizes) -> List[bytes]:
+    """Découpe un contenu entièrement en mémoire"""
+    chunker = FastCDC(**sizes)
+    return chunker.feed(data) + chunker.finish()
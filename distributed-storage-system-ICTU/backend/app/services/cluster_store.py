@@ -0,0 +1,349 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session, selectinload
+
+from app.core.config import settings
+from app.database import models
+from app.database.db import SessionLocal
+from app.orchestrator.erasure_manager import BACKGROUND_IO_METADATA, ErasureManager
+from app.orchestrator.load_balancer import LoadBalancer, READ_PREFERENCE
+from app.orchestrator.node_manager import NodeManager
+from app.orchestrator.scrub_coordinator import ScrubCoordinator
+from app.protos import node_pb2
+from app.services.chunk_store import LocalChunkStore, Manifest
+from app.services.range_service import READ_CHUNK_SIZE
+from app.services.storage_policy import parse_storage_class
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024   # Bien sous la limite de 4MB par message gRPC
+LOOKUP_BATCH = 1000
+WRITE_ATTEMPTS = 2                 # Nodes de remplacement essayés une fois si une écriture échoue
+
+class ClusterUnavailable(Exception):
+    """Pas assez de nodes en service pour écrire un chunk (-> 503)"""
+
+class ClusterChunkStore:
+    """
+    Chunks CDC stockés sur les nodes du cluster, même interface que
+    LocalChunkStore. Chaque chunk nouveau part en parallèle (UploadBlock) sur
+    REPLICATION_FACTOR nodes choisis par le LoadBalancer ; les emplacements
+    sont enregistrés dans block_replicas, dans la transaction de l'appelant
+    (un upload avorté ne laisse que des blocs orphelins, ramassés par le GC).
+    Un store sert une requête : les nodes cibles sont choisis une fois, les
+    chunks d'un même fichier restent donc groupés (File.node_id = primaire).
+
+    Lecture : DownloadBlock sur une des répliques (reprise à l'octet près sur
+    une autre si un node tombe en cours de route), ou reconstruction
+    Reed-Solomon pour les blocs "ec:K+M". Les emplacements sont résolus par
+    locate() avant la lecture : stream() ne touche plus à la session de
+    l'appelant. Emplacement introuvable ou périmé : on interroge tous les
+    nodes (HasBlocks) et on enregistre ce qu'on trouve, dans une session à
+    part. `fallback` sert les chunks écrits localement avant le passage au cluster.
+    background=True (tâches de fond) : transferts annoncés aux nodes comme tels.
+    """
+    def __init__(
+        self,
+        db: Session,
+        replicas: int = settings.REPLICATION_FACTOR,
+        fallback: Optional[LocalChunkStore] = None,
+        background: bool = False,
+    ):
+        self.db = db
+        self.replicas = replicas
+        self.fallback = fallback
+        self.node_manager = NodeManager(db)
+        self.lb = LoadBalancer(db)
+        self.erasure = ErasureManager(db, background=background)
+        self.scrub = ScrubCoordinator(db)
+        self.metadata = BACKGROUND_IO_METADATA if background else None
+
+        self._targets: List[str] = []
+        self._failed: Set[str] = set()
+        self._replicas: Dict[str, List[str]] = {}
+        self._erasure: Dict[str, models.Block] = {}
+        self._present: Set[str] = set()
+        self._read_ranks: Dict[str, int] = {}
+
+    # --- EMPLACEMENTS ---
+
+    def locate(self, hashes: List[str]):
+        """
+        Charge en une requête par lot les emplacements des chunks à lire.
+        À appeler avant toute lecture (stream), et donc avant de rendre une
+        StreamingResponse : la session DB de la requête est fermée pendant
+        l'envoi du corps. Un chunk non localisé ici est cherché sur les nodes.
+        """
+        hashes = [h for h in dict.fromkeys(hashes) if h not in self._replicas and h not in self._erasure]
+        for i in range(0, len(hashes), LOOKUP_BATCH):
+            batch = hashes[i:i + LOOKUP_BATCH]
+            blocks = self.db.query(models.Block).options(selectinload(models.Block.shards)).filter(
+                models.Block.hash.in_(batch), models.Block.storage_class != "replicated"
+            ).all()
+            for block in blocks:
+                self._erasure[block.hash] = block
+            self._load_replicas(batch)
+        if not self._read_ranks:
+            # Préférence de lecture (SERVING d'abord) : même règle que LoadBalancer.select_read_node
+            rows = self.db.query(models.NodeStats.node_id, models.NodeStats.status).all()
+            self._read_ranks = {node_id: READ_PREFERENCE.get(status, 2) for node_id, status in rows}
+
+    def _load_replicas(self, hashes: List[str]):
+        rows = self.db.query(models.BlockReplica.block_hash, models.BlockReplica.node_id).filter(
+            models.BlockReplica.block_hash.in_(hashes)
+        ).all()
+        for content_hash, node_id in rows:
+            holders = self._replicas.setdefault(content_hash, [])
+            if node_id not in holders:
+                holders.append(node_id)
+
+    def _record(self, content_hash: str, size: int, node_ids: List[str]):
+        stmt = insert(models.BlockReplica).values([{"block_hash": content_hash, "node_id": n, "size": size} for n in node_ids])
+        self.db.execute(stmt.on_conflict_do_nothing())
+        self._replicas.setdefault(content_hash, []).extend(n for n in node_ids if n not in self._replicas[content_hash])
+        self._present.add(content_hash)
+
+    def home_node(self, manifest: Manifest) -> Optional[str]:
+        """
+        Node primaire du fichier (File.node_id) : celui qui a reçu ses chunks.
+        Fichier entièrement dédupliqué (rien écrit par ce store) : un node qui
+        détient son premier chunk, chargé depuis la base s'il n'est pas connu.
+        """
+        if self._targets:
+            return self._targets[0]
+        if manifest and manifest[0]["hash"] not in self._replicas:
+            self._load_replicas([manifest[0]["hash"]])
+        for entry in manifest:
+            if self._replicas.get(entry["hash"]):
+                return self._replicas[entry["hash"]][0]
+        return None
+
+    def known_sizes(self, hashes: List[str]) -> Dict[str, int]:
+        """Taille réelle des chunks présents (table blocks, sinon répliques) : ne jamais croire le client"""
+        sizes: Dict[str, int] = {}
+        hashes = list(dict.fromkeys(hashes))
+        for i in range(0, len(hashes), LOOKUP_BATCH):
+            batch = hashes[i:i + LOOKUP_BATCH]
+            rows = self.db.query(models.BlockReplica.block_hash, models.BlockReplica.size).filter(
+                models.BlockReplica.block_hash.in_(batch), models.BlockReplica.size.isnot(None)
+            ).all()
+            sizes.update(rows)
+            sizes.update(self.db.query(models.Block.hash, models.Block.size).filter(models.Block.hash.in_(batch)).all())
+        return sizes
+
+    # --- PRÉSENCE ---
+
+    async def has(self, content_hash: str) -> bool:
+        return (await self.has_many([content_hash]))[0]
+
+    async def _confirm(self, by_node: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        """Nodes qui ont réellement chaque hash, rajeunis au passage (HasBlocks touch)"""
+        node_ids = list(by_node)
+        answers = await asyncio.gather(*(self.scrub.has_blocks(n, by_node[n], touch=True) for n in node_ids))
+        confirmed: Dict[str, List[str]] = {}
+        for node_id, found in zip(node_ids, answers):
+            for content_hash in found:
+                confirmed.setdefault(content_hash, []).append(node_id)
+        return confirmed
+
+    async def has_many(self, hashes: List[str]) -> List[bool]:
+        """
+        Présence de chaque chunk dans le cluster, dans l'ordre de la requête.
+        Une ligne en base ne suffit pas : les nodes qui détiennent le chunk (ou
+        ses shards) doivent le confirmer et le rajeunir avant qu'on le réutilise,
+        sinon leur GC peut le supprimer entre cette réponse et le commit du
+        fichier qui le référence (bloc à 0 référence, upload avorté).
+        """
+        unknown = list(dict.fromkeys(h for h in hashes if h not in self._present))
+        for i in range(0, len(unknown), LOOKUP_BATCH):
+            batch = unknown[i:i + LOOKUP_BATCH]
+            self._load_replicas(batch)
+            shards = self.db.query(
+                models.BlockShard.block_hash, models.BlockShard.shard_hash,
+                models.BlockShard.node_id, models.Block.storage_class
+            ).join(models.Block, models.Block.hash == models.BlockShard.block_hash).filter(
+                models.BlockShard.block_hash.in_(batch)
+            ).all()
+
+            by_node: Dict[str, List[str]] = {}
+            for content_hash in batch:
+                for node_id in self._replicas.get(content_hash, []):
+                    by_node.setdefault(node_id, []).append(content_hash)
+            for _, shard_hash, node_id, _ in shards:
+                by_node.setdefault(node_id, []).append(shard_hash)
+            confirmed = await self._confirm(by_node)
+
+            for content_hash in batch:
+                if confirmed.get(content_hash):
+                    # Répliques confirmées d'abord : la lecture qui suit ira droit au but
+                    stale = [n for n in self._replicas.get(content_hash, []) if n not in confirmed[content_hash]]
+                    self._replicas[content_hash] = confirmed[content_hash] + stale
+                    self._present.add(content_hash)
+            readable: Dict[str, int] = {}
+            for block_hash, shard_hash, node_id, storage_class in shards:
+                if node_id in confirmed.get(shard_hash, []):
+                    readable[block_hash] = readable.get(block_hash, 0) + 1
+                    # Au moins K shards rajeunis : le bloc reste décodable
+                    if readable[block_hash] >= (parse_storage_class(storage_class) or (1, 0))[0]:
+                        self._present.add(block_hash)
+        return [h in self._present for h in hashes]
+
+    # --- ÉCRITURE ---
+
+    def _write_targets(self, size: int) -> List[str]:
+        self._targets = [n for n in self._targets if n not in self._failed]
+        missing = self.replicas - len(self._targets)
+        if missing > 0:
+            exclude = [*self._targets, *self._failed]
+            try:
+                self._targets += self.lb.select_write_nodes(size, replicas=missing, exclude=exclude)
+            except Exception:
+                # Pas assez de nodes pour toutes les copies : on prend ceux qui restent
+                self._targets += [node.node_id for node in self.lb.writable_nodes(size, exclude)][:missing]
+        required = min(self.replicas, settings.MIN_NODES_REQUIRED)
+        if len(self._targets) < required:
+            raise ClusterUnavailable(f"{len(self._targets)} writable nodes, {required} required")
+        return self._targets
+
+    @staticmethod
+    async def _chunks(content_hash: str, data: bytes) -> AsyncIterator[node_pb2.FileChunk]:
+        for i in range(0, max(len(data), 1), UPLOAD_CHUNK_SIZE):
+            yield node_pb2.FileChunk(data=data[i:i + UPLOAD_CHUNK_SIZE], block_hash=content_hash if i == 0 else "")
+
+    async def _upload(self, node_id: str, content_hash: str, data: bytes) -> bool:
+        client = self.node_manager.get_node_client(node_id)
+        if client is None:
+            return False
+        try:
+            response = await client.UploadBlock(self._chunks(content_hash, data), metadata=self.metadata)
+        except Exception as e:
+            logger.warning(f"⚠️ UploadBlock {content_hash} failed on {node_id}: {e}")
+            return False
+        if not response.success:
+            logger.warning(f"⚠️ {node_id} rejected {content_hash}: {response.error_message}")
+        return response.success
+
+    async def put(self, content_hash: str, data: bytes) -> bool:
+        """Pose le chunk sur les nodes cibles s'il est absent du cluster. True si nouvelle écriture."""
+        if await self.has(content_hash):
+            return False
+        stored: List[str] = []
+        for attempt in range(WRITE_ATTEMPTS):
+            try:
+                targets = [n for n in self._write_targets(len(data)) if n not in stored]
+            except ClusterUnavailable:
+                if attempt == 0:
+                    raise
+                break
+            results = await asyncio.gather(*(self._upload(node_id, content_hash, data) for node_id in targets))
+            stored += [node_id for node_id, ok in zip(targets, results) if ok]
+            # Node en échec écarté pour la suite de l'upload, remplacé au tour suivant
+            self._failed.update(node_id for node_id, ok in zip(targets, results) if not ok)
+            if all(results):
+                break
+        if len(stored) < min(self.replicas, settings.MIN_NODES_REQUIRED):
+            raise ClusterUnavailable(f"Chunk {content_hash} stored on {len(stored)}/{self.replicas} nodes")
+        if len(stored) < self.replicas:
+            logger.warning(f"⚠️ {content_hash} under-replicated ({len(stored)}/{self.replicas})")
+        self._record(content_hash, len(data), stored)
+        return True
+
+    # --- LECTURE ---
+
+    async def _download(self, node_id: str, content_hash: str, offset: int, length: int) -> AsyncIterator[bytes]:
+        client = self.node_manager.get_node_client(node_id)
+        if client is None:
+            raise ConnectionError(f"No client for {node_id}")
+        request = node_pb2.DownloadRequest(hash=content_hash, offset=offset, length=max(length, 0))
+        async for chunk in client.DownloadBlock(request, metadata=self.metadata):
+            yield chunk.data
+
+    async def _stream_erasure(self, block: models.Block, offset: int, length: int) -> AsyncIterator[bytes]:
+        data = await self.erasure.read_block(block.hash, block=block)
+        end = len(data) if length < 0 else min(len(data), offset + length)
+        for pos in range(offset, end, READ_CHUNK_SIZE):
+            yield data[pos:min(pos + READ_CHUNK_SIZE, end)]
+
+    def _persist(self, content_hash: str, node_ids: List[str]):
+        """Emplacements découverts pendant une lecture : session propre (celle de la requête est fermée)"""
+        db = SessionLocal()
+        try:
+            stmt = insert(models.BlockReplica).values([{"block_hash": content_hash, "node_id": n} for n in node_ids])
+            db.execute(stmt.on_conflict_do_nothing())
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"⚠️ Could not record locations of {content_hash}: {e}")
+        finally:
+            db.close()
+
+    async def _discover(self, content_hash: str, exclude: Set[str]) -> List[str]:
+        """Nodes qui ont le chunk (HasBlocks), parmi ceux connus de locate()"""
+        node_ids = [n for n in self._read_ranks if n not in exclude]
+        answers = await asyncio.gather(*(self.scrub.has_blocks(n, [content_hash]) for n in node_ids))
+        holders = [n for n, found in zip(node_ids, answers) if found]
+        if holders:
+            logger.info(f"🔎 {content_hash} found on {holders} (HasBlocks)")
+            self._replicas.setdefault(content_hash, []).extend(holders)
+            # Enregistrés : les lectures suivantes n'interrogeront plus tout le cluster
+            await asyncio.to_thread(self._persist, content_hash, holders)
+        return holders
+
+    async def stream(self, content_hash: str, offset: int = 0, length: int = -1) -> AsyncIterator[bytes]:
+        if length == 0:
+            return
+        block = self._erasure.get(content_hash)
+        if block is not None:
+            async for data in self._stream_erasure(block, offset, length):
+                yield data
+            return
+
+        tried: Set[str] = set()
+        candidates = sorted(self._replicas.get(content_hash, []), key=lambda n: self._read_ranks.get(n, 0))
+        discovered = False
+        while True:
+            for node_id in candidates:
+                if node_id in tried:
+                    continue
+                tried.add(node_id)
+                try:
+                    async for data in self._download(node_id, content_hash, offset, length):
+                        offset += len(data)
+                        if length >= 0:
+                            length -= len(data)
+                        yield data
+                    return
+                except Exception as e:
+                    # La suite est demandée à une autre réplique, à partir du dernier octet envoyé
+                    logger.warning(f"⚠️ DownloadBlock {content_hash} failed on {node_id}: {e}")
+            if discovered:
+                break
+            # Emplacements périmés (drain, réparation) : on demande à tout le cluster
+            discovered = True
+            candidates = sorted(await self._discover(content_hash, tried), key=lambda n: self._read_ranks.get(n, 0))
+
+        if self.fallback is not None and await self.fallback.has(content_hash):
+            async for data in self.fallback.stream(content_hash, offset, length):
+                yield data
+            return
+        raise FileNotFoundError(f"Chunk {content_hash} introuvable sur le cluster")
+
+    # --- SUPPRESSION ---
+
+    async def delete(self, content_hash: str) -> bool:
+        """Supprime les répliques (hors GC : réservé aux chunks sans aucune référence)"""
+        self._replicas.pop(content_hash, None)
+        self._load_replicas([content_hash])
+        deleted = False
+        for node_id in self._replicas.pop(content_hash, []):
+            client = self.node_manager.get_node_client(node_id)
+            try:
+                if client is not None:
+                    deleted |= (await client.DeleteBlock(node_pb2.DeleteRequest(hash=content_hash))).success
+            except Exception as e:
+                logger.warning(f"⚠️ DeleteBlock {content_hash} failed on {node_id}: {e}")
+        self.db.query(models.BlockReplica).filter_by(block_hash=content_hash).delete(synchronize_session=False)
+        return deleted
@@ -0,0 +1,148 @@
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+# Polynôme primitif de GF(2^8) (x^8 + x^4 + x^3 + x^2 + 1), le même que la plupart des RAID-6
+GF_POLY = 0x11D
+
+def _gf_tables():
+    exp = np.zeros(512, dtype=np.uint8)
+    log = np.zeros(256, dtype=np.int32)
+    x = 1
+    for i in range(255):
+        exp[i] = x
+        log[x] = i
+        x <<= 1
+        if x & 0x100:
+            x ^= GF_POLY
+    exp[255:510] = exp[:255]
+    # Table de multiplication complète (64KB) : MUL[c] est la LUT "multiplier par c"
+    mul = exp[log[:, None] + log[None, :]]
+    mul[0, :] = 0
+    mul[:, 0] = 0
+    return exp, log, mul
+
+GF_EXP, GF_LOG, GF_MUL = _gf_tables()
+
+def gf_mul(a: int, b: int) -> int:
+    return int(GF_MUL[a, b])
+
+def gf_inv(a: int) -> int:
+    if a == 0:
+        raise ZeroDivisionError("0 n'a pas d'inverse dans GF(256)")
+    return int(GF_EXP[255 - GF_LOG[a]])
+
+def gf_invert_matrix(matrix: List[List[int]]) -> List[List[int]]:
+    """Inversion de Gauss-Jordan dans GF(256) (matrices k x k, k petit)"""
+    n = len(matrix)
+    work = [list(row) + [1 if i == j else 0 for j in range(n)] for i, row in enumerate(matrix)]
+    for col in range(n):
+        pivot = next((r for r in range(col, n) if work[r][col]), None)
+        if pivot is None:
+            raise ValueError("Matrice singulière")
+        work[col], work[pivot] = work[pivot], work[col]
+        inv = gf_inv(work[col][col])
+        work[col] = [gf_mul(v, inv) for v in work[col]]
+        for r in range(n):
+            factor = work[r][col]
+            if r != col and factor:
+                work[r] = [v ^ gf_mul(factor, p) for v, p in zip(work[r], work[col])]
+    return [row[n:] for row in work]
+
+# Colonnes traitées par passe : les lignes sources et la LUT restent en cache L2
+_BLOCK = 64 * 1024
+
+def _combine(coefficients: List[int], rows: List[np.ndarray]) -> np.ndarray:
+    """
+    XOR des c_i * row_i. Chaque produit est une indexation de LUT (GF_MUL[c]),
+    faite par blocs de colonnes dans un buffer réutilisé (aucune allocation).
+    """
+    size = len(rows[0])
+    out = np.zeros(size, dtype=np.uint8)
+    tmp = np.empty(min(size, _BLOCK), dtype=np.uint8)
+    terms = [(c, row) for c, row in zip(coefficients, rows) if c]
+    for start in range(0, size, _BLOCK):
+        stop = min(start + _BLOCK, size)
+        dest = out[start:stop]
+        scratch = tmp[:stop - start]
+        for c, row in terms:
+            if c == 1:
+                np.bitwise_xor(dest, row[start:stop], out=dest)
+            else:
+                GF_MUL[c].take(row[start:stop], out=scratch)
+                np.bitwise_xor(dest, scratch, out=dest)
+    return out
+
+class ReedSolomon:
+    """
+    Code de Reed-Solomon systématique k+m sur GF(256).
+    Les k premiers shards sont les données telles quelles (lecture sans décodage
+    quand ils sont tous disponibles), les m suivants la parité. La matrice de
+    parité est une matrice de Cauchy : toute sous-matrice k x k de [I ; C] est
+    inversible, donc n'importe quels k shards suffisent à tout reconstruire.
+    """
+    def __init__(self, data_shards: int, parity_shards: int):
+        if data_shards < 1 or parity_shards < 0 or data_shards + parity_shards > 256:
+            raise ValueError("Paramètres invalides (1 <= k, 0 <= m, k + m <= 256)")
+        self.k = data_shards
+        self.m = parity_shards
+        # C[i][j] = 1 / (x_i + y_j) avec x_i = k + i, y_j = j (tous distincts)
+        self.parity = [
+            [gf_inv((self.k + i) ^ j) for j in range(self.k)]
+            for i in range(self.m)
+        ]
+        self.matrix = [[1 if i == j else 0 for j in range(self.k)] for i in range(self.k)] + self.parity
+
+    @property
+    def total_shards(self) -> int:
+        return self.k + self.m
+
+    def shard_size(self, size: int) -> int:
+        return max(1, -(-size // self.k))
+
+    def encode(self, data: bytes) -> List[bytes]:
+        """Découpe data en k shards (dernier complété par des zéros) et calcule les m parités"""
+        size = self.shard_size(len(data))
+        buffer = np.zeros(self.k * size, dtype=np.uint8)
+        buffer[:len(data)] = np.frombuffer(data, dtype=np.uint8)
+        rows = list(buffer.reshape(self.k, size))
+        parity = [_combine(coefficients, rows) for coefficients in self.parity]
+        return [row.tobytes() for row in rows + parity]
+
+    def _data_rows(self, shards: Dict[int, bytes]) -> List[np.ndarray]:
+        """Les k lignes de données, reconstruites à partir de k shards quelconques"""
+        if len(shards) < self.k:
+            raise ValueError(f"{len(shards)} shards disponibles, {self.k} nécessaires")
+        # Les shards de données d'abord : moins de lignes à recalculer
+        chosen = sorted(shards)[:self.k]
+        rows = {i: np.frombuffer(shards[i], dtype=np.uint8) for i in chosen}
+        if chosen == list(range(self.k)):
+            return [rows[i] for i in chosen]
+
+        decode = gf_invert_matrix([self.matrix[i] for i in chosen])
+        sources = [rows[i] for i in chosen]
+        return [
+            rows[j] if j in rows else _combine(decode[j], sources)
+            for j in range(self.k)
+        ]
+
+    def reconstruct(self, shards: Dict[int, bytes], wanted: Iterable[int]) -> Dict[int, bytes]:
+        """
+        Recalcule uniquement les shards demandés (réparation) à partir de k
+        shards quelconques. shards : index -> contenu.
+        """
+        wanted = sorted(set(wanted))
+        if not wanted:
+            return {}
+        data = self._data_rows(shards)
+        rebuilt = {}
+        for index in wanted:
+            if index < self.k:
+                rebuilt[index] = data[index].tobytes()
+            else:
+                rebuilt[index] = _combine(self.parity[index - self.k], data).tobytes()
+        return rebuilt
+
+    def decode(self, shards: Dict[int, bytes], size: int) -> bytes:
+        """Contenu d'origine (size octets) à partir de k shards quelconques"""
+        return b"".join(row.tobytes() for row in self._data_rows(shards))[:size]
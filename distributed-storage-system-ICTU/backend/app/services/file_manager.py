@@ -1,14 +1,27 @@
+import os
+import uuid
 import logging
+from fastapi import HTTPException
+from sqlalchemy import func, insert
 from sqlalchemy.orm import Session
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from app.database import models
 from app.core.events import event_bus
 from app.schemas import file as file_schema
+from app.services.block_ref_service import BlockRefService
 
 logger = logging.getLogger(__name__)
 
+UPLOAD_DIR = "uploads"  # Fichiers antérieurs au chunking, stockés d'un seul tenant
+COPY_BATCH_SIZE = 1000
+# Colonnes reprises telles quelles par une copie : même contenu, mêmes clés
+COPIED_COLUMNS = (
+    "size", "extension", "mime_type", "content_hash", "chunk_manifest", "node_id",
+    "storage_class", "is_encrypted", "encryption_key_id", "iv",
+)
+
 class FileManager:
     def __init__(self, db: Session):
         self.db = db
@@ -19,7 +32,9 @@ class FileManager:
         owner_id: int, 
         size: int, 
         node_id: str,
-        mime_type: str = "application/octet-stream" # Ajout de l'argument mime_type
+        mime_type: str = "application/octet-stream", # Ajout de l'argument mime_type
+        content_hash: Optional[str] = None,
+        chunk_manifest: Optional[List[dict]] = None
     ) -> models.File:
         """
         Crée l'entrée DB et met à jour le quota de l'utilisateur Onyx.
@@ -33,6 +48,8 @@ class FileManager:
             size=size,
             extension=extension.lower(),
             mime_type=mime_type,
+            content_hash=content_hash,
+            chunk_manifest=chunk_manifest,
             node_id=node_id,
             owner_id=owner_id,
             folder_id=metadata.folder_id,
@@ -41,6 +58,12 @@ class FileManager:
             updated_at=datetime.utcnow()
         )
         self.db.add(db_file)
+
+        # Références des chunks : écrites dans la même transaction que le fichier
+        if chunk_manifest:
+            refs = BlockRefService(self.db)
+            refs.add_refs([chunk_manifest])
+            refs.add_owner(owner_id, (entry["hash"] for entry in chunk_manifest))
         
         # 3. Mise à jour atomique du quota utilisateur
         user = self.db.query(models.User).filter(models.User.id == owner_id).first()
@@ -65,6 +88,149 @@ class FileManager:
         
         return db_file
 
+    def create_version(self, file: models.File, modified_by_id: int, change_summary: Optional[str] = None) -> models.FileVersion:
+        """Fige le contenu actuel du fichier dans une nouvelle version (chunks partagés, +1 référence)"""
+        last = self.db.query(func.max(models.FileVersion.version_number)).filter_by(file_id=file.id).scalar()
+        version = models.FileVersion(
+            file_id=file.id,
+            version_number=(last or 0) + 1,
+            size=file.size,
+            content_hash=file.content_hash,
+            chunk_manifest=file.chunk_manifest,
+            modified_by_id=modified_by_id,
+            change_summary=change_summary
+        )
+        self.db.add(version)
+        if file.chunk_manifest:
+            BlockRefService(self.db).add_refs([file.chunk_manifest])
+        self.db.commit()
+        self.db.refresh(version)
+        return version
+
+    # --- COPIES (COPY-ON-WRITE) ---
+
+    def copy_files(
+        self,
+        files: List[models.File],
+        owner: models.User,
+        folder_ids: Dict[Optional[str], Optional[str]],
+        name_suffix: str = ""
+    ) -> List[str]:
+        """
+        Copie sans transfert : les nouvelles lignes File référencent les mêmes
+        chunks (+1 référence), le contenu ne diverge qu'à l'écriture d'une
+        nouvelle version. Insertion groupée, quota vérifié et imputé pour
+        l'ensemble, puis commit.
+        folder_ids : dossier source -> dossier de la copie.
+        Retourne les identifiants des copies, dans l'ordre de `files`.
+        """
+        copy_ids = self._insert_copies(files, owner, folder_ids, name_suffix)
+        self._commit_copies(files, copy_ids)
+        return copy_ids
+
+    def _insert_copies(
+        self,
+        files: List[models.File],
+        owner: models.User,
+        folder_ids: Dict[Optional[str], Optional[str]],
+        name_suffix: str = ""
+    ) -> List[str]:
+        total = sum(file.size for file in files)
+        self.db.refresh(owner)
+        if (owner.used_storage or 0) + total > (owner.storage_limit or 0):
+            raise HTTPException(status_code=413, detail="Quota de stockage dépassé")
+
+        rows = []
+        for file in files:
+            row = {column: getattr(file, column) for column in COPIED_COLUMNS}
+            row.update(
+                id=str(uuid.uuid4()),
+                name=f"{file.name}{name_suffix}",
+                folder_id=folder_ids[file.folder_id],
+                owner_id=owner.id,
+                is_trashed=False,
+            )
+            rows.append(row)
+        for i in range(0, len(rows), COPY_BATCH_SIZE):
+            self.db.execute(insert(models.File), rows[i:i + COPY_BATCH_SIZE])
+
+        BlockRefService(self.db).add_refs(file.chunk_manifest for file in files)
+        owner.used_storage = (owner.used_storage or 0) + total
+        return [row["id"] for row in rows]
+
+    def _commit_copies(self, files: List[models.File], copy_ids: List[str]):
+        """
+        Commit des copies, puis liens physiques des fichiers d'un seul tenant
+        (même inode, aucune donnée copiée). Après le commit : une transaction
+        annulée ne laisse aucun lien orphelin dans UPLOAD_DIR.
+        """
+        # Lu avant le commit, qui expire les objets chargés
+        links = [
+            (os.path.join(UPLOAD_DIR, str(file.id)), os.path.join(UPLOAD_DIR, copy_id))
+            for file, copy_id in zip(files, copy_ids) if file.chunk_manifest is None
+        ]
+        self.db.commit()
+        for source, target in links:
+            try:
+                os.link(source, target)
+            except FileNotFoundError:
+                pass
+
+    def copy_folder(self, folder: models.Folder, owner: models.User, target_parent_id: Optional[str] = None) -> str:
+        """
+        Copie d'une arborescence complète (sous-dossiers et fichiers non
+        supprimés) dans une seule transaction, commitée ici : une requête par
+        niveau pour la lecture, des insertions groupées pour l'écriture.
+        """
+        # 1. Arborescence source, niveau par niveau
+        folders = [folder]
+        level = [folder.id]
+        while level:
+            children = self.db.query(models.Folder).filter(
+                models.Folder.parent_id.in_(level), models.Folder.is_trashed == False
+            ).all()
+            folders.extend(children)
+            level = [child.id for child in children]
+        if target_parent_id in {f.id for f in folders}:
+            raise HTTPException(status_code=400, detail="Impossible de copier un secteur dans lui-même")
+
+        # 2. Dossiers (parents avant enfants : l'ordre du parcours)
+        folder_ids = {f.id: str(uuid.uuid4()) for f in folders}
+        rows = [{
+            "id": folder_ids[f.id],
+            "name": f"{f.name} (Copie)" if f is folder else f.name,
+            "parent_id": target_parent_id if f is folder else folder_ids[f.parent_id],
+            "owner_id": owner.id,
+            "color": f.color,
+            "storage_class": f.storage_class,
+            "is_trashed": False,
+        } for f in folders]
+        for i in range(0, len(rows), COPY_BATCH_SIZE):
+            self.db.execute(insert(models.Folder), rows[i:i + COPY_BATCH_SIZE])
+
+        # 3. Fichiers
+        files = []
+        source_ids = list(folder_ids)
+        for i in range(0, len(source_ids), COPY_BATCH_SIZE):
+            files.extend(self.db.query(models.File).filter(
+                models.File.folder_id.in_(source_ids[i:i + COPY_BATCH_SIZE]), models.File.is_trashed == False
+            ).all())
+        self._commit_copies(files, self._insert_copies(files, owner, folder_ids))
+        logger.info(f"📑 Folder {folder.id} copied ({len(folders)} folders, {len(files)} files)")
+        return folder_ids[folder.id]
+
+    def release_content(self, files: List[models.File]):
+        """
+        Libère les références des chunks avant une suppression définitive
+        (fichiers et toutes leurs versions, en une seule série de requêtes).
+        Le commit reste à la charge de l'appelant, avec la suppression des lignes.
+        """
+        manifests = []
+        for file in files:
+            manifests.append(file.chunk_manifest)
+            manifests.extend(version.chunk_manifest for version in file.versions)
+        BlockRefService(self.db).release_refs(manifests)
+
     def move_to_trash(self, file_id: str, user_id: int):
         """Désactivation logique du fragment (Soft Delete)"""
         file = self.db.query(models.File).filter_by(id=file_id, owner_id=user_id).first()
@@ -0,0 +1,174 @@
+import hmac
+import json
+import time
+import hashlib
+import logging
+import secrets
+from typing import List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import exists, or_
+from sqlalchemy.orm import Session
+
+from app.database import models
+from app.database.redis import redis_client
+from app.schemas import file as file_schema
+from app.services.block_ref_service import BlockRefService
+from app.services.chunk_store import Manifest, manifest_reader
+from app.services.cluster_store import ClusterChunkStore
+from app.services.file_manager import FileManager
+from app.workers.celery_app import celery_app
+
+logger = logging.getLogger(__name__)
+
+CHALLENGE_KEY = "instant:challenge:{}"   # Défi de possession en attente de réponse (usage unique)
+CHALLENGE_TTL = 300
+CHALLENGE_RANGES = 4                     # Plages tirées au hasard dans le fichier
+CHALLENGE_RANGE_SIZE = 64
+
+class InstantUploadService:
+    """
+    Upload sans transfert quand le cluster a déjà le contenu :
+      - par SHA-256 du fichier complet : on reprend le manifest d'un fichier
+        de même hash et de même taille. Sans défi si l'appelant peut déjà le
+        lire (le sien ou partagé avec lui) ; sinon il doit d'abord prouver
+        qu'il détient les octets (plages aléatoires choisies par le serveur) ;
+      - par manifest CDC : seuls comptent les chunks que l'appelant a déjà
+        fournis ou possède (BlockOwner), avec leur taille enregistrée côté
+        serveur ; les autres lui sont demandés comme s'ils n'existaient pas.
+    Aucune réponse ne dépend du contenu des autres utilisateurs tant que la
+    possession n'est pas prouvée : connaître un hash ne suffit ni à obtenir le
+    fichier, ni à savoir qu'il existe. Le fichier créé référence les blocs
+    existants (refcount +1) et le quota est imputé comme pour un upload normal.
+    """
+    def __init__(self, db: Session, store: ClusterChunkStore):
+        self.db = db
+        self.store = store
+
+    # --- NÉGOCIATION ---
+
+    async def missing(self, owner: models.User, hashes: List[str]) -> List[str]:
+        """Chunks à envoyer : absents du cluster ou jamais fournis par l'appelant (sans doublons)"""
+        present = await self.store.has_many(hashes)
+        owned = BlockRefService(self.db).owned(owner.id, hashes)
+        missing = [h for h, found in zip(hashes, present) if not (found and h in owned)]
+        return list(dict.fromkeys(missing))
+
+    def _source(self, sha256: str, size: int, reader: Optional[models.User] = None) -> Optional[models.File]:
+        """Fichier de même contenu ; reader : limité à ceux que cet utilisateur peut lire"""
+        query = self.db.query(models.File).filter(
+            models.File.content_hash == sha256,
+            models.File.size == size,
+            models.File.chunk_manifest.isnot(None)
+        )
+        if reader is not None:
+            shared = exists().where(
+                models.FileShare.file_id == models.File.id,
+                models.FileShare.shared_with_user_id == reader.id
+            )
+            query = query.filter(or_(models.File.owner_id == reader.id, shared))
+        return query.first()
+
+    async def _complete(self, source: Optional[models.File]) -> bool:
+        # Un fichier vivant garde ses blocs, mais un node a pu les perdre depuis
+        if source is None:
+            return False
+        return all(await self.store.has_many([entry["hash"] for entry in source.chunk_manifest]))
+
+    # --- PREUVE DE POSSESSION ---
+
+    async def _challenge(self, owner: models.User, obj_in: file_schema.InstantUploadRequest) -> dict:
+        """Émis que le contenu existe ou non : la réponse ne sert pas d'oracle"""
+        length = min(CHALLENGE_RANGE_SIZE, obj_in.size)
+        ranges = [[secrets.randbelow(obj_in.size - length + 1), length] for _ in range(CHALLENGE_RANGES)]
+        challenge = {
+            "id": secrets.token_urlsafe(24),
+            "ranges": ranges,
+            "expires_at": int(time.time()) + CHALLENGE_TTL,
+        }
+        state = {"owner_id": owner.id, "sha256": obj_in.sha256, "size": obj_in.size, "ranges": ranges}
+        await redis_client.set(CHALLENGE_KEY.format(challenge["id"]), json.dumps(state), ex=CHALLENGE_TTL)
+        return {"status": "challenge", "challenge": challenge}
+
+    async def _proof(self, manifest: Manifest, ranges: List[List[int]]) -> Optional[str]:
+        """SHA-256 attendu : plages relues depuis le cluster (quelques octets par plage)"""
+        self.store.locate([entry["hash"] for entry in manifest])
+        reader = manifest_reader(self.store, manifest)
+        hasher = hashlib.sha256()
+        try:
+            for offset, length in ranges:
+                async for data in reader(offset, length):
+                    hasher.update(data)
+        except Exception as e:
+            logger.warning(f"⚠️ Possession challenge unreadable: {e}")
+            return None
+        return hasher.hexdigest()
+
+    async def _verified_source(self, owner: models.User, obj_in: file_schema.InstantUploadRequest) -> Optional[models.File]:
+        key = CHALLENGE_KEY.format(obj_in.challenge_id)
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.get(key)
+            pipe.delete(key)   # Usage unique : une seule tentative par défi
+            raw, _ = await pipe.execute()
+        state = json.loads(raw) if raw else None
+        if state is None or (state["owner_id"], state["sha256"], state["size"]) != (owner.id, obj_in.sha256, obj_in.size):
+            return None
+        source = self._source(obj_in.sha256, obj_in.size)
+        if not await self._complete(source):
+            return None
+        expected = await self._proof(source.chunk_manifest, state["ranges"])
+        if expected is None or not hmac.compare_digest(expected, obj_in.proof):
+            return None
+        return source
+
+    # --- CRÉATION ---
+
+    async def create(self, owner: models.User, obj_in: file_schema.InstantUploadRequest) -> dict:
+        manifest: Optional[Manifest] = None
+        content_hash, mime_type = None, obj_in.mime_type
+
+        if obj_in.challenge_id is not None:
+            # Preuve fausse, défi expiré ou contenu inconnu : même réponse
+            source = await self._verified_source(owner, obj_in)
+            if source is None:
+                return {"status": "unknown"}
+        else:
+            source = self._source(obj_in.sha256, obj_in.size, reader=owner) if obj_in.sha256 else None
+            if not await self._complete(source):
+                source = None
+                # Manifest fourni en plus du hash : négociation par chunks, sans défi
+                if obj_in.sha256 and obj_in.chunks is None:
+                    return await self._challenge(owner, obj_in)
+
+        if source is not None:
+            manifest, content_hash = source.chunk_manifest, source.content_hash
+            mime_type = mime_type or source.mime_type
+        else:
+            entries = [entry.model_dump() for entry in obj_in.chunks]
+            if sum(entry["size"] for entry in entries) != obj_in.size:
+                raise HTTPException(status_code=400, detail="La somme des chunks ne correspond pas à la taille")
+            hashes = [entry["hash"] for entry in entries]
+            missing = await self.missing(owner, hashes)
+            if missing:
+                return {"status": "missing_chunks", "missing": missing}
+            sizes = self.store.known_sizes(hashes)
+            if any(sizes.get(entry["hash"]) != entry["size"] for entry in entries):
+                raise HTTPException(status_code=400, detail="Taille de chunk incohérente avec le contenu stocké")
+            manifest = entries
+
+        self.db.refresh(owner)
+        if (owner.used_storage or 0) + obj_in.size > (owner.storage_limit or 0):
+            raise HTTPException(status_code=413, detail="Quota de stockage dépassé")
+        db_file = await FileManager(self.db).create_file_metadata(
+            metadata=file_schema.FileCreate(name=obj_in.name, folder_id=obj_in.folder_id),
+            owner_id=owner.id,
+            size=obj_in.size,
+            mime_type=mime_type or "application/octet-stream",
+            node_id=self.store.home_node(manifest),
+            content_hash=content_hash,
+            chunk_manifest=manifest
+        )
+        if content_hash is None:
+            celery_app.send_task("app.workers.tasks_maintenance.compute_content_hash", args=[db_file.id])
+        logger.info(f"⚡ Instant upload of {obj_in.name} ({obj_in.size} bytes, {len(manifest)} chunks reused)")
+        return {"status": "created", "file": file_schema.FileResponse.model_validate(db_file)}
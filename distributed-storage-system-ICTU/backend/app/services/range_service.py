@@ -0,0 +1,179 @@
+import secrets
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+from urllib.parse import quote
+
+import aiofiles
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+# Lecteur de contenu : (offset, length) -> flux d'octets.
+# Permet de brancher indifféremment un fichier local ou un DownloadBlock gRPC.
+RangeReader = Callable[[int, int], AsyncIterator[bytes]]
+
+# Au-delà, un client demande probablement des ranges pour saturer le serveur
+MAX_RANGES = 16
+READ_CHUNK_SIZE = 1024 * 1024
+
+class RangeNotSatisfiable(Exception):
+    """Aucun des ranges demandés ne chevauche le contenu (-> 416)"""
+
+def parse_range_header(header: Optional[str], size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    Parse un header Range (RFC 7233) en liste de (start, end) inclusifs.
+    Retourne None si le header est absent ou syntaxiquement invalide :
+    la RFC impose alors d'ignorer le header et de servir la ressource complète.
+    """
+    if not header:
+        return None
+
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec.strip():
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, sep, last = part.partition("-")
+        first, last = first.strip(), last.strip()
+        if not sep or not (first.isdigit() or first == "") or not (last.isdigit() or last == ""):
+            return None
+
+        if first == "":
+            # Suffixe : "-500" = les 500 derniers octets
+            if last == "":
+                return None
+            suffix = int(last)
+            if suffix == 0 or size == 0:
+                # Rien à servir (RFC 7233 : suffixe sur une ressource vide -> 416)
+                continue
+            ranges.append((max(size - suffix, 0), size - 1))
+            continue
+
+        start = int(first)
+        end = int(last) if last else size - 1
+        if last and end < start:
+            return None
+        if start >= size:
+            # Range non satisfiable : on l'ignore, 416 seulement si tous le sont
+            continue
+        ranges.append((start, min(end, size - 1)))
+
+    if not ranges:
+        raise RangeNotSatisfiable()
+
+    if len(ranges) > MAX_RANGES:
+        ranges = _coalesce(ranges)
+        if len(ranges) > MAX_RANGES:
+            raise RangeNotSatisfiable()
+    return ranges
+
+def _coalesce(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Fusionne les ranges qui se chevauchent ou se touchent"""
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def local_file_reader(path: str) -> RangeReader:
+    """Lecteur sur un fichier local : seek + lecture des seuls octets demandés"""
+    async def reader(offset: int, length: int) -> AsyncIterator[bytes]:
+        async with aiofiles.open(path, mode="rb") as f:
+            await f.seek(offset)
+            remaining = length
+            while remaining > 0:
+                chunk = await f.read(min(READ_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+    return reader
+
+class RangeService:
+    @staticmethod
+    def content_disposition(filename: str, disposition: str = "inline") -> str:
+        """Même encodage que FileResponse (RFC 6266 / 5987 pour les noms non ASCII)"""
+        quoted = quote(filename)
+        if quoted != filename:
+            return f"{disposition}; filename*=utf-8''{quoted}"
+        return f'{disposition}; filename="{filename}"'
+
+    def build_response(
+        self,
+        request: Request,
+        reader: RangeReader,
+        size: int,
+        filename: str,
+        media_type: Optional[str],
+        etag: Optional[str] = None,
+        disposition: str = "inline",
+    ) -> Response:
+        """
+        Construit la réponse adaptée au header Range :
+        200 (complet), 206 simple, 206 multipart/byteranges ou 416.
+        """
+        media_type = media_type or "application/octet-stream"
+        headers = {
+            "Accept-Ranges": "bytes",
+            "Content-Disposition": self.content_disposition(filename, disposition),
+        }
+        if etag:
+            headers["ETag"] = etag
+
+        range_header = request.headers.get("range")
+        # If-Range : si la ressource a changé depuis, on renvoie tout (pas de 206 incohérent)
+        if_range = request.headers.get("if-range")
+        if range_header and if_range and if_range != etag:
+            range_header = None
+
+        try:
+            ranges = parse_range_header(range_header, size)
+        except RangeNotSatisfiable:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+
+        if ranges is None:
+            headers["Content-Length"] = str(size)
+            return StreamingResponse(reader(0, size), media_type=media_type, headers=headers)
+
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            headers["Content-Length"] = str(end - start + 1)
+            return StreamingResponse(
+                reader(start, end - start + 1), status_code=206, media_type=media_type, headers=headers
+            )
+
+        # Multi-range : corps multipart/byteranges, chaque partie lue à la demande
+        boundary = secrets.token_hex(16)
+        parts = []
+        for start, end in ranges:
+            part_header = (
+                f"--{boundary}\r\n"
+                f"Content-Type: {media_type}\r\n"
+                f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+            ).encode()
+            parts.append((part_header, start, end))
+        closing = f"--{boundary}--\r\n".encode()
+
+        total = sum(len(h) + (end - start + 1) + 2 for h, start, end in parts) + len(closing)
+        headers["Content-Length"] = str(total)
+
+        async def multipart_body() -> AsyncIterator[bytes]:
+            for part_header, start, end in parts:
+                yield part_header
+                async for chunk in reader(start, end - start + 1):
+                    yield chunk
+                yield b"\r\n"
+            yield closing
+
+        return StreamingResponse(
+            multipart_body(),
+            status_code=206,
+            media_type=f"multipart/byteranges; boundary={boundary}",
+            headers=headers,
+        )
@@ -0,0 +1,216 @@
+import json
+import time
+import uuid
+import base64
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.database import models
+from app.database.redis import redis_client
+from app.schemas import file as file_schema
+from app.services.chunk_store import ChunkedWriter, Manifest
+from app.services.cluster_store import ClusterChunkStore, ClusterUnavailable
+from app.services.file_manager import FileManager
+from app.services.upload_pipeline import SNIFF_SIZE, sniff_mime
+from app.workers.celery_app import celery_app
+
+logger = logging.getLogger(__name__)
+
+SESSION_KEY = "upload:{}"              # Métadonnées de la session (hash Redis)
+PARTS_KEY = "upload:{}:parts"          # index de partie -> manifest JSON des chunks reçus
+LOCK_KEY = "upload:{}:finalize"        # Un seul finaliseur, même si les dernières parties arrivent ensemble
+DONE_KEY = "upload:{}:file"            # "owner_id:file_id" une fois finalisé (reprise après coupure)
+FINALIZE_LOCK_SECONDS = 300
+CHECKSUM_MISMATCH = 460                # Code tus (extension checksum)
+
+class ResumableUploadService:
+    """
+    Upload reprenable (inspiré de tus) : une session est créée avec la taille
+    totale, puis le client envoie des parties de UPLOAD_PART_SIZE octets (la
+    dernière plus courte) par PATCH à leur offset, dans n'importe quel ordre et
+    en parallèle. Chaque partie est découpée en chunks CDC posés sur les nodes
+    dès sa réception ; seul son manifest est gardé dans Redis. Après une
+    coupure, le client relit les plages reçues et n'envoie que les parties
+    manquantes (on perd au plus une partie).
+
+    La réception de la dernière partie crée le fichier (métadonnées, références
+    des chunks et quota dans une seule transaction). La session expire
+    UPLOAD_SESSION_TTL après sa création ; ses chunks, sans référence jusque-là,
+    sont protégés du GC pendant ce délai (cf. GCCoordinator).
+    """
+    def __init__(self, db: Session, store: ClusterChunkStore):
+        self.db = db
+        self.store = store
+
+    # --- SESSION ---
+
+    async def create(self, owner: models.User, obj_in: file_schema.ResumableUploadCreate) -> dict:
+        if (owner.used_storage or 0) + obj_in.size > (owner.storage_limit or 0):
+            raise HTTPException(status_code=413, detail="Quota de stockage dépassé")
+
+        upload_id = uuid.uuid4().hex
+        part_size = settings.UPLOAD_PART_SIZE
+        session = {
+            "owner_id": owner.id,
+            "name": obj_in.name,
+            "folder_id": obj_in.folder_id or "",
+            "mime_type": obj_in.mime_type or "",
+            "size": obj_in.size,
+            "part_size": part_size,
+            "parts_total": -(-obj_in.size // part_size),
+            "expires_at": int(time.time()) + settings.UPLOAD_SESSION_TTL,
+        }
+        key = SESSION_KEY.format(upload_id)
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping=session)
+            pipe.expireat(key, session["expires_at"])
+            await pipe.execute()
+        logger.info(f"📦 Resumable upload {upload_id} opened ({obj_in.size} bytes, {session['parts_total']} parts)")
+        return self._status(upload_id, session, [])
+
+    async def _session(self, upload_id: str, owner: models.User) -> Dict[str, str]:
+        session = await redis_client.hgetall(SESSION_KEY.format(upload_id))
+        if not session or int(session["owner_id"]) != owner.id:
+            raise HTTPException(status_code=404, detail="Session d'upload introuvable ou expirée")
+        return session
+
+    async def _received(self, upload_id: str) -> List[int]:
+        return sorted(int(index) for index in await redis_client.hkeys(PARTS_KEY.format(upload_id)))
+
+    def _status(self, upload_id: str, session: dict, parts: List[int], file: Optional[models.File] = None) -> dict:
+        size, part_size = int(session["size"]), int(session["part_size"])
+        # Parties reçues fusionnées en plages d'octets [début, fin)
+        ranges: List[Tuple[int, int]] = []
+        for index in parts:
+            start, end = index * part_size, min((index + 1) * part_size, size)
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((start, end))
+        return {
+            "id": upload_id,
+            "size": size,
+            "part_size": part_size,
+            "received": [list(r) for r in ranges],
+            "offset": ranges[0][1] if ranges and ranges[0][0] == 0 else 0,
+            "expires_at": int(session["expires_at"]),
+            "file": file_schema.FileResponse.model_validate(file) if file is not None else None,
+        }
+
+    async def status(self, upload_id: str, owner: models.User) -> dict:
+        done = await redis_client.get(DONE_KEY.format(upload_id))
+        if done:
+            # Déjà finalisée : le client qui a perdu la réponse du dernier PATCH retrouve son fichier
+            owner_id, file_id = done.split(":", 1)
+            file = self.db.query(models.File).filter_by(id=file_id).first()
+            if int(owner_id) == owner.id and file is not None:
+                session = {"size": file.size, "part_size": settings.UPLOAD_PART_SIZE, "expires_at": 0}
+                return self._status(upload_id, session, list(range(-(-file.size // settings.UPLOAD_PART_SIZE))), file)
+        session = await self._session(upload_id, owner)
+        return self._status(upload_id, session, await self._received(upload_id))
+
+    async def abort(self, upload_id: str, owner: models.User):
+        """Abandon : les chunks déjà posés n'ont aucune référence, le GC les ramassera"""
+        await self._session(upload_id, owner)
+        await redis_client.delete(SESSION_KEY.format(upload_id), PARTS_KEY.format(upload_id))
+
+    # --- PARTIES ---
+
+    @staticmethod
+    def _expected_checksum(header: Optional[str]) -> Optional[str]:
+        """Upload-Checksum: "sha256 <digest base64>" -> digest hexadécimal"""
+        if not header:
+            return None
+        algorithm, _, digest = header.partition(" ")
+        if algorithm.lower() != "sha256":
+            raise HTTPException(status_code=400, detail="Seul le checksum sha256 est supporté")
+        try:
+            return base64.b64decode(digest.strip(), validate=True).hex()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Upload-Checksum invalide")
+
+    async def write_part(self, upload_id: str, owner: models.User, offset: int, request: Request,
+                         checksum: Optional[str] = None) -> dict:
+        session = await self._session(upload_id, owner)
+        size, part_size = int(session["size"]), int(session["part_size"])
+        if offset % part_size or not 0 <= offset < size:
+            raise HTTPException(status_code=409, detail=f"Offset invalide : multiple de {part_size} attendu")
+        index = offset // part_size
+        expected = min(part_size, size - offset)
+        expected_hash = self._expected_checksum(checksum)
+
+        writer = ChunkedWriter(self.store)
+        head = bytearray()
+        try:
+            async for data in request.stream():
+                if writer.size + len(data) > expected:
+                    raise HTTPException(status_code=400, detail=f"Partie trop longue ({expected} octets attendus)")
+                if index == 0 and len(head) < SNIFF_SIZE:
+                    head += data[:SNIFF_SIZE - len(head)]
+                await writer.write(data)
+            part_hash = await writer.finish()
+        except ClusterUnavailable as e:
+            raise HTTPException(status_code=503, detail=f"Stockage indisponible : {e}")
+        if writer.size != expected:
+            # Partie tronquée (coupure) : le client la renverra entière
+            raise HTTPException(status_code=400, detail=f"Partie incomplète ({writer.size}/{expected} octets)")
+        if expected_hash is not None and part_hash != expected_hash:
+            raise HTTPException(status_code=CHECKSUM_MISMATCH, detail="Checksum de la partie invalide")
+
+        self.db.commit()  # Emplacements des répliques
+        parts_key = PARTS_KEY.format(upload_id)
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.hset(parts_key, str(index), json.dumps(writer.manifest))
+            pipe.expireat(parts_key, int(session["expires_at"]))
+            if index == 0:
+                pipe.hset(SESSION_KEY.format(upload_id), "mime_type", sniff_mime(bytes(head), session["mime_type"] or None))
+            pipe.hlen(parts_key)
+            received = (await pipe.execute())[-1]
+
+        if received == int(session["parts_total"]):
+            return await self._finalize(upload_id, owner)
+        return self._status(upload_id, session, await self._received(upload_id))
+
+    # --- FINALISATION ---
+
+    async def _finalize(self, upload_id: str, owner: models.User) -> dict:
+        lock = LOCK_KEY.format(upload_id)
+        if not await redis_client.set(lock, "1", nx=True, ex=FINALIZE_LOCK_SECONDS):
+            # Une autre requête (partie reçue en même temps) est en train de finaliser
+            return await self.status(upload_id, owner)
+        try:
+            session = await self._session(upload_id, owner)
+            parts = await redis_client.hgetall(PARTS_KEY.format(upload_id))
+            manifest: Manifest = []
+            for index in range(int(session["parts_total"])):
+                manifest.extend(json.loads(parts[str(index)]))
+            size = int(session["size"])
+
+            self.db.refresh(owner)
+            if (owner.used_storage or 0) + size > (owner.storage_limit or 0):
+                raise HTTPException(status_code=413, detail="Quota de stockage dépassé")
+
+            db_file = await FileManager(self.db).create_file_metadata(
+                metadata=file_schema.FileCreate(name=session["name"], folder_id=session["folder_id"] or None),
+                owner_id=owner.id,
+                size=size,
+                mime_type=session["mime_type"] or "application/octet-stream",
+                node_id=self.store.home_node(manifest),
+                chunk_manifest=manifest
+            )
+        except BaseException:
+            await redis_client.delete(lock)
+            raise
+
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.set(DONE_KEY.format(upload_id), f"{owner.id}:{db_file.id}", ex=settings.UPLOAD_SESSION_TTL)
+            pipe.delete(SESSION_KEY.format(upload_id), PARTS_KEY.format(upload_id), lock)
+            await pipe.execute()
+        # Parties reçues dans le désordre : le SHA-256 du fichier complet est calculé en tâche de fond
+        celery_app.send_task("app.workers.tasks_maintenance.compute_content_hash", args=[db_file.id])
+        logger.info(f"📦 Resumable upload {upload_id} finalized as {db_file.id}")
+        return self._status(upload_id, session, list(range(int(session["parts_total"]))), db_file)
@@ -1,6 +1,7 @@
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from app.database import models
+from app.services.file_manager import FileManager
 
 class RetentionPolicy:
     def __init__(self, db: Session):
@@ -14,6 +15,9 @@ class RetentionPolicy:
             models.File.is_trashed == True,
             models.File.trashed_at < limit_date
         ).all()
+
+        # Les chunks ne sont pas supprimés ici : on libère leurs références, le GC s'en charge
+        FileManager(self.db).release_content(files_to_delete)
         
         for file in files_to_delete:
             # 1. Supprimer physiquement sur le Node (via gRPC)
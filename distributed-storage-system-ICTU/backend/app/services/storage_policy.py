@@ -0,0 +1,38 @@
+import re
+from typing import Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.database import models
+
+REPLICATED = "replicated"
+_EC_PATTERN = re.compile(r"^ec:(\d+)\+(\d+)$")
+
+def parse_storage_class(storage_class: str) -> Optional[Tuple[int, int]]:
+    """(k, m) pour "ec:K+M", None pour "replicated". ValueError si invalide."""
+    if storage_class == REPLICATED:
+        return None
+    match = _EC_PATTERN.match(storage_class or "")
+    if not match:
+        raise ValueError(f"Classe de stockage invalide : {storage_class!r}")
+    k, m = int(match.group(1)), int(match.group(2))
+    if k < 1 or m < 1 or k + m > 256:
+        raise ValueError(f"Schéma d'erasure coding invalide : {storage_class!r} (1 <= K, 1 <= M, K + M <= 256)")
+    return k, m
+
+def effective_storage_class(db: Session, file: models.File) -> str:
+    """Classe du fichier, sinon celle du dossier le plus proche qui en définit une, sinon le défaut"""
+    if file.storage_class:
+        return file.storage_class
+    folder_id = file.folder_id
+    seen = set()
+    while folder_id and folder_id not in seen:
+        seen.add(folder_id)
+        folder = db.query(models.Folder).filter_by(id=folder_id).first()
+        if folder is None:
+            break
+        if folder.storage_class:
+            return folder.storage_class
+        folder_id = folder.parent_id
+    return settings.DEFAULT_STORAGE_CLASS
@@ -0,0 +1,202 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from multipart.multipart import MultipartParser, parse_options_header
+
+from app.core.config import settings
+
+try:
+    import magic  # python-magic : nécessite libmagic sur la machine
+except ImportError:
+    magic = None
+
+logger = logging.getLogger(__name__)
+
+SNIFF_SIZE = 2048             # Octets examinés pour deviner le type MIME
+MAX_FIELD_SIZE = 64 * 1024    # Champs texte du formulaire (folder_id...)
+GENERIC_TYPES = ("application/octet-stream", "")
+
+# Signatures usuelles, utilisées si libmagic n'est pas disponible
+SIGNATURES: List[Tuple[int, bytes, str]] = [
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (8, b"WEBP", "image/webp"),
+    (0, b"%PDF-", "application/pdf"),
+    (0, b"PK\x03\x04", "application/zip"),
+    (0, b"\x1f\x8b", "application/gzip"),
+    (0, b"7z\xbc\xaf\x27\x1c", "application/x-7z-compressed"),
+    (4, b"ftyp", "video/mp4"),
+    (0, b"\x1a\x45\xdf\xa3", "video/webm"),
+    (0, b"ID3", "audio/mpeg"),
+    (0, b"OggS", "audio/ogg"),
+    (0, b"fLaC", "audio/flac"),
+]
+
+def sniff_mime(head: bytes, declared: Optional[str] = None) -> str:
+    """Type MIME d'après les premiers octets ; celui annoncé par le client ne sert que de repli"""
+    if magic is not None:
+        try:
+            detected = magic.from_buffer(head, mime=True)
+        except Exception as e:
+            logger.warning(f"libmagic indisponible : {e}")
+            detected = None
+        if detected and detected not in GENERIC_TYPES:
+            # libmagic voit du texte brut là où le client sait qu'il s'agit de CSV, JSON...
+            if detected == "text/plain" and declared and declared.startswith("text/"):
+                return declared
+            return detected
+    for offset, signature, mime_type in SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            return mime_type
+    return declared or "application/octet-stream"
+
+class StreamingUpload:
+    """
+    Réception en flux d'un upload multipart/form-data (un champ fichier + des
+    champs texte), sans passer par UploadFile : Starlette recopierait tout le
+    fichier dans un fichier temporaire avant d'appeler la route.
+
+    Chaque morceau reçu est transmis au writer (hash SHA-256, découpage CDC,
+    écriture des chunks) par une file bornée : le stockage avance pendant que
+    le réseau continue d'arriver, et la mémoire par upload reste constante
+    quelle que soit la taille du fichier. Le quota est vérifié octet par octet :
+    un upload trop gros est coupé dès le dépassement (413).
+    Les chunks déjà écrits d'un upload interrompu n'ont aucune référence :
+    le GC les ramasse.
+    """
+    def __init__(self, request: Request, writer, quota: int, file_field: str = "file"):
+        self.request = request
+        self.writer = writer
+        self.quota = quota
+        self.file_field = file_field
+
+        self.fields: Dict[str, str] = {}
+        self.filename: Optional[str] = None
+        self.declared_type: Optional[str] = None
+        self.mime_type: Optional[str] = None
+        self.size = 0
+
+        self._events: List[tuple] = []
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._part: Optional[Tuple[str, str]] = None   # ("file" | "field", nom)
+        self._field_value = bytearray()
+        self._head = bytearray()
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=settings.UPLOAD_PIPELINE_DEPTH)
+        self._error: Optional[BaseException] = None
+
+    # --- PARSING (callbacks synchrones de python-multipart) ---
+
+    def _parser(self) -> MultipartParser:
+        content_type, params = parse_options_header(self.request.headers.get("content-type", ""))
+        boundary = params.get(b"boundary")
+        if content_type != b"multipart/form-data" or not boundary:
+            raise HTTPException(status_code=400, detail="Corps multipart/form-data attendu")
+
+        def on_header_field(data, start, end):
+            self._header_field += data[start:end]
+
+        def on_header_value(data, start, end):
+            self._header_value += data[start:end]
+
+        def on_header_end():
+            self._headers[self._header_field.lower()] = self._header_value
+            self._header_field, self._header_value = b"", b""
+
+        return MultipartParser(boundary, callbacks={
+            "on_part_begin": lambda: self._headers.clear(),
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": lambda: self._events.append(("begin", dict(self._headers))),
+            "on_part_data": lambda data, start, end: self._events.append(("data", bytes(data[start:end]))),
+            "on_part_end": lambda: self._events.append(("end", None)),
+        })
+
+    async def _handle(self, kind: str, payload):
+        if kind == "begin":
+            _, params = parse_options_header(payload.get(b"content-disposition", b""))
+            name = params.get(b"name", b"").decode("utf-8", "replace")
+            if b"filename" in params and name == self.file_field:
+                if self.filename is not None:
+                    raise HTTPException(status_code=400, detail="Un seul fichier par requête")
+                self.filename = params[b"filename"].decode("utf-8", "replace")
+                self.declared_type = payload.get(b"content-type", b"").decode("latin-1") or None
+                self._part = ("file", name)
+            else:
+                self._part = ("field", name)
+                self._field_value.clear()
+        elif kind == "data" and self._part is not None:
+            if self._part[0] == "file":
+                await self._feed(payload)
+            else:
+                self._field_value += payload
+                if len(self._field_value) > MAX_FIELD_SIZE:
+                    raise HTTPException(status_code=400, detail=f"Champ '{self._part[1]}' trop long")
+        elif kind == "end" and self._part is not None:
+            if self._part[0] == "file":
+                self._sniff()
+            else:
+                self.fields[self._part[1]] = self._field_value.decode("utf-8", "replace")
+            self._part = None
+
+    # --- PIPELINE ---
+
+    def _sniff(self):
+        if self.mime_type is None:
+            self.mime_type = sniff_mime(bytes(self._head), self.declared_type)
+
+    async def _feed(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.quota:
+            raise HTTPException(status_code=413, detail="Quota de stockage dépassé")
+        if self.mime_type is None:
+            self._head += data[:SNIFF_SIZE - len(self._head)]
+            if len(self._head) >= SNIFF_SIZE:
+                self._sniff()
+        await self._queue.put(data)
+        if self._error is not None:
+            raise self._error
+
+    async def _consume(self):
+        # Une erreur d'écriture n'arrête pas la consommation : le producteur ne doit jamais rester bloqué
+        while (data := await self._queue.get()) is not None:
+            if self._error is None:
+                try:
+                    await self.writer.write(data)
+                except Exception as e:
+                    self._error = e
+
+    async def run(self) -> str:
+        """Reçoit tout le corps ; retourne le hash SHA-256 du fichier"""
+        length = self.request.headers.get("content-length")
+        if length and length.isdigit() and int(length) > self.quota + MAX_FIELD_SIZE:
+            # Refus avant d'avoir lu le moindre octet
+            raise HTTPException(status_code=413, detail="Quota de stockage dépassé")
+
+        parser = self._parser()
+        consumer = asyncio.create_task(self._consume())
+        try:
+            async for received in self.request.stream():
+                parser.write(received)
+                events, self._events = self._events, []
+                for kind, payload in events:
+                    await self._handle(kind, payload)
+            parser.finalize()
+            await self._queue.put(None)
+            await consumer
+        finally:
+            if not consumer.done():
+                consumer.cancel()
+
+        if self._error is not None:
+            raise self._error
+        if self.filename is None:
+            raise HTTPException(status_code=400, detail=f"Champ fichier '{self.file_field}' manquant")
+        self._sniff()
+        return await self.writer.finish()
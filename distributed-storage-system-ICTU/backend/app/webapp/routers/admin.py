@@ -1,7 +1,10 @@
 from typing import Any
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from app.webapp.dependencies import SessionDep, get_current_superuser
-from app.schemas import admin_stats
+from app.schemas import admin_stats, node_metrics
+from app.orchestrator.node_manager import NodeManager
+from app.protos import admin_control_pb2
+from app.workers.celery_app import celery_app
 from datetime import datetime, timedelta
 from sqlalchemy import func
 from app.database import models
@@ -44,4 +47,44 @@ def get_admin_stats(db: SessionDep):
         ],
         "storage_growth": [],
         "file_type_distribution": dist
-    }
\ No newline at end of file
+    }
+
+# --- NODES : MAINTENANCE & DRAIN ---
+
+def _get_node(db, node_id: str) -> models.NodeStats:
+    node = db.query(models.NodeStats).filter_by(node_id=node_id).first()
+    if not node:
+        raise HTTPException(status_code=404, detail="Node introuvable")
+    return node
+
+@router.post("/nodes/{node_id}/maintenance", response_model=node_metrics.NodeStatusResponse)
+async def set_node_maintenance(node_id: str, obj_in: node_metrics.MaintenanceUpdate, db: SessionDep):
+    """Lecture seule : le node n'est plus choisi pour les écritures mais continue de servir les lectures."""
+    _get_node(db, node_id)
+    manager = NodeManager(db)
+    admin_client = manager.get_admin_client(node_id)
+    if admin_client is None:
+        raise HTTPException(status_code=400, detail="Node ID invalide")
+    try:
+        response = await admin_client.SetMaintenanceMode(
+            admin_control_pb2.MaintenanceRequest(enable=obj_in.enable, reason=obj_in.reason)
+        )
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Node injoignable : {e}")
+
+    manager.set_status(node_id, response.status)
+    return {"node_id": node_id, "status": response.status}
+
+@router.post("/nodes/{node_id}/drain", response_model=node_metrics.DrainStatus, status_code=202)
+def drain_node(node_id: str, db: SessionDep):
+    """Vide le node (copie de tous ses blocs ailleurs) avant décommission. Suivi via /admin/drains/{task_id}."""
+    _get_node(db, node_id)
+    task = celery_app.send_task("app.workers.tasks_maintenance.drain_node", args=[node_id])
+    return {"task_id": task.id, "state": "PENDING"}
+
+@router.get("/drains/{task_id}", response_model=node_metrics.DrainStatus)
+def get_drain_status(task_id: str):
+    """Progression d'un drain (blocs traités, copiés, en échec...)"""
+    result = celery_app.AsyncResult(task_id)
+    progress = result.info if isinstance(result.info, dict) else None
+    return {"task_id": task_id, "state": result.state, "progress": progress}
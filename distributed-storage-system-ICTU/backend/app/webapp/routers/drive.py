@@ -1,20 +1,36 @@
 import os
-import shutil  # Ajouté pour la copie physique
+import hashlib
 from typing import List, Any, Optional
 from datetime import datetime
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, BackgroundTasks, Request, Path, Header, Response
 
+from app.core.config import settings
 from app.webapp.dependencies import SessionDep, CurrentUser
 from app.services.file_manager import FileManager
 from app.services.thumbnail_service import ThumbnailService
+from app.services.range_service import RangeService, local_file_reader
+from app.services.chunk_store import CHUNK_DIR, LocalChunkStore, ChunkedWriter, manifest_reader
+from app.services.cluster_store import ClusterChunkStore, ClusterUnavailable
+from app.services.block_ref_service import BlockRefService
+from app.services.storage_policy import parse_storage_class
+from app.services.upload_pipeline import StreamingUpload
+from app.services.resumable_upload import ResumableUploadService
+from app.services.instant_upload import InstantUploadService
+from app.workers.celery_app import celery_app
 from app.schemas import file as file_schema
 from fastapi import File, Form, UploadFile
 from app.database import models
 
 router = APIRouter()
 thumbnail_service = ThumbnailService()
+range_service = RangeService()
 UPLOAD_DIR = "uploads"
+# Chunks écrits sur le disque de l'API avant le passage au cluster : lus en dernier recours
+local_chunks = LocalChunkStore(CHUNK_DIR)
+
+def get_chunk_store(db) -> ClusterChunkStore:
+    """Chunks sur les nodes du cluster (un store par requête : nodes cibles choisis une fois)"""
+    return ClusterChunkStore(db, fallback=local_chunks)
 
 # --- 1. ROUTES FIXES (Priorité haute) ---
 
@@ -48,89 +64,188 @@ def get_shared_files(db: SessionDep, current_user: CurrentUser) -> Any:
 
 # app/webapp/routers/drive.py
 
-@router.post("/upload", response_model=List[file_schema.FileResponse], status_code=201)
+@router.post(
+    "/upload",
+    response_model=List[file_schema.FileResponse],
+    status_code=201,
+    # Corps lu à la main (flux) : on décrit le formulaire pour la doc OpenAPI
+    openapi_extra={"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+        "type": "object",
+        "required": ["file"],
+        "properties": {"file": {"type": "string", "format": "binary"}, "folder_id": {"type": "string"}},
+    }}}}},
+)
 async def upload_files(
-    *,
+    request: Request,
     db: SessionDep,
     current_user: CurrentUser,
-    # Utiliser File(...) sans List si tu n'envoies qu'un fichier à la fois
-    file: UploadFile = File(..., alias="file"), 
-    # Utiliser Form(None) pour rendre le folder_id optionnel et flexible
-    folder_id: Optional[str] = Form(None),
     background_tasks: BackgroundTasks
 ) -> Any:
+    """
+    Upload en flux (champ "file", "folder_id" optionnel) : le corps est
+    découpé en chunks CDC et stocké pendant la réception, sans fichier
+    temporaire ni copie complète en mémoire. Quota vérifié au fil de l'eau.
+    """
     file_manager = FileManager(db)
-    
-    # Lecture du binaire
-    file_content = await file.read() 
+    quota = (current_user.storage_limit or 0) - (current_user.used_storage or 0)
+
+    chunk_store = get_chunk_store(db)
+    writer = ChunkedWriter(chunk_store)
+    upload = StreamingUpload(request, writer, quota=quota)
+    try:
+        content_hash = await upload.run()
+    except ClusterUnavailable as e:
+        raise HTTPException(status_code=503, detail=f"Stockage indisponible : {e}")
+
+    # Uploads concurrents du même utilisateur : on revérifie avant d'imputer le quota
+    db.refresh(current_user)
+    if (current_user.used_storage or 0) + writer.size > (current_user.storage_limit or 0):
+        raise HTTPException(status_code=413, detail="Quota de stockage dépassé")
     
     # Nettoyage sécurisé de l'ID secteur
+    folder_id = upload.fields.get("folder_id")
     target_folder = None
     if folder_id and folder_id not in ["root", "null", "undefined", ""]:
         target_folder = folder_id
 
-    # 1. Synchronisation Métadonnées Nexus
+    # 1. Synchronisation Métadonnées Nexus (le manifest suffit à réassembler le fichier)
     db_file = await file_manager.create_file_metadata(
         metadata=file_schema.FileCreate(
-            name=file.filename, 
+            name=upload.filename, 
             folder_id=target_folder
         ),
         owner_id=current_user.id,
-        size=len(file_content),
-        mime_type=file.content_type or "application/octet-stream",
-        node_id="nexus-node-01"
+        size=writer.size,
+        mime_type=upload.mime_type,
+        node_id=chunk_store.home_node(writer.manifest),
+        content_hash=content_hash,
+        chunk_manifest=writer.manifest
     )
 
-    # 2. Persistance Physique (Vérifie que le dossier 'uploads' existe)
-    if not os.path.exists(UPLOAD_DIR):
-        os.makedirs(UPLOAD_DIR)
-        
-    file_path = os.path.join(UPLOAD_DIR, str(db_file.id))
-    with open(file_path, "wb") as f:
-        f.write(file_content)
-
-    # 3. Traitement asynchrone (Thumbnails)
+    # 2. Traitement asynchrone (Thumbnails)
     background_tasks.add_task(thumbnail_service.generate_preview, file_id=db_file.id)
     
     return [file_schema.FileResponse.model_validate(db_file)]
-    file_manager = FileManager(db)
-    
-    # On traite directement 'file' au lieu de boucler sur 'files'
-    file_content = await file.read() 
-    
-    target_folder = folder_id if folder_id not in ["root", "null", "undefined", ""] else None
 
-    db_file = await file_manager.create_file_metadata(
-        metadata=file_schema.FileCreate(name=file.filename, folder_id=target_folder),
-        owner_id=current_user.id,
-        size=len(file_content),
-        mime_type=file.content_type or "application/octet-stream",
-        node_id="nexus-node-01"
+@router.post("/chunks/missing", response_model=file_schema.MissingChunks)
+async def get_missing_chunks(query: file_schema.ChunkQuery, db: SessionDep, current_user: CurrentUser) -> Any:
+    """
+    Négociation avant upload : le client envoie les hash de ses chunks CDC
+    et ne reçoit que ceux que le cluster n'a pas encore.
+    Ré-uploader un fichier déjà présent ne coûte qu'un aller-retour de hash.
+    Seuls les chunks déjà fournis par l'appelant comptent comme présents : la
+    réponse ne révèle rien du contenu des autres utilisateurs.
+    """
+    # Un même chunk peut apparaître plusieurs fois dans un fichier : on ne le demande qu'une fois
+    return {"missing": await InstantUploadService(db, get_chunk_store(db)).missing(current_user, query.hashes)}
+
+@router.put("/chunks/{chunk_hash}", status_code=201)
+async def upload_chunk(
+    request: Request,
+    db: SessionDep,
+    current_user: CurrentUser,
+    chunk_hash: str = Path(..., pattern=r"^[0-9a-f]{64}$")
+) -> Any:
+    """Upload d'un chunk manquant (corps brut), vérifié contre son hash."""
+    hasher = hashlib.sha256()
+    data = bytearray()
+    async for part in request.stream():
+        data += part
+        if len(data) > settings.CDC_MAX_SIZE:
+            raise HTTPException(status_code=413, detail="Chunk trop volumineux")
+        hasher.update(part)
+
+    if hasher.hexdigest() != chunk_hash:
+        raise HTTPException(status_code=400, detail="Hash du chunk invalide")
+
+    try:
+        is_new = await get_chunk_store(db).put(chunk_hash, bytes(data))
+    except ClusterUnavailable as e:
+        raise HTTPException(status_code=503, detail=f"Stockage indisponible : {e}")
+    # L'appelant a prouvé qu'il détient le chunk (hash vérifié) : la négociation pourra le lui annoncer
+    BlockRefService(db).add_owner(current_user.id, [chunk_hash])
+    db.commit()  # Emplacements des répliques
+    return {"hash": chunk_hash, "size": len(data), "is_duplicate": not is_new}
+
+@router.post("/upload/instant", response_model=file_schema.InstantUploadResult)
+async def instant_upload(obj_in: file_schema.InstantUploadRequest, db: SessionDep, current_user: CurrentUser) -> Any:
+    """
+    Upload instantané : le client annonce le SHA-256 du fichier ou son
+    manifest de chunks. Si le cluster a déjà tout le contenu, le fichier est
+    créé sans transfert ("created").
+    Par SHA-256, hors fichiers lisibles par l'appelant, la réponse est un défi
+    ("challenge") : rappeler avec challenge_id et proof (SHA-256 des plages
+    demandées, concaténées). Par manifest, la réponse liste les chunks à
+    envoyer ("missing_chunks", via PUT /chunks/{hash}). "unknown" : envoyer le
+    manifest ou faire un upload classique.
+    """
+    return await InstantUploadService(db, get_chunk_store(db)).create(current_user, obj_in)
+
+# --- UPLOAD REPRENABLE (parties PATCHées à leur offset, reprise après coupure) ---
+
+def _upload_headers(response: Response, upload: dict):
+    # Équivalents tus : un client tus séquentiel n'a besoin que de ces deux headers
+    response.headers["Upload-Offset"] = str(upload["offset"])
+    response.headers["Upload-Length"] = str(upload["size"])
+    response.headers["Cache-Control"] = "no-store"
+
+@router.post("/uploads", response_model=file_schema.ResumableUploadStatus, status_code=201)
+async def create_resumable_upload(
+    obj_in: file_schema.ResumableUploadCreate,
+    response: Response,
+    db: SessionDep,
+    current_user: CurrentUser
+) -> Any:
+    """Ouvre une session d'upload pour un fichier de `size` octets."""
+    upload = await ResumableUploadService(db, get_chunk_store(db)).create(current_user, obj_in)
+    response.headers["Location"] = f"{settings.API_V1_STR}/drive/uploads/{upload['id']}"
+    _upload_headers(response, upload)
+    return upload
+
+@router.api_route("/uploads/{upload_id}", methods=["GET", "HEAD"], response_model=file_schema.ResumableUploadStatus)
+async def get_resumable_upload(upload_id: str, response: Response, db: SessionDep, current_user: CurrentUser) -> Any:
+    """Plages déjà reçues : le client n'envoie que les parties manquantes."""
+    upload = await ResumableUploadService(db, get_chunk_store(db)).status(upload_id, current_user)
+    _upload_headers(response, upload)
+    return upload
+
+@router.patch("/uploads/{upload_id}", response_model=file_schema.ResumableUploadStatus)
+async def upload_part(
+    upload_id: str,
+    request: Request,
+    response: Response,
+    db: SessionDep,
+    current_user: CurrentUser,
+    upload_offset: int = Header(..., alias="Upload-Offset"),
+    upload_checksum: Optional[str] = Header(None, alias="Upload-Checksum")
+) -> Any:
+    """
+    Envoie une partie (corps brut) à son offset, multiple de part_size.
+    Les parties peuvent être envoyées en parallèle ; la dernière reçue
+    finalise le fichier (champ `file` de la réponse).
+    """
+    upload = await ResumableUploadService(db, get_chunk_store(db)).write_part(
+        upload_id, current_user, upload_offset, request, checksum=upload_checksum
     )
+    _upload_headers(response, upload)
+    return upload
 
-    file_path = os.path.join("uploads", str(db_file.id))
-    with open(file_path, "wb") as f:
-        f.write(file_content)
+@router.delete("/uploads/{upload_id}", status_code=204)
+async def abort_resumable_upload(upload_id: str, db: SessionDep, current_user: CurrentUser):
+    """Abandonne la session (les chunks déjà envoyés seront ramassés par le GC)."""
+    await ResumableUploadService(db, get_chunk_store(db)).abort(upload_id, current_user)
+    return None
 
-    background_tasks.add_task(thumbnail_service.generate_preview, file_id=db_file.id)
-    
-    return [file_schema.FileResponse.model_validate(db_file)]
 # --- 2. ROUTES PUBLIQUES (Sans authentification) ---
 
 @router.get("/share/preview/{file_id}")
-def get_public_preview(file_id: str, db: SessionDep):
-    """Accès public au fragment via lien direct."""
+def get_public_preview(file_id: str, request: Request, db: SessionDep):
+    """Accès public au fragment via lien direct (supporte Range pour le seek vidéo)."""
     file_meta = db.query(models.File).filter_by(id=file_id).first()
     if not file_meta:
         raise HTTPException(status_code=404, detail="Lien invalide")
 
-    file_path = os.path.join(UPLOAD_DIR, str(file_id))
-    return FileResponse(
-        path=file_path, 
-        filename=file_meta.name, 
-        media_type=file_meta.mime_type,
-        content_disposition_type="inline"
-    )
+    return _ranged_file_response(request, file_meta, db)
 
 # --- 3. ROUTES DYNAMIQUES (Authentifiées) ---
 
@@ -143,18 +258,39 @@ def get_file_details(file_id: str, db: SessionDep, current_user: CurrentUser):
     return file_schema.FileResponse.model_validate(file)
 
 @router.get("/{file_id}/download")
-def download_file(file_id: str, db: SessionDep, current_user: CurrentUser):
-    """Téléchargement sécurisé."""
+def download_file(file_id: str, request: Request, db: SessionDep, current_user: CurrentUser):
+    """Téléchargement sécurisé (reprise et téléchargements partiels via Range)."""
     file_meta = db.query(models.File).filter(models.File.id == file_id).first()
     if not file_meta:
         raise HTTPException(status_code=404)
 
-    file_path = os.path.join(UPLOAD_DIR, str(file_id))
-    return FileResponse(
-        path=file_path,
+    return _ranged_file_response(request, file_meta, db)
+
+def _ranged_file_response(request: Request, file_meta: models.File, db):
+    """Sert le fragment en 200/206/416 selon le header Range (RFC 7233)."""
+    if file_meta.chunk_manifest is not None:
+        # Fichier découpé en chunks CDC : réassemblage dans l'ordre du manifest,
+        # emplacements résolus avant l'envoi (la session DB est fermée pendant le streaming)
+        chunk_store = get_chunk_store(db)
+        chunk_store.locate([entry["hash"] for entry in file_meta.chunk_manifest])
+        reader = manifest_reader(chunk_store, file_meta.chunk_manifest)
+        size = file_meta.size
+    else:
+        # Fichier antérieur au chunking : stocké d'un seul tenant
+        file_path = os.path.join(UPLOAD_DIR, str(file_meta.id))
+        if not os.path.exists(file_path):
+            raise HTTPException(status_code=404, detail="Fragment introuvable")
+        reader = local_file_reader(file_path)
+        size = os.path.getsize(file_path)
+
+    etag = f'"{file_meta.content_hash}"' if file_meta.content_hash else None
+    return range_service.build_response(
+        request,
+        reader=reader,
+        size=size,
         filename=file_meta.name,
         media_type=file_meta.mime_type,
-        content_disposition_type="inline"
+        etag=etag,
     )
 
 @router.patch("/{file_id}", response_model=file_schema.FileResponse)
@@ -173,6 +309,24 @@ def update_file(file_id: str, obj_in: file_schema.FileUpdate, db: SessionDep, cu
     db.refresh(file)
     return file_schema.FileResponse.model_validate(file)
 
+@router.put("/{file_id}/storage-class", response_model=file_schema.FileResponse)
+def set_file_storage_class(file_id: str, obj_in: file_schema.StorageClassUpdate, db: SessionDep, current_user: CurrentUser):
+    """Réplication 3x ou erasure coding "ec:K+M" (None = hérité du dossier). Conversion en tâche de fond."""
+    file = db.query(models.File).filter_by(id=file_id, owner_id=current_user.id).first()
+    if not file:
+        raise HTTPException(status_code=404, detail="Fragment introuvable")
+    if obj_in.storage_class is not None:
+        try:
+            parse_storage_class(obj_in.storage_class)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    file.storage_class = obj_in.storage_class
+    db.commit()
+    db.refresh(file)
+    celery_app.send_task("app.workers.tasks_replication.apply_storage_class", kwargs={"file_id": file.id})
+    return file_schema.FileResponse.model_validate(file)
+
 @router.delete("/files/{file_id}", status_code=204)
 def delete_file(file_id: str, db: SessionDep, current_user: CurrentUser):
     """Suppression définitive ou mise à la corbeille."""
@@ -188,6 +342,7 @@ def delete_file(file_id: str, db: SessionDep, current_user: CurrentUser):
     try:
         file_manager.move_to_trash(file_id, current_user.id)
     except Exception:
+        file_manager.release_content([file])
         db.delete(file)
         db.commit()
     return None
@@ -207,6 +362,8 @@ def hard_delete_file(file_id: str, db: SessionDep, current_user: CurrentUser):
     if not file:
         raise HTTPException(status_code=404, detail="Fragment introuvable")
 
+    # Les chunks CDC peuvent être partagés : on libère leurs références, le GC fera le ménage
+    FileManager(db).release_content([file])
     file_path = os.path.join(UPLOAD_DIR, str(file.id))
     if os.path.exists(file_path):
         os.remove(file_path)
@@ -221,7 +378,9 @@ def hard_delete_file(file_id: str, db: SessionDep, current_user: CurrentUser):
 def empty_trash(db: SessionDep, current_user: CurrentUser):
     """Désintègre tous les fichiers de la corbeille."""
     trashed_files = db.query(models.File).filter_by(owner_id=current_user.id, is_trashed=True).all()
-    
+
+    # Références de tous les chunks libérées en bloc, dans la même transaction
+    FileManager(db).release_content(trashed_files)
     for file in trashed_files:
         file_path = os.path.join(UPLOAD_DIR, str(file.id))
         if os.path.exists(file_path):
@@ -239,38 +398,19 @@ def copy_file(
     current_user: CurrentUser,
     target_folder_id: Optional[str] = None
 ):
-    """Clonage d'un fragment vers une destination spécifique."""
+    """Clonage d'un fragment vers une destination spécifique (métadonnées seules, contenu partagé)."""
     # 1. Récupérer l'original
     original = db.query(models.File).filter_by(id=file_id, owner_id=current_user.id).first()
     if not original:
         raise HTTPException(status_code=404, detail="Fragment original introuvable")
+    if target_folder_id and not db.query(models.Folder).filter_by(id=target_folder_id, owner_id=current_user.id).first():
+        raise HTTPException(status_code=404, detail="Secteur de destination introuvable")
 
-    # 2. Créer la copie (Métadonnées)
-    copy_metadata = models.File(
-        name=f"{original.name} (Copie)",
-        size=original.size,
-        mime_type=original.mime_type,
-        folder_id=target_folder_id,
-        owner_id=current_user.id,
-        node_id=original.node_id,
-        is_trashed=False
+    # 2. Créer la copie : mêmes chunks (+1 référence), aucune donnée lue ni écrite
+    copy_id, = FileManager(db).copy_files(
+        [original], current_user, {original.folder_id: target_folder_id}, name_suffix=" (Copie)"
     )
-
-    db.add(copy_metadata)
-    db.flush() # Pour obtenir l'ID de la copie avant le commit final
-
-    # 3. Copie physique du fichier sur le disque
-    original_path = os.path.join(UPLOAD_DIR, str(original.id))
-    copy_path = os.path.join(UPLOAD_DIR, str(copy_metadata.id))
-
-    if os.path.exists(original_path):
-        shutil.copy(original_path, copy_path)
-        # Mise à jour du quota utilisateur pour la nouvelle copie
-        current_user.used_storage += original.size
-    
-    db.commit()
-    db.refresh(copy_metadata)
-    return copy_metadata
+    return db.query(models.File).filter_by(id=copy_id).first()
 from sqlalchemy import or_
 
 @router.post("/{file_id}/share-with/{user_id}")
@@ -2,6 +2,10 @@ from typing import Any, List, Optional
 from fastapi import APIRouter, HTTPException, status
 from app.webapp.dependencies import SessionDep, CurrentUser
 from app.schemas import folder as folder_schema
+from app.schemas import file as file_schema
+from app.services.file_manager import FileManager
+from app.services.storage_policy import parse_storage_class
+from app.workers.celery_app import celery_app
 from app.database import models
 
 # On utilise "" pour éviter les conflits de redirection 405/404
@@ -96,6 +100,50 @@ def get_folder_details(
         )
     return folder
 
+@router.put("/{folder_id}/storage-class", response_model=folder_schema.FolderResponse)
+def set_folder_storage_class(
+    folder_id: str,
+    obj_in: file_schema.StorageClassUpdate,
+    db: SessionDep,
+    current_user: CurrentUser
+) -> Any:
+    """Classe de stockage du secteur, héritée par ses fragments et sous-dossiers sans classe propre."""
+    folder = db.query(models.Folder).filter_by(id=folder_id, owner_id=current_user.id).first()
+    if not folder:
+        raise HTTPException(status_code=404, detail="Secteur introuvable")
+    if obj_in.storage_class is not None:
+        try:
+            parse_storage_class(obj_in.storage_class)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    folder.storage_class = obj_in.storage_class
+    db.commit()
+    db.refresh(folder)
+    celery_app.send_task("app.workers.tasks_replication.apply_storage_class", kwargs={"folder_id": folder.id})
+    return folder
+
+@router.post("/{folder_id}/copy", response_model=folder_schema.FolderResponse, status_code=status.HTTP_201_CREATED)
+def copy_folder(
+    folder_id: str,
+    db: SessionDep,
+    current_user: CurrentUser,
+    target_parent_id: Optional[str] = None
+) -> Any:
+    """
+    Copie d'un secteur et de tout son contenu. Les fragments copiés partagent
+    les chunks des originaux : durée proportionnelle au nombre de fichiers,
+    pas à leur taille.
+    """
+    folder = db.query(models.Folder).filter_by(id=folder_id, owner_id=current_user.id).first()
+    if not folder:
+        raise HTTPException(status_code=404, detail="Secteur introuvable")
+    if target_parent_id and not db.query(models.Folder).filter_by(id=target_parent_id, owner_id=current_user.id).first():
+        raise HTTPException(status_code=404, detail="Secteur de destination introuvable")
+
+    copy_id = FileManager(db).copy_folder(folder, current_user, target_parent_id)
+    return db.query(models.Folder).filter_by(id=copy_id).first()
+
 @router.delete("/{folder_id}", status_code=204)
 def delete_folder(folder_id: str, db: SessionDep, current_user: CurrentUser):
     """Suppression d'un secteur (dossier) et déconnexion des fragments rattachés."""
@@ -1,9 +1,14 @@
+import hashlib
 from celery.schedules import crontab
 from datetime import datetime, timedelta
 from app.workers.celery_app import celery_app
 from app.database.db import SessionLocal
 from app.database import models
 from app.services.retention_policy import RetentionPolicy
+from app.orchestrator.gc_coordinator import GCCoordinator
+from app.orchestrator.drain_coordinator import DrainCoordinator
+from app.orchestrator.node_manager import NodeManager
+from app.services.cluster_store import ClusterChunkStore
 
 # Configuration du planning (Celery Beat)
 celery_app.conf.beat_schedule = {
@@ -11,6 +16,10 @@ celery_app.conf.beat_schedule = {
         "task": "app.workers.tasks_maintenance.empty_trash_bin",
         "schedule": crontab(hour=3, minute=0), # Tous les jours à 3h00 du matin
     },
+    "collect-garbage-every-night": {
+        "task": "app.workers.tasks_maintenance.collect_garbage",
+        "schedule": crontab(hour=3, minute=30), # Après le vidage de la corbeille
+    },
     "archive-logs-weekly": {
         "task": "app.workers.tasks_maintenance.archive_audit_logs",
         "schedule": crontab(day_of_week="sunday", hour=4, minute=0),
@@ -28,6 +37,50 @@ def empty_trash_bin():
     finally:
         db.close()
 
+@celery_app.task(queue="system")
+def collect_garbage(aggressive: bool = False):
+    """Mark & sweep des blocs qui ne sont plus référencés par aucun fichier, sur tous les nodes"""
+    db = SessionLocal()
+    try:
+        freed = NodeManager.run(GCCoordinator(db).run(aggressive=aggressive))
+        return f"GC freed {sum(freed.values())} bytes on {len(freed)} nodes."
+    finally:
+        db.close()
+
+@celery_app.task(bind=True, queue="system")
+def drain_node(self, node_id: str):
+    """Vide un node (maintenance + copie de tous ses blocs) avant sa décommission"""
+    db = SessionLocal()
+    try:
+        # Progression consultable via AsyncResult (état PROGRESS) pendant le drain
+        report = lambda progress: self.update_state(state="PROGRESS", meta=progress)
+        return NodeManager.run(DrainCoordinator(db).drain(node_id, on_progress=report))
+    finally:
+        db.close()
+
+async def _hash_manifest(db, manifest: list) -> str:
+    store = ClusterChunkStore(db, background=True)
+    store.locate([entry["hash"] for entry in manifest])
+    hasher = hashlib.sha256()
+    for entry in manifest:
+        async for data in store.stream(entry["hash"]):
+            hasher.update(data)
+    return hasher.hexdigest()
+
+@celery_app.task(queue="system")
+def compute_content_hash(file_id: str):
+    """SHA-256 d'un fichier reçu en parties désordonnées (upload reprenable), relu depuis le cluster"""
+    db = SessionLocal()
+    try:
+        file = db.query(models.File).get(file_id)
+        if file is None or file.content_hash or not file.chunk_manifest:
+            return
+        file.content_hash = NodeManager.run(_hash_manifest(db, file.chunk_manifest))
+        db.commit()
+        return file.content_hash
+    finally:
+        db.close()
+
 @celery_app.task(queue="system")
 def archive_audit_logs():
     """Déplace les vieux logs vers un stockage froid (Cold Storage)"""
@@ -1,52 +1,214 @@
 import grpc
+from typing import List, Optional
 from celery.utils.log import get_task_logger
 from app.workers.celery_app import celery_app
 from app.protos import node_pb2, node_pb2_grpc
 from app.database import models
 from app.database.db import SessionLocal
+from app.orchestrator.erasure_manager import ErasureManager
+from app.orchestrator.node_manager import NodeManager
+from app.services.chunk_store import CHUNK_DIR, LocalChunkStore
+from app.services.cluster_store import ClusterChunkStore
+from app.services.storage_policy import effective_storage_class, parse_storage_class
 
 logger = get_task_logger(__name__)
 
+# Hash par appel ReplicateTo : le node source garde un nombre borné de copies en vol
+REPLICATE_BATCH = 1000
+
+def _replicate(source_node_ip: str, target_node_ip: str, hashes: List[str]) -> dict:
+    """
+    Demande au node source de pousser les blocs vers la cible (ReplicateTo) :
+    les données vont directement de node à node, le worker ne relève que les
+    résultats bloc par bloc.
+    """
+    outcome = {"copied": 0, "skipped": 0, "bytes": 0, "failed": {}}
+    # Canal fermé à la fin de la tâche : un worker Celery vit longtemps et
+    # enchaîne des milliers de tâches, chacune ouvrirait sinon sa socket
+    with grpc.insecure_channel(source_node_ip) as channel:
+        source_stub = node_pb2_grpc.StorageNodeStub(channel)
+        for i in range(0, len(hashes), REPLICATE_BATCH):
+            request = node_pb2.ReplicateRequest(target=target_node_ip, hashes=hashes[i:i + REPLICATE_BATCH])
+            for result in source_stub.ReplicateTo(request):
+                if not result.success:
+                    outcome["failed"][result.hash] = result.error_message
+                elif result.skipped:
+                    outcome["skipped"] += 1
+                else:
+                    outcome["copied"] += 1
+                    outcome["bytes"] += result.bytes
+    return outcome
+
+@celery_app.task(bind=True, queue="system", max_retries=5)
+def replicate_blocks(self, hashes: List[str], source_node_ip: str, target_node_ip: str):
+    """
+    Copie un lot de blocs d'un Node A vers un Node B (reconstruction d'un node
+    perdu, re-réplication). Seuls les blocs en échec sont retentés.
+    """
+    logger.info(f"♻️ Replicating {len(hashes)} blocks from {source_node_ip} to {target_node_ip}")
+    try:
+        outcome = _replicate(source_node_ip, target_node_ip, hashes)
+    except Exception as e:
+        logger.error(f"Replication failed: {e}")
+        # Retry avec backoff exponentiel pour laisser le temps au réseau de revenir
+        raise self.retry(exc=e, countdown=2 ** self.request.retries)
+
+    logger.info(
+        f"✅ {outcome['copied']} blocks copied ({outcome['bytes']} bytes), "
+        f"{outcome['skipped']} already there, {len(outcome['failed'])} failed"
+    )
+    if outcome["failed"]:
+        failed = sorted(outcome["failed"])
+        logger.error(f"Replication failed for {failed[:10]}...: {outcome['failed'][failed[0]]}")
+        raise self.retry(
+            args=[failed, source_node_ip, target_node_ip],
+            exc=Exception(f"{len(failed)} blocks failed"),
+            countdown=2 ** self.request.retries,
+        )
+    return outcome
+
 @celery_app.task(bind=True, queue="system", max_retries=5)
 def replicate_block(self, file_id: str, source_node_ip: str, target_node_ip: str):
     """
-    Copie un bloc de données d'un Node A vers un Node B.
-    Utilise le stream gRPC pour transférer les données directement.
+    Copie les blocs d'un fichier d'un Node A vers un Node B.
+    Le transfert se fait de node à node (ReplicateTo), pas par le worker.
     """
     logger.info(f"♻️ Replicating {file_id} from {source_node_ip} to {target_node_ip}")
-    
+
+    # Récupération des blocs du fichier (via DB)
+    db = SessionLocal()
     try:
-        # 1. Connexion au Node Source (Téléchargement)
-        source_channel = grpc.insecure_channel(source_node_ip)
-        source_stub = node_pb2_grpc.StorageNodeStub(source_channel)
-        
-        # Récupération du hash du fichier (via DB)
-        db = SessionLocal()
         file = db.query(models.File).get(file_id)
-        content_hash = file.content_hash
+        if file is None:
+            return
+        hashes = [entry["hash"] for entry in file.chunk_manifest or []] or [file.content_hash]
+    finally:
         db.close()
 
-        # Stream de lecture
-        download_iterator = source_stub.DownloadBlock(node_pb2.DownloadRequest(hash=content_hash))
-
-        # 2. Connexion au Node Cible (Upload)
-        target_channel = grpc.insecure_channel(target_node_ip)
-        target_stub = node_pb2_grpc.StorageNodeStub(target_channel)
-        
-        # Fonction génératrice pour adapter le stream Download -> Upload
-        def stream_generator():
-            for chunk in download_iterator:
-                yield node_pb2.FileChunk(data=chunk.data)
-
-        # Envoi au node cible
-        response = target_stub.UploadBlock(stream_generator())
-        
-        if not response.success:
-            raise Exception(f"Target node rejected upload: {response.error_message}")
-            
+    try:
+        outcome = _replicate(source_node_ip, target_node_ip, hashes)
+        if outcome["failed"]:
+            raise Exception(f"{len(outcome['failed'])}/{len(hashes)} blocks failed: {next(iter(outcome['failed'].values()))}")
         logger.info(f"✅ Replication success: {file_id}")
+        return outcome
 
     except Exception as e:
         logger.error(f"Replication failed: {e}")
         # Retry avec backoff exponentiel pour laisser le temps au réseau de revenir
-        raise self.retry(exc=e, countdown=2 ** self.request.retries)
\ No newline at end of file
+        raise self.retry(exc=e, countdown=2 ** self.request.retries)
+
+@celery_app.task(bind=True, queue="system", max_retries=5)
+def repair_block(self, content_hash: str, source_node_ip: str, target_node_ip: str):
+    """
+    Réécrit sur le node cible un bloc que son scrubber a trouvé corrompu
+    (et mis en quarantaine), à partir d'une réplique saine.
+    """
+    logger.info(f"🩹 Repairing {content_hash} on {target_node_ip} from {source_node_ip}")
+    try:
+        outcome = _replicate(source_node_ip, target_node_ip, [content_hash])
+        if outcome["failed"]:
+            raise Exception(outcome["failed"][content_hash])
+        logger.info(f"✅ Block repaired: {content_hash} on {target_node_ip}")
+    except Exception as e:
+        logger.error(f"Repair failed: {e}")
+        raise self.retry(exc=e, countdown=2 ** self.request.retries)
+
+def _subtree_files(db, folder_id: str) -> List[models.File]:
+    """Fichiers du dossier et de tous ses sous-dossiers"""
+    files, pending, seen = [], [folder_id], set()
+    while pending:
+        current = pending.pop()
+        if current in seen:
+            continue
+        seen.add(current)
+        files.extend(db.query(models.File).filter_by(folder_id=current).all())
+        pending.extend(fid for (fid,) in db.query(models.Folder.id).filter_by(parent_id=current).all())
+    return files
+
+async def _encode_blocks(db, targets: dict) -> int:
+    """Passe chaque bloc dans sa classe cible, depuis ses répliques (ou ses shards actuels)"""
+    store = ClusterChunkStore(db, fallback=LocalChunkStore(CHUNK_DIR), background=True)
+    store.locate(list(targets))
+    manager = ErasureManager(db, background=True)
+    converted = 0
+    for content_hash, storage_class in targets.items():
+        data = b"".join([part async for part in store.stream(content_hash)])
+        await manager.store_block(content_hash, data, storage_class)
+        # Les copies complètes ne sont plus lues : le GC les retirera des nodes
+        db.query(models.BlockReplica).filter_by(block_hash=content_hash).delete(synchronize_session=False)
+        db.commit()
+        converted += 1
+    return converted
+
+@celery_app.task(bind=True, queue="system", max_retries=3)
+def apply_storage_class(self, file_id: Optional[str] = None, folder_id: Optional[str] = None):
+    """
+    Applique la classe de stockage effective d'un fichier (ou de tout un dossier)
+    à ses blocs : encode en "ec:K+M" ceux qui n'y sont pas encore.
+    Un bloc dédupliqué entre plusieurs fichiers prend la dernière classe demandée.
+    Le retour de l'erasure coding vers la réplication n'est pas géré ici : les
+    blocs restent décodables, ils ne sont simplement pas ré-étalés.
+    """
+    db = SessionLocal()
+    try:
+        if file_id:
+            files = db.query(models.File).filter_by(id=file_id).all()
+        else:
+            files = _subtree_files(db, folder_id)
+
+        targets = {}
+        for file in files:
+            storage_class = effective_storage_class(db, file)
+            if parse_storage_class(storage_class) is None:
+                continue
+            for entry in file.chunk_manifest or []:
+                targets[entry["hash"]] = storage_class
+
+        current = {}
+        hashes = list(targets)
+        for i in range(0, len(hashes), 1000):
+            rows = db.query(models.Block.hash, models.Block.storage_class).filter(
+                models.Block.hash.in_(hashes[i:i + 1000])
+            ).all()
+            current.update(dict(rows))
+        targets = {h: c for h, c in targets.items() if h in current and current[h] != c}
+        if not targets:
+            return "Nothing to convert."
+
+        converted = NodeManager.run(_encode_blocks(db, targets))
+        logger.info(f"🧩 {converted} blocks converted to erasure coding")
+        return f"Converted {converted} blocks."
+    except Exception as e:
+        logger.error(f"Storage class conversion failed: {e}")
+        raise self.retry(exc=e, countdown=2 ** self.request.retries)
+    finally:
+        db.close()
+
+@celery_app.task(bind=True, queue="system", max_retries=5)
+def repair_erasure_block(self, content_hash: str, lost: List[int]):
+    """
+    Recalcule les shards d'un bloc erasure-codé que le scrubber de leur node a
+    trouvés corrompus (pas de réplique à recopier : reconstruction Reed-Solomon).
+    """
+    logger.info(f"🩹 Rebuilding shards {lost} of {content_hash}")
+    db = SessionLocal()
+    try:
+        rebuilt = NodeManager.run(ErasureManager(db, background=True).repair_block(content_hash, lost))
+        if rebuilt < len(lost):
+            raise Exception(f"{rebuilt}/{len(lost)} shards rebuilt")
+        return f"Rebuilt {rebuilt} shards of {content_hash}."
+    except Exception as e:
+        logger.error(f"Shard repair failed: {e}")
+        raise self.retry(exc=e, countdown=2 ** self.request.retries)
+    finally:
+        db.close()
+
+@celery_app.task(queue="system")
+def repair_erasure_shards(node_id: str):
+    """Reconstruit ailleurs les shards erasure-codés d'un node déclaré mort"""
+    db = SessionLocal()
+    try:
+        repaired = NodeManager.run(ErasureManager(db, background=True).repair_node(node_id))
+        return f"Rebuilt {repaired} shards from {node_id}."
+    finally:
+        db.close()
@@ -0,0 +1,83 @@
+"""
+Benchmark des backends de stockage de blocs (files vs pack).
+
+Usage (depuis backend/) :
+    python -m benchmarks.bench_block_store --concurrency 16 --total-mb 64
+
+Écrit puis relit des blocs aléatoires de 4KB à 4MB sur chaque backend,
+dans un STORAGE_ROOT temporaire, et affiche ops/s et MB/s.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+SIZES = [4 * 1024, 64 * 1024, 1024 * 1024, 4 * 1024 * 1024]
+
+def _human(size: int) -> str:
+    return f"{size // 1024}KB" if size < 1024 * 1024 else f"{size // (1024 * 1024)}MB"
+
+async def _run_backend(backend: str, root: str, size: int, count: int, concurrency: int) -> dict:
+    from app.node_code.dedup import DedupEngine
+    from app.node_code.block_store import FileBlockStore
+    from app.node_code.block_index import BlockIndex
+    from app.node_code.packfile import PackBlockStore
+
+    temp_dir = os.path.join(root, "tmp")
+    os.makedirs(temp_dir, exist_ok=True)
+    if backend == "pack":
+        store = PackBlockStore(os.path.join(root, "packs"), temp_dir)
+    else:
+        store = FileBlockStore(os.path.join(root, "blocks"), temp_dir, index=BlockIndex(os.path.join(root, "index")))
+    engine = DedupEngine(store=store)
+
+    payloads = [os.urandom(size) for _ in range(count)]
+    semaphore = asyncio.Semaphore(concurrency)
+    hashes = []
+
+    async def write(data):
+        async with semaphore:
+            content_hash, _, _ = await engine.write_block(data)
+            hashes.append(content_hash)
+
+    async def read(content_hash):
+        async with semaphore:
+            await engine.read_block(content_hash)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(write(p) for p in payloads))
+    write_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await asyncio.gather(*(read(h) for h in hashes))
+    read_time = time.perf_counter() - start
+
+    mb = size * count / (1024 * 1024)
+    return {
+        "write_ops": count / write_time, "write_mbs": mb / write_time,
+        "read_ops": count / read_time, "read_mbs": mb / read_time,
+    }
+
+async def main(concurrency: int, total_mb: int):
+    print(f"{'backend':<8} {'block':>6} {'count':>6} {'write ops/s':>12} {'write MB/s':>11} {'read ops/s':>11} {'read MB/s':>10}")
+    for size in SIZES:
+        count = max(16, total_mb * 1024 * 1024 // size)
+        for backend in ("files", "pack"):
+            root = tempfile.mkdtemp(prefix=f"bench_{backend}_")
+            try:
+                r = await _run_backend(backend, root, size, count, concurrency)
+            finally:
+                shutil.rmtree(root, ignore_errors=True)
+            print(f"{backend:<8} {_human(size):>6} {count:>6} {r['write_ops']:>12.0f} {r['write_mbs']:>11.1f} "
+                  f"{r['read_ops']:>11.0f} {r['read_mbs']:>10.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--total-mb", type=int, default=64, help="Volume écrit par taille de bloc")
+    args = parser.parse_args()
+    # Le module dedup crée ses dossiers à l'import : on le redirige vers un dossier jetable
+    os.environ.setdefault("STORAGE_ROOT", tempfile.mkdtemp(prefix="bench_root_"))
+    asyncio.run(main(args.concurrency, args.total_mb))
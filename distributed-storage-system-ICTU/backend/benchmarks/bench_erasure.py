@@ -0,0 +1,47 @@
+"""
+Benchmark du codec Reed-Solomon (classe de stockage "ec:K+M").
+
+Usage (depuis backend/) :
+    python -m benchmarks.bench_erasure --block-mb 4 --rounds 5
+
+Pour chaque schéma : débit d'encodage, puis de décodage avec 0 à M shards
+perdus (les shards de données d'abord, le pire cas), et de réparation d'un
+seul shard. Débits rapportés à la taille du bloc d'origine.
+"""
+import argparse
+import os
+import time
+
+from app.services.erasure_coding import ReedSolomon
+
+SCHEMES = [(4, 2), (6, 3), (10, 4)]
+
+def _rate(fn, size: int, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return size * rounds / (time.perf_counter() - start) / 1024 ** 2
+
+def main(size: int, rounds: int):
+    data = os.urandom(size)
+    print(f"{'scheme':>7} {'overhead':>9} {'encode MB/s':>12} {'lost':>5} {'decode MB/s':>12} {'repair 1 MB/s':>14}")
+    for k, m in SCHEMES:
+        codec = ReedSolomon(k, m)
+        shards = codec.encode(data)
+        assert codec.decode(dict(enumerate(shards)), size) == data
+
+        encode = _rate(lambda: codec.encode(data), size, rounds)
+        for lost in range(m + 1):
+            available = {i: shard for i, shard in enumerate(shards) if i >= lost}
+            assert codec.decode(available, size) == data
+            decode = _rate(lambda: codec.decode(available, size), size, rounds)
+            survivors = {i: shard for i, shard in enumerate(shards) if i != 0}
+            repair = _rate(lambda: codec.reconstruct(survivors, [0]), size, rounds)
+            print(f"{f'{k}+{m}':>7} {(k + m) / k:>8.2f}x {encode:>12.0f} {lost:>5} {decode:>12.0f} {repair:>14.0f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--block-mb", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=5, help="Mesures par opération")
+    args = parser.parse_args()
+    main(args.block_mb * 1024 * 1024, args.rounds)
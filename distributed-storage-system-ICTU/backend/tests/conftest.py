@@ -0,0 +1,12 @@
+import os
+
+# Settings obligatoires (app.core.config) : les tests n'ouvrent aucune connexion PostgreSQL
+for name, value in {
+    "POSTGRES_SERVER": "localhost",
+    "POSTGRES_USER": "test",
+    "POSTGRES_PASSWORD": "test",
+    "POSTGRES_DB": "test",
+    "FIRST_SUPERUSER": "admin@example.com",
+    "FIRST_SUPERUSER_PASSWORD": "test",
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+from app.services.chunking_service import FastCDC, chunk_bytes
+
+SIZES = {"min_size": 4 * 1024, "avg_size": 16 * 1024, "max_size": 64 * 1024}
+
+@pytest.mark.parametrize("read_size", [1, 1000, 64 * 1024, 300 * 1024])
+def test_streamed_chunking_matches_one_shot(read_size):
+    """Les frontières ne dépendent pas de la taille des lectures du flux"""
+    data = os.urandom(1024 * 1024 + 12345)
+    expected = chunk_bytes(data, **SIZES)
+
+    # 1 octet par feed() : seulement sur le début, le reste en gros morceaux
+    head = 20_000 if read_size == 1 else len(data)
+    chunker = FastCDC(**SIZES)
+    chunks = []
+    for i in range(0, head, read_size):
+        chunks.extend(chunker.feed(data[i:min(i + read_size, head)]))
+    if head < len(data):
+        chunks.extend(chunker.feed(data[head:]))
+    chunks.extend(chunker.finish())
+
+    assert chunks == expected
+    assert b"".join(chunks) == data
+    assert all(len(chunk) <= SIZES["max_size"] for chunk in chunks)
+    assert all(len(chunk) >= SIZES["min_size"] for chunk in chunks[:-1])
+
+def test_insert_only_shifts_neighbouring_chunks():
+    data = os.urandom(512 * 1024)
+    before = chunk_bytes(data, **SIZES)
+    after = chunk_bytes(data[:100_000] + b"inserted" + data[100_000:], **SIZES)
+    assert len(set(before) & set(after)) >= len(before) - 3
@@ -0,0 +1,44 @@
+import pytest
+
+from app.node_code import compression
+from app.node_code.compression import CODEC_LZMA, CODEC_ZLIB, compress_segment, decompress_segment
+
+DATA = b"compressible text " * 2000
+
+@pytest.fixture
+def level(monkeypatch):
+    """Rebâtit les codecs avec NODE_COMPRESSION_LEVEL (et ses variantes par codec) donnés"""
+    for name in ("ZLIB", "LZMA", "ZSTD", "LZ4"):
+        monkeypatch.delenv(f"NODE_COMPRESSION_LEVEL_{name}", raising=False)
+
+    def build(value=None, **per_codec):
+        monkeypatch.setattr(compression, "COMPRESSION_LEVEL", value)
+        for name, codec_level in per_codec.items():
+            monkeypatch.setenv(f"NODE_COMPRESSION_LEVEL_{name.upper()}", str(codec_level))
+        codecs = compression._build_codecs()
+        monkeypatch.setattr(compression, "CODECS", codecs)
+        return codecs
+    return build
+
+def test_defaults(level):
+    level()
+    assert compression._level("zlib", 6, 0, 9) == 6
+
+@pytest.mark.parametrize("value, expected", [("19", 9), ("-3", 0), ("4", 4)])
+def test_global_level_is_clamped_per_codec(level, value, expected):
+    level(value)
+    assert compression._level("zlib", 6, 0, 9) == expected
+    assert compression._level("zstd", 3, 1, 22) == max(1, min(int(value), 22))
+
+def test_per_codec_level_overrides_global(level):
+    level("19", zlib=2)
+    assert compression._level("zlib", 6, 0, 9) == 2
+    assert compression._level("lzma", 1, 0, 9) == 9
+
+@pytest.mark.parametrize("codec_id", [CODEC_ZLIB, CODEC_LZMA])
+def test_zstd_level_does_not_break_other_codecs(level, codec_id):
+    """NODE_COMPRESSION_LEVEL=19 (réglage zstd) ne fait plus échouer zlib ni lzma"""
+    level("19")
+    payload = compress_segment(codec_id, DATA)
+    assert len(payload) < len(DATA)
+    assert decompress_segment(codec_id, payload) == DATA
@@ -0,0 +1,57 @@
+import os
+from itertools import combinations
+
+import pytest
+
+from app.services.erasure_coding import ReedSolomon, gf_invert_matrix, gf_mul
+
+@pytest.mark.parametrize("k, m", [(1, 1), (2, 1), (4, 2), (6, 3)])
+def test_decode_from_any_k_shards(k, m):
+    """Toute combinaison de k shards parmi k+m redonne le contenu"""
+    rs = ReedSolomon(k, m)
+    data = os.urandom(1000 * k + 7)   # Dernier shard complété par des zéros
+    shards = rs.encode(data)
+    assert len(shards) == k + m
+    assert len({len(shard) for shard in shards}) == 1
+    assert b"".join(shards[:k])[:len(data)] == data   # Code systématique
+
+    for chosen in combinations(range(k + m), k):
+        available = {i: shards[i] for i in chosen}
+        assert rs.decode(available, len(data)) == data
+
+@pytest.mark.parametrize("k, m", [(4, 2), (6, 3)])
+def test_reconstruct_lost_shards(k, m):
+    rs = ReedSolomon(k, m)
+    shards = rs.encode(os.urandom(50_000))
+    for lost in combinations(range(k + m), m):
+        available = {i: shard for i, shard in enumerate(shards) if i not in lost}
+        assert rs.reconstruct(available, lost) == {i: shards[i] for i in lost}
+
+def test_fewer_than_k_shards_fails():
+    rs = ReedSolomon(4, 2)
+    shards = rs.encode(b"payload" * 100)
+    with pytest.raises(ValueError):
+        rs.decode({i: shards[i] for i in (0, 3, 5)}, 700)
+
+@pytest.mark.parametrize("size", [0, 1, 3])
+def test_tiny_blocks(size):
+    rs = ReedSolomon(4, 2)
+    data = os.urandom(size)
+    shards = rs.encode(data)
+    assert rs.decode({i: shards[i] for i in (1, 2, 4, 5)}, size) == data
+
+def test_gf_matrix_inverse():
+    matrix = [[1, 2, 3], [4, 5, 6], [7, 8, 10]]
+    inverse = gf_invert_matrix(matrix)
+    for i in range(3):
+        for j in range(3):
+            value = 0
+            for n in range(3):
+                value ^= gf_mul(matrix[i][n], inverse[n][j])
+            assert value == (1 if i == j else 0)
+
+def test_invalid_parameters():
+    with pytest.raises(ValueError):
+        ReedSolomon(0, 2)
+    with pytest.raises(ValueError):
+        ReedSolomon(200, 100)
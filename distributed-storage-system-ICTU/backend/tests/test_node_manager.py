@@ -0,0 +1,32 @@
+from concurrent import futures
+
+import grpc
+
+from app.orchestrator.node_manager import NodeManager
+
+def _echo_server():
+    """Serveur gRPC synchrone (hors boucle asyncio) qui renvoie la requête"""
+    handler = grpc.method_handlers_generic_handler(
+        "test.Echo", {"Ping": grpc.unary_unary_rpc_method_handler(lambda request, context: request)}
+    )
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=2))
+    server.add_generic_rpc_handlers((handler,))
+    port = server.add_insecure_port("127.0.0.1:0")
+    server.start()
+    return server, f"node_127.0.0.1_{port}"
+
+def test_channels_across_successive_event_loops():
+    """Deux tâches Celery à la suite dans le même worker : chacune a son asyncio.run"""
+    server, node_id = _echo_server()
+
+    async def ping():
+        channel = NodeManager(db=None)._get_channel(node_id)
+        return await channel.unary_unary("/test.Echo/Ping")(b"ping", timeout=5)
+
+    try:
+        assert NodeManager.run(ping()) == b"ping"
+        assert NodeManager.run(ping()) == b"ping"
+        # Canaux fermés avec leur boucle : rien ne reste attaché à une boucle morte
+        assert not NodeManager._channels
+    finally:
+        server.stop(None)
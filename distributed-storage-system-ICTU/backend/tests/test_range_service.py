@@ -0,0 +1,52 @@
+import pytest
+from starlette.requests import Request
+
+from app.services.range_service import MAX_RANGES, RangeNotSatisfiable, RangeService, parse_range_header
+
+def _request(range_header: str) -> Request:
+    return Request({"type": "http", "headers": [(b"range", range_header.encode())]})
+
+async def _reader(offset: int, length: int):
+    yield b"x" * length
+
+@pytest.mark.parametrize("header, size, expected", [
+    ("bytes=0-99", 1000, [(0, 99)]),
+    ("bytes=-100", 1000, [(900, 999)]),        # Suffixe : les 100 derniers octets
+    ("bytes=-5000", 1000, [(0, 999)]),         # Suffixe plus long que la ressource
+    ("bytes=900-", 1000, [(900, 999)]),
+    ("bytes=900-5000", 1000, [(900, 999)]),    # Fin au-delà de l'EOF : tronquée
+    ("bytes=0-0,-1", 1000, [(0, 0), (999, 999)]),
+    ("bytes=5000-6000,0-9", 1000, [(0, 9)]),   # Range hors ressource ignoré
+])
+def test_satisfiable_ranges(header, size, expected):
+    assert parse_range_header(header, size) == expected
+
+@pytest.mark.parametrize("header", [None, "", "items=0-1", "bytes=", "bytes=5-1", "bytes=a-b", "bytes=-"])
+def test_invalid_header_serves_whole_content(header):
+    assert parse_range_header(header, 1000) is None
+
+@pytest.mark.parametrize("header, size", [
+    ("bytes=1000-", 1000),    # Début à l'EOF
+    ("bytes=2000-3000", 1000),
+    ("bytes=-0", 1000),
+    ("bytes=0-", 0),
+    ("bytes=-1", 0),          # Suffixe sur une ressource vide
+])
+def test_unsatisfiable_ranges(header, size):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range_header(header, size)
+
+def test_many_overlapping_ranges_are_coalesced():
+    header = "bytes=" + ",".join(f"{i}-{i + 10}" for i in range(MAX_RANGES + 5))
+    assert parse_range_header(header, 1000) == [(0, MAX_RANGES + 14)]
+
+def test_suffix_range_on_empty_file_is_416():
+    response = RangeService().build_response(_request("bytes=-10"), _reader, 0, "empty.bin", None)
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */0"
+
+def test_suffix_range_response():
+    response = RangeService().build_response(_request("bytes=-10"), _reader, 100, "a.bin", None)
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 90-99/100"
+    assert response.headers["content-length"] == "10"
@@ -0,0 +1,159 @@
+import os
+import struct
+
+import pytest
+
+from app.node_code.compression import CODEC_ZLIB
+from app.node_code.storage_encryption import (
+    BLOCK_MAGIC, FORMAT_BLOB_KEY, FORMAT_SEGMENTED, FRAME_PREFIX, SegmentedEncryptor,
+    StorageEncryption, _HEADERS, parse_header,
+)
+
+SEGMENT = 1024
+
+@pytest.fixture(scope="module")
+def cipher():
+    return StorageEncryption()
+
+def _v1(cipher, data: bytes) -> bytes:
+    """Format v1 tel qu'écrit avant les segments : nonce + ciphertext + tag"""
+    nonce = os.urandom(12)
+    return nonce + cipher.aesgcm.encrypt(nonce, data, None)
+
+def _v2(cipher, data: bytes, segment_size: int = SEGMENT) -> bytes:
+    """Format v2 tel qu'écrit avant la clé par blob : préfixe de nonce aléatoire sous la clé du node"""
+    prefix = os.urandom(7)
+    header = _HEADERS[FORMAT_SEGMENTED].pack(BLOCK_MAGIC, FORMAT_SEGMENTED, 0, segment_size, prefix)
+    pieces = [data[i:i + segment_size] for i in range(0, len(data), segment_size)]
+    if not pieces or len(pieces[-1]) == segment_size:
+        pieces.append(b"")
+    out = [header]
+    for index, piece in enumerate(pieces):
+        last = 1 if index == len(pieces) - 1 else 0
+        nonce = prefix + struct.pack(">IB", index, last)
+        out.append(cipher.aesgcm.encrypt(nonce, piece, header + struct.pack(">QB", index, last)))
+    return b"".join(out)
+
+def _v3(cipher, data: bytes, codec: int = 0, read_size: int = 700) -> bytes:
+    salt = os.urandom(16)
+    encryptor = SegmentedEncryptor(cipher._blob_cipher(salt), salt, codec, SEGMENT)
+    out = [encryptor.header()]
+    for i in range(0, len(data), read_size):
+        out.append(encryptor.update(data[i:i + read_size]))
+    out.append(encryptor.finalize())
+    return b"".join(out)
+
+def _split(blob: bytes):
+    """(header, segments) d'un blob segmenté, préfixes de taille retirés s'il est compressé"""
+    header = parse_header(blob)
+    if not header.framed:
+        count = header.segment_count(len(blob))
+        return header, [blob[header.segment_offset(i):header.segment_offset(i + 1)] for i in range(count)]
+    segments, pos = [], header.size
+    while pos < len(blob):
+        (size,) = FRAME_PREFIX.unpack_from(blob, pos)
+        segments.append(blob[pos + FRAME_PREFIX.size:pos + FRAME_PREFIX.size + size])
+        pos += FRAME_PREFIX.size + size
+    return header, segments
+
+def _join(header, segments) -> bytes:
+    if not header.framed:
+        return header.raw + b"".join(segments)
+    return header.raw + b"".join(FRAME_PREFIX.pack(len(s)) + s for s in segments)
+
+@pytest.mark.parametrize("size", [0, 1, SEGMENT - 1, SEGMENT, SEGMENT + 1, 5 * SEGMENT + 17])
+def test_v3_round_trip(cipher, size):
+    data = os.urandom(size)
+    blob = _v3(cipher, data)
+    header = parse_header(blob)
+    assert header.version == FORMAT_BLOB_KEY and header.size == _HEADERS[FORMAT_BLOB_KEY].size
+    assert header.plaintext_size(len(blob)) == size
+    assert cipher.decrypt_block(blob) == data
+
+def test_encrypt_block_uses_a_key_per_blob(cipher):
+    data = b"same content" * 100
+    first, second = cipher.encrypt_block(data), cipher.encrypt_block(data)
+    assert parse_header(first).nonce_prefix != parse_header(second).nonce_prefix
+    assert first[len(parse_header(first).raw):] != second[len(parse_header(second).raw):]
+    assert cipher.decrypt_block(first) == cipher.decrypt_block(second) == data
+
+def test_segment_read_alone(cipher):
+    """Un range ne déchiffre que les segments qui le couvrent"""
+    data = os.urandom(3 * SEGMENT + 5)
+    header, segments = _split(_v3(cipher, data))
+    assert cipher.decrypt_segment(header, 1, segments[1], last=False) == data[SEGMENT:2 * SEGMENT]
+    assert cipher.decrypt_segment(header, 3, segments[3], last=True) == data[3 * SEGMENT:]
+
+@pytest.mark.parametrize("size", [0, 10, 3 * SEGMENT + 5])
+def test_v2_blob_still_readable(cipher, size):
+    data = os.urandom(size)
+    blob = _v2(cipher, data)
+    assert parse_header(blob).size == _HEADERS[FORMAT_SEGMENTED].size
+    assert cipher.decrypt_block(blob) == data
+
+def test_v1_blob_still_readable(cipher):
+    data = os.urandom(5000)
+    assert parse_header(_v1(cipher, data)) is None
+    assert cipher.decrypt_block(_v1(cipher, data)) == data
+
+def test_v1_blob_with_magic_like_nonce(cipher):
+    """Nonce v1 commençant par le magic : repli sur le déchiffrement legacy"""
+    nonce = BLOCK_MAGIC + bytes([FORMAT_BLOB_KEY]) + os.urandom(7)
+    blob = nonce + cipher.aesgcm.encrypt(nonce, b"legacy" * 10, None)
+    assert cipher.decrypt_block(blob) == b"legacy" * 10
+
+@pytest.mark.parametrize("write", [_v2, _v3])
+def test_truncated_blob_fails(cipher, write):
+    data = os.urandom(3 * SEGMENT + 5)
+    header, segments = _split(write(cipher, data))
+    with pytest.raises(ValueError):
+        cipher.decrypt_block(_join(header, segments[:-1]))   # Segment final supprimé
+    with pytest.raises(ValueError):
+        cipher.decrypt_block(_join(header, segments)[:-1])   # Dernier octet coupé
+
+@pytest.mark.parametrize("write", [_v2, _v3])
+def test_reordered_segments_fail(cipher, write):
+    data = os.urandom(3 * SEGMENT + 5)
+    header, segments = _split(write(cipher, data))
+    segments[0], segments[1] = segments[1], segments[0]
+    with pytest.raises(ValueError):
+        cipher.decrypt_block(_join(header, segments))
+
+def test_segment_from_another_blob_fails(cipher):
+    data = os.urandom(2 * SEGMENT + 5)
+    header, segments = _split(_v3(cipher, data))
+    _, others = _split(_v3(cipher, data))
+    with pytest.raises(ValueError):
+        cipher.decrypt_block(_join(header, [others[0]] + segments[1:]))
+
+def test_tampered_header_fails(cipher):
+    blob = bytearray(_v3(cipher, os.urandom(2 * SEGMENT)))
+    blob[5] ^= 1   # Codec
+    with pytest.raises(ValueError):
+        cipher.decrypt_block(bytes(blob))
+
+def test_framed_compressed_round_trip(cipher):
+    data = b"compressible text " * 1000
+    blob = _v3(cipher, data, codec=CODEC_ZLIB)
+    header, segments = _split(blob)
+    assert header.framed and len(segments) == -(-len(data) // SEGMENT)
+    assert len(blob) < len(data)
+    assert cipher.decrypt_block(blob) == data
+    assert cipher.decrypt_segment(header, 2, segments[2], last=False) == data[2 * SEGMENT:3 * SEGMENT]
+
+def test_framed_incompressible_segments_stored_raw(cipher):
+    data = os.urandom(2 * SEGMENT + 3)
+    assert cipher.decrypt_block(_v3(cipher, data, codec=CODEC_ZLIB)) == data
+
+def test_framed_truncated_or_reordered_fails(cipher):
+    data = b"compressible text " * 1000
+    header, segments = _split(_v3(cipher, data, codec=CODEC_ZLIB))
+    with pytest.raises(ValueError):
+        cipher.decrypt_block(_join(header, segments[:-1]))
+    with pytest.raises(ValueError):
+        cipher.decrypt_block(header.raw)
+    with pytest.raises(ValueError):
+        cipher.decrypt_block(_join(header, segments)[:header.size + 2])   # Préfixe coupé
+    segments[0], segments[1] = segments[1], segments[0]
+    with pytest.raises(ValueError):
+        cipher.decrypt_block(_join(header, segments))